@@ -1,42 +1,32 @@
 import os
 import sys
 import shutil
+import zipfile
+import argparse
+import multiprocessing
 import pandas as pd
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
 
 from src.main.data_analysis import DataAnalysis
 from src.utils.city_mention import CityMentionAnalyzer
+from src.utils.code_table import CodeTable
+from src.utils.tse_ingest import (
+    MUNICIPALITY_FILE_KEYWORDS,
+    SECTION_FILE_KEYWORDS,
+    TSEAggregator,
+    get_year_uf_from_filename,
+    is_raw_file,
+    read_candidates,
+    read_member,
+    uf_members,
+    validate_file,
+)
 
-
-def validate_file(file_path: str, keywords: List[str]) -> bool:
-    """
-    Validate if file at given path contains the required keywords in its name.
-
-    Args:
-        file_path (str): The path to the file.
-        keywords (List[str]): The list of keywords to be found in the file name.
-
-    Returns:
-        bool: True if all keywords are found in the file name, False otherwise.
-    """
-    file_name = os.path.basename(file_path)
-    return all(keyword in file_name for keyword in keywords)
-
-
-def get_year_uf_from_filename(file_path: str) -> (str, str):
-    """
-    Extract the year and federal unit from the file name.
-
-    Args:
-        file_path (str): The path to the file.
-
-    Returns:
-        tuple: The extracted year and federal unit.
-    """
-    file_name = os.path.basename(file_path)
-    year, uf = file_name.split("_")[-2:]
-    uf = uf.split(".")[0]  # remove file extension
-    return year, uf
+SECTION_FILE_MESSAGE = (
+    "Section-level files (votacao_secao) do not have the candidates' party and totalization status; "
+    "please pass the candidate list with --candidates, e.g. TSE's consulta_cand file."
+)
 
 
 def move_file_to_new_directory(file_path: str, year: str, uf: str) -> str:
@@ -66,29 +56,222 @@ def move_file_to_new_directory(file_path: str, year: str, uf: str) -> str:
     return new_file_path
 
 
+# Lock shared by the worker processes of `analyze_archive`, held while a worker assigns ids in the code table
+_code_table_lock = None
+
+
+def _init_worker(lock) -> None:
+    global _code_table_lock
+    _code_table_lock = lock
+
+
+def analyze_member(
+    zip_path: str,
+    member: str,
+    visualize: bool,
+    regions: Optional[str],
+    database: Optional[str],
+    candidates: Optional[pd.DataFrame] = None,
+) -> List[str]:
+    """
+    Read one UF's member of an archive and run its TSE analysis, in a worker process.
+
+    The data stays in the worker that read it. Its ids are assigned while holding the lock shared by the
+    workers: the code table is reloaded from disk, extended and saved, so that concurrent UFs never overwrite
+    each other's ids. The analysis then uses an in-memory copy of the table.
+
+    Args:
+        zip_path (str): Path of the archive.
+        member (str): The UF's member, e.g. 'votacao_candidato_munzona_2022_SP.csv'.
+        visualize (bool): Whether to draw the treemaps, reports and maps.
+        regions (str, optional): Region hierarchy used to decompose the Theil index.
+        database (str, optional): SQLite results database.
+        candidates (pd.DataFrame, optional): Candidate list, required by section-level members.
+
+    Returns:
+        List[str]: The names of the UF's municipalities, used to find city mentions in tweets.
+    """
+    year, uf = get_year_uf_from_filename(member)
+    data = read_member(zip_path, member, candidates=candidates)
+    # Candidates, municipalities and parties get the same ids in every UF and source of an election
+    with _code_table_lock:
+        code_table = CodeTable(f"./data/{year}/codes")
+        code_table.encode(data)
+    tse = DataAnalysis(
+        data,
+        code_table=code_table.copy(),
+        visualize=visualize,
+        regions=regions,
+        database=database,
+        output_dir=f"./output/{year}/{uf}/tse",
+        year=year,
+    )
+    tse.run_analysis()
+    return tse.city_names
+
+
+def analyze_archive(
+    zip_path: str,
+    ufs: Optional[List[str]],
+    visualize: bool,
+    regions: Optional[str],
+    database: Optional[str],
+    workers: Optional[int],
+    candidates: Optional[pd.DataFrame] = None,
+) -> None:
+    """
+    Analyze the UFs of a TSE zip archive concurrently, reading the members in place.
+
+    Each UF is read (and, for raw zone- and section-level files, aggregated), encoded and analyzed by a single
+    task of a process pool, so its data never leaves the worker (see `analyze_member`). A UF that fails is
+    reported and does not stop the others. The outputs of each UF are written to ./output/<year>/<uf>/<source>.
+    The Twitter analysis is run afterwards for the UFs whose city mentions are in ./data/<year>/<uf>/.
+
+    Args:
+        zip_path (str): Path of the archive.
+        ufs (List[str], optional): UFs to analyze. Defaults to every UF of the archive.
+        visualize (bool): Whether to draw the treemaps, reports and maps.
+        regions (str, optional): Region hierarchy used to decompose the Theil index.
+        database (str, optional): SQLite results database.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        candidates (pd.DataFrame, optional): Candidate list, required by section-level members.
+    """
+    members = uf_members(zip_path, ufs)
+    if not members:
+        print(f"No results file{' for ' + ', '.join(ufs) if ufs else ''} in '{zip_path}'.")
+        sys.exit(1)
+    if candidates is None and any(validate_file(member, SECTION_FILE_KEYWORDS) for member in members.values()):
+        print(SECTION_FILE_MESSAGE)
+        sys.exit(1)
+    print(f"Analyzing {len(members)} UFs of {zip_path}: {', '.join(sorted(members))}")
+
+    city_names: Dict[tuple, List[str]] = {}
+    failures: Dict[str, str] = {}
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(multiprocessing.Lock(),)
+    ) as executor:
+        analyses = {
+            executor.submit(analyze_member, zip_path, member, visualize, regions, database, candidates): member
+            for member in members.values()
+        }
+        for future in as_completed(analyses):
+            member = analyses[future]
+            try:
+                city_names[get_year_uf_from_filename(member)] = future.result()
+            except Exception as e:
+                failures[member] = str(e)
+                print(f"The analysis of '{member}' failed: {str(e)}")
+
+    if failures:
+        print(f"{len(failures)} of {len(members)} UFs failed: {', '.join(sorted(failures))}")
+
+    # Mentions are matched on names, so new ids may be assigned: the Twitter analyses run one at a time
+    for (year, uf), names in sorted(city_names.items()):
+        city_mention_path = f"./data/{year}/{uf}/city_mentions_twitter_data.csv"
+        if not os.path.isfile(city_mention_path):
+            print(f"No Twitter data for {year} {uf} (expected in {city_mention_path}); skipping.")
+            continue
+        tweets_path = f"./data/{year}/{uf}/tweets.csv"
+        if os.path.isfile(tweets_path):
+            CityMentionAnalyzer(tweets_path, names).identify_city_mentions()
+        DataAnalysis(
+            city_mention_path,
+            data_source="twitter",
+            code_table=CodeTable(f"./data/{year}/codes"),
+            visualize=visualize,
+            regions=regions,
+            database=database,
+            output_dir=f"./output/{year}/{uf}/twitter",
+            year=year,
+        ).run_analysis()
+
+
 def main():
     """
     The main function to handle the file operations.
     """
-    try:
-        file_path = sys.argv[1]
-    except IndexError:
-        print("Please provide a file path as a command-line argument.")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Electoral geography analysis of TSE and Twitter data.")
+    parser.add_argument(
+        "file_path",
+        help="TSE results file (municipality, zone or section level), or a TSE zip archive with one file per UF.",
+    )
+    parser.add_argument(
+        "--no-visualize",
+        action="store_true",
+        help="Only compute and export the indices; skip the treemaps, reports and maps.",
+    )
+    parser.add_argument(
+        "--regions",
+        default=None,
+        help="CSV file mapping each municipality to its microregion and mesoregion, used to decompose the Theil index.",
+    )
+    parser.add_argument(
+        "--database",
+        default=None,
+        help="SQLite file where the run and its results are recorded, e.g. ./output/results.sqlite.",
+    )
+    parser.add_argument(
+        "--candidates",
+        default=None,
+        help="Candidate list (e.g. TSE's consulta_cand file) with the party and totalization status of each "
+        "candidate; required by section-level (votacao_secao) files.",
+    )
+    parser.add_argument(
+        "--uf",
+        action="append",
+        default=None,
+        help="With a zip archive, UF to analyze (repeatable, e.g. --uf SP --uf RJ). Defaults to every UF.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="With a zip archive, number of UFs processed at a time. Defaults to the number of CPUs.",
+    )
+    args = parser.parse_args()
+    file_path = args.file_path
+    visualize = not args.no_visualize
 
     if not os.path.isfile(file_path):
         print(f"No such file: '{file_path}'")
         sys.exit(1)
 
-    if not validate_file(file_path, ["votacao", "municipio"]):
+    candidates = read_candidates(args.candidates) if args.candidates else None
+
+    # Archives are read in place, one UF per member, without extracting or moving them; the year and UF come
+    # from the member names, whatever the archive is called
+    if zipfile.is_zipfile(file_path):
+        analyze_archive(file_path, args.uf, visualize, args.regions, args.database, args.workers, candidates)
+        return
+
+    # Raw zone- and section-level files are aggregated to municipality level
+    raw_file = is_raw_file(file_path)
+    if not raw_file and not validate_file(file_path, MUNICIPALITY_FILE_KEYWORDS):
         print("The provided file does not meet the requirements.")
         sys.exit(1)
+    if candidates is None and validate_file(file_path, SECTION_FILE_KEYWORDS):
+        print(SECTION_FILE_MESSAGE)
+        sys.exit(1)
 
     year, uf = get_year_uf_from_filename(file_path)
     new_file_path = move_file_to_new_directory(file_path, year, uf)
     print(f"File has been successfully moved to ./data/{year}/{uf}/")
 
-    tse = DataAnalysis(new_file_path)
+    # Candidates, municipalities and parties get the same ids in the TSE and Twitter analyses of an election
+    code_table = CodeTable(f"./data/{year}/codes")
+
+    if raw_file:
+        tse_data = TSEAggregator(new_file_path, candidates=candidates).aggregate()
+    else:
+        tse_data = new_file_path
+    tse = DataAnalysis(
+        tse_data,
+        code_table=code_table,
+        visualize=visualize,
+        regions=args.regions,
+        database=args.database,
+        year=year,
+    )
     tse.run_analysis()
 
     city_names = tse.city_names
@@ -104,7 +287,15 @@ def main():
     if os.path.isfile(tweets_path):
         CityMentionAnalyzer(tweets_path, city_names).identify_city_mentions()
 
-    twitter_data = DataAnalysis(city_mention_path, data_source="twitter").run_analysis()
+    twitter_data = DataAnalysis(
+        city_mention_path,
+        data_source="twitter",
+        code_table=code_table,
+        visualize=visualize,
+        regions=args.regions,
+        database=args.database,
+        year=year,
+    ).run_analysis()
 
 
 if __name__ == "__main__":
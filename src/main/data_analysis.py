@@ -3,15 +3,27 @@ Module to perform analysis on election data to assess dominance and concentratio
 It reads the input data, calculates several indices (dominance, G-index, RAE-index, NEM), and generates visualizations.
 """
 
-import random
+import hashlib
+import time
+import zipfile
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from typing import Optional, List
+from typing import TYPE_CHECKING, Optional, List, Union
 from src.utils.classifier import Classifier
-from src.utils.visualize import Visualize
 from src.utils.calculator import IndexCalculator
 from src.utils.export_data import ExportData
+from src.utils.code_table import CodeTable
+from src.utils.engine_check import compare_engine_results
+from src.utils.progress import ProgressReporter, Stage
+from src.utils.result_store import ResultStore
+from src.utils.results_db import ResultsDatabase
+from src.utils.regions import REGION_LEVELS, attach_regions, load_region_hierarchy
+from src.utils.tse_ingest import read_member
+
+# Plotting and geometry libraries take most of the import time; they are imported where they are used, so
+# that analysis-only runs never load them
+if TYPE_CHECKING:
+    from src.utils.choropleth import GeometryCache
 
 
 class DataAnalysis:
@@ -20,39 +32,126 @@ class DataAnalysis:
     It reads the input data, calculates several indices (dominance, G-index, RAE-index, NEM), and generates visualizations.
     """
 
-    def __init__(self, file_name: str, data_source: str = "tse"):
+    ENGINES = ("reference", "fast", "verify")
+
+    def __init__(
+        self,
+        file_name: Union[str, pd.DataFrame],
+        data_source: str = "tse",
+        geometry_cache: Optional["GeometryCache"] = None,
+        renderer: str = "plotly",
+        report_format: str = "png",
+        code_table: Optional[CodeTable] = None,
+        engine: str = "reference",
+        progress: Optional[ProgressReporter] = None,
+        visualize: bool = True,
+        regions: Optional[Union[str, pd.DataFrame]] = None,
+        database: Optional[str] = None,
+        member: Optional[str] = None,
+        output_dir: Optional[str] = None,
+        year: Optional[int] = None,
+    ):
         """
         Initialize the ElectionAnalysis class.
 
         Args:
-            file_name (str): The path to the file to analyze.
+            file_name (str or pd.DataFrame): The path to the file to analyze, a zip archive containing it, or the
+                already loaded data (e.g. raw TSE files aggregated by `TSEAggregator`).
+            geometry_cache (GeometryCache, optional): Municipality boundaries used to draw choropleth maps.
+                If None, no maps are drawn.
+            renderer (str, optional): Treemap backend, 'plotly' or 'matplotlib'. Default is 'plotly'.
+            report_format (str, optional): 'png' writes one treemap image per candidate, 'html' writes a single
+                interactive report with all candidates. Default is 'png'.
+            code_table (CodeTable, optional): Per-election table of candidate, municipality and party ids. Share
+                the same table between the TSE and Twitter analyses of an election so their ids match.
+                Defaults to an in-memory table.
+            engine (str, optional): 'reference' runs the original pandas code, 'fast' the vectorized calculations
+                of IndexCalculator and Classifier, and 'verify' runs both, reports the speedup and checks that every
+                candidate's indices agree (the reference results are kept). Default is 'reference'.
+            progress (ProgressReporter, optional): Receives the stage start/end and progress events of the analysis.
+                Defaults to a reporter without sinks.
+            visualize (bool, optional): If False, only the indices are computed and exported; no treemap,
+                report or map is drawn. Default is True.
+            regions (str or pd.DataFrame, optional): Municipality -> microregion -> mesoregion hierarchy (a CSV
+                file or a DataFrame with 'cd_municipio' or 'nm_municipio', 'nm_microrregiao' and 'nm_mesorregiao').
+                If given, the Theil index of each candidate is decomposed between and within these regions.
+            database (str, optional): SQLite results database (e.g. './output/results.sqlite') where every run is
+                recorded with its parameters, input hash, candidate indices and municipality-level dominance.
+                Default is None.
+            member (str, optional): If `file_name` is a zip archive, the member to analyze, e.g.
+                'votacao_candidato_munzona_2022_SP.csv'. It is read without extracting the archive; raw zone- and
+                section-level members are aggregated to municipality level. Required when the archive has more
+                than one CSV.
+            output_dir (str, optional): Directory of the exported files, the result store and the visualizations,
+                e.g. './output/2022/SP/tse' to keep the runs of several UFs apart. Defaults to
+                './output/<data_source>'.
+            year (int, optional): Election year recorded in the results database. Defaults to the 'aa_eleicao'
+                column of the data; raw TSE files aggregated by `TSEAggregator` have no such column, so pass the
+                year parsed from their file name.
         """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Invalid engine '{engine}'. Valid options are {', '.join(self.ENGINES)}.")
         self.data_source = data_source
-        # Specify the appropriate separator based on the data_source
-        if self.data_source == "twitter":
-            sep = ","
-            encoding = "utf-8"
-        else:
-            sep = ";"
-            encoding = "latin-1"
-        self.original_data = pd.read_csv(
-            file_name, sep=sep, encoding=encoding, engine="python"
+        self.engine = engine
+        self.progress = progress if progress is not None else ProgressReporter()
+        self.geometry_cache = geometry_cache
+        self.renderer = renderer
+        self.report_format = report_format
+        self.visualize = visualize
+        self.region_hierarchy = load_region_hierarchy(regions) if regions is not None else None
+        self.database = database
+        self.member = member
+        self.output_dir = output_dir if output_dir is not None else f"./output/{data_source}"
+        self.year = int(year) if year is not None else None
+        self.elected_only = True
+        self.original_data = self._read_data(file_name)
+        # The raw input is hashed so that the runs recorded in the database can be traced to their input
+        self.input_hash = (
+            hashlib.sha256(pd.util.hash_pandas_object(self.original_data, index=False).to_numpy().tobytes())
+            .hexdigest()[:16]
+            if database is not None
+            else None
         )
+        # All grouping and joining is done on integer ids rather than on free-text names
+        self.code_table = code_table if code_table is not None else CodeTable()
+        self.original_data = self.code_table.encode(self.original_data)
         self.dominance_data: Optional[pd.DataFrame] = None
         self.concentration_data: Optional[pd.DataFrame] = None
+        self.gini_data: Optional[pd.DataFrame] = None
+        self.lorenz_curves: Optional[pd.DataFrame] = None
+        self.theil_data: Optional[pd.DataFrame] = None
         self.elected_candidates: Optional[pd.DataFrame] = None
         self.dominance_agg: Optional[pd.DataFrame] = None
         self.merged_indices_data: Optional[pd.DataFrame] = None
         self.classified_data: Optional[pd.DataFrame] = None
         self.city_names: Optional[pd.DataFrame] = None
-         
+        self.municipality_competition: Optional[pd.DataFrame] = None
+        self.spatial_autocorrelation: Optional[pd.DataFrame] = None
+        self.lisa_clusters: Optional[pd.DataFrame] = None
 
-    def calculate_dominance_index(self) -> pd.DataFrame:
+    def _read_data(self, file_name: Union[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+        Read the input file, or take a copy of the input DataFrame.
+        """
+        if isinstance(file_name, pd.DataFrame):
+            return file_name.copy()
+        # Specify the appropriate separator based on the data_source
+        if self.data_source == "twitter":
+            sep = ","
+            encoding = "utf-8"
+        else:
+            sep = ";"
+            encoding = "latin-1"
+        if zipfile.is_zipfile(file_name):
+            return read_member(file_name, self.member, sep=sep, encoding=encoding)
+        return pd.read_csv(file_name, sep=sep, encoding=encoding, engine="python")
+
+    def calculate_dominance_index(self, engine: Optional[str] = None) -> pd.DataFrame:
         """
         Calculate the dominance index for each candidate in each city.
 
         Args:
-            data_source (str): The type of data, either 'tse' or 'twitter'.
+            engine (str, optional): 'fast' to use the vectorized calculation. Defaults to the analysis' engine.
 
         Returns:
             pd.DataFrame: The DataFrame with the dominance index calculated for each candidate in each city.
@@ -62,6 +161,13 @@ class DataAnalysis:
             "twitter",
         ], "Invalid data_source, should be 'tse' or 'twitter'."
 
+        if (engine or self.engine) == "fast":
+            self.dominance_data = IndexCalculator.calculate_dominance_vectorized(
+                self.original_data, self.data_source
+            )
+            self._extract_city_names()
+            return self.dominance_data
+
         data_copy = self.original_data.copy()
 
         # Determine which column contains votes/mentions based on data type
@@ -70,17 +176,17 @@ class DataAnalysis:
         )
 
         # Calculate various indices used to calculate dominance index
-        data_copy["total_counts_city"] = data_copy.groupby("nm_municipio")[
+        data_copy["total_counts_city"] = data_copy.groupby("id_municipio")[
             column_votes
         ].transform("sum")
         data_copy["perc_counts"] = (
             data_copy[column_votes] / data_copy["total_counts_city"]
         ) * 100
         data_copy["city_contribution"] = data_copy[column_votes] / data_copy.groupby(
-            "sg_partido"
+            "id_partido"
         )[column_votes].transform("sum")
         data_copy["total_cities"] = data_copy.groupby("sg_ue")[
-            "nm_municipio"
+            "id_municipio"
         ].transform("nunique")
 
         # Calculate the dominance index for each candidate in each city
@@ -106,11 +212,14 @@ class DataAnalysis:
         return self.city_names
             
 
-    def filter_elected_candidates(self) -> pd.DataFrame:
+    def filter_elected_candidates(self, elected_only: bool = True) -> pd.DataFrame:
         """
         Filter candidates with the value 'Eleito' for the column 'ds_sit_totalizacao'.
+
+        Args:
+            elected_only (bool, optional): If False, keep every candidate. Default is True.
         """
-        if self.data_source == 'twitter':
+        if self.data_source == 'twitter' or not elected_only:
             self.elected_candidates = self.dominance_data
         else:
             self.elected_candidates = self.dominance_data[
@@ -126,7 +235,7 @@ class DataAnalysis:
         Aggregate the dominance index for each candidate across all municipalities.
         """
         dominance_agg = (
-            self.dominance_data.groupby("nm_urna_candidato")["dominance_index"]
+            self.dominance_data.groupby("id_candidato")["dominance_index"]
             .sum()
             .reset_index()
         )
@@ -137,9 +246,12 @@ class DataAnalysis:
         return dominance_agg
 
 
-    def calculate_concentration(self) -> pd.DataFrame:
+    def calculate_concentration(self, engine: Optional[str] = None) -> pd.DataFrame:
         """
         Calculate the concentration of votes for each candidate in the state.
+
+        Args:
+            engine (str, optional): 'fast' to use the vectorized calculation. Defaults to the analysis' engine.
         """
         assert self.data_source in [
             "tse",
@@ -150,7 +262,86 @@ class DataAnalysis:
         )
 
         data_copy = self.elected_candidates.copy()
-        grouped_data = data_copy.groupby("nm_urna_candidato")
+        with self.progress.stage("concentration", total=data_copy["id_candidato"].nunique()) as stage:
+            if (engine or self.engine) == "fast":
+                concentration_agg = IndexCalculator.calculate_concentration_vectorized(data_copy, self.data_source)
+                stage.advance(stage.total)
+            else:
+                concentration_agg = self._calculate_concentration_reference(data_copy, column_votes, stage)
+
+        concentration_agg["id_candidato"] = concentration_agg["id_candidato"].astype(np.int64)
+        candidate_attributes = data_copy.drop_duplicates("id_candidato").set_index("id_candidato")
+        for column in ["nm_urna_candidato", "sg_ue", "sg_partido"]:
+            concentration_agg[column] = concentration_agg["id_candidato"].map(
+                candidate_attributes[column]
+            )
+
+        data_copy = concentration_agg[
+            ["id_candidato", "nm_urna_candidato", "sg_ue", "sg_partido", "nem", "g_index"]
+        ]
+        self.concentration_data = data_copy
+        return data_copy
+
+    def calculate_gini(self, weight_col: Optional[str] = None) -> pd.DataFrame:
+        """
+        Calculate the raw and weighted Gini coefficients of each candidate's votes across municipalities, and the
+        points of their Lorenz curves, for all candidates at once.
+
+        Args:
+            weight_col (str, optional): Column with the municipalities' electorate or population. Defaults to
+                'qt_aptos' if the data has it, otherwise to the municipalities' total votes (or mentions).
+
+        Returns:
+            pd.DataFrame: One row per candidate with the 'gini' and 'gini_weighted' columns.
+        """
+        data = self.elected_candidates
+        if weight_col is None:
+            weight_col = "qt_aptos" if "qt_aptos" in data.columns else "total_counts_city"
+        with self.progress.stage("gini", total=data["id_candidato"].nunique()) as stage:
+            self.gini_data, self.lorenz_curves = IndexCalculator.calculate_gini_vectorized(
+                data, self.data_source, weight_col
+            )
+            stage.advance(stage.total)
+        return self.gini_data
+
+    def calculate_theil(self, levels: Optional[List[str]] = None, weight_col: Optional[str] = None) -> pd.DataFrame:
+        """
+        Calculate the Theil index of each candidate's votes and its exact decomposition between and within the
+        regions of the hierarchy, for all candidates at once.
+
+        Args:
+            levels (List[str], optional): The hierarchy's level columns, from the outermost to the innermost.
+                Defaults to ['nm_mesorregiao', 'nm_microrregiao'].
+            weight_col (str, optional): Column with the municipalities' electorate or population. Defaults to
+                'qt_aptos' if the data has it, otherwise to the municipalities' total votes (or mentions).
+
+        Returns:
+            pd.DataFrame: One row per candidate with the Theil index and its components.
+
+        Raises:
+            ValueError: If the analysis has no region hierarchy.
+        """
+        if self.region_hierarchy is None:
+            raise ValueError("Please provide a region hierarchy (regions) to decompose the Theil index.")
+        levels = levels or REGION_LEVELS
+        data = self.elected_candidates
+        if weight_col is None:
+            weight_col = "qt_aptos" if "qt_aptos" in data.columns else "total_counts_city"
+        with self.progress.stage("theil", total=data["id_candidato"].nunique()) as stage:
+            data = attach_regions(data, self.region_hierarchy, levels)
+            self.theil_data = IndexCalculator.calculate_theil_decomposition(
+                data, levels, self.data_source, weight_col
+            )
+            stage.advance(stage.total)
+        return self.theil_data
+
+    def _calculate_concentration_reference(
+        self, data_copy: pd.DataFrame, column_votes: str, stage: Stage
+    ) -> pd.DataFrame:
+        """
+        Calculate the G index and the NEM of each candidate, one candidate at a time.
+        """
+        grouped_data = data_copy.groupby("id_candidato")
         concentration_agg = pd.DataFrame()
 
         for candidate, group in grouped_data:
@@ -165,26 +356,12 @@ class DataAnalysis:
             nem = IndexCalculator.calculate_nem(rae_index)
 
             concentration_agg = concentration_agg.append(
-                {"nm_urna_candidato": candidate, "nem": nem, "g_index": g_index},
+                {"id_candidato": candidate, "nem": nem, "g_index": g_index},
                 ignore_index=True,
             )
+            stage.advance()
 
-        concentration_agg["sg_ue"] = concentration_agg["nm_urna_candidato"].map(
-            data_copy.drop_duplicates("nm_urna_candidato").set_index(
-                "nm_urna_candidato"
-            )["sg_ue"]
-        )
-        concentration_agg["sg_partido"] = concentration_agg["nm_urna_candidato"].map(
-            data_copy.drop_duplicates("nm_urna_candidato").set_index(
-                "nm_urna_candidato"
-            )["sg_partido"]
-        )
-
-        data_copy = concentration_agg[
-            ["nm_urna_candidato", "sg_ue", "sg_partido", "nem", "g_index"]
-        ]
-        self.concentration_data = data_copy
-        return data_copy
+        return concentration_agg
 
 
     def merge_indices(self) -> None:
@@ -198,38 +375,253 @@ class DataAnalysis:
             raise ValueError("Please run dominance and concentration calculations before merging.")
 
         # Merge the dominance and concentration dataframes
-        merged_data = pd.merge(self.dominance_agg, self.concentration_data, on='nm_urna_candidato')
+        merged_data = pd.merge(self.dominance_agg, self.concentration_data, on='id_candidato')
 
         # Reorder the columns
-        desired_columns_order = ['nm_urna_candidato', 'sg_ue', 'sg_partido', 'dominance_index', 'g_index', 'nem']
+        desired_columns_order = ['id_candidato', 'nm_urna_candidato', 'sg_ue', 'sg_partido', 'dominance_index', 'g_index', 'nem']
+        if self.gini_data is not None:
+            merged_data = merged_data.merge(self.gini_data, on='id_candidato', how='left')
+            desired_columns_order += ['gini', 'gini_weighted']
+        if self.theil_data is not None:
+            merged_data = merged_data.merge(self.theil_data, on='id_candidato', how='left')
+            desired_columns_order += [column for column in self.theil_data.columns if column != 'id_candidato']
         self.merged_indices_data = merged_data.reindex(columns=desired_columns_order)
         return self.merged_indices_data
 
 
+    def calculate_municipality_competition(self, top_k: int = 3) -> pd.DataFrame:
+        """
+        Calculate the competition metrics of each municipality (effective number of candidates and parties,
+        fragmentation and top-k candidates), reusing the city totals computed for the dominance index.
+
+        Args:
+            top_k (int, optional): Number of leading candidates reported per municipality. Defaults to 3.
+
+        Returns:
+            pd.DataFrame: One row per municipality with its competition metrics.
+        """
+        if self.dominance_data is None:
+            raise ValueError("Please run the dominance calculation before the municipality competition metrics.")
+
+        self.municipality_competition = IndexCalculator.calculate_municipality_competition(
+            self.dominance_data, self.data_source, top_k
+        )
+        return self.municipality_competition
+
+    def calculate_spatial_autocorrelation(self, permutations: int = 999) -> pd.DataFrame:
+        """
+        Calculate global Moran's I and the LISA clusters of each elected candidate's municipality vote share.
+        Requires the municipality boundaries given through `geometry_cache`.
+
+        Args:
+            permutations (int, optional): Number of permutations for the pseudo p-values. Default is 999.
+
+        Returns:
+            pd.DataFrame: The global Moran's I of each candidate.
+        """
+        if self.geometry_cache is None:
+            raise ValueError("Spatial autocorrelation requires municipality boundaries (geometry_cache).")
+        if self.elected_candidates is None:
+            raise ValueError("Please filter the elected candidates before the spatial autocorrelation.")
+
+        from src.utils.spatial import SpatialAutocorrelation
+
+        with self.progress.stage("spatial_autocorrelation"):
+            self.spatial_autocorrelation, self.lisa_clusters = SpatialAutocorrelation(
+                self.dominance_data, self.geometry_cache
+            ).calculate(self.elected_candidates["id_candidato"].unique().tolist(), permutations)
+        return self.spatial_autocorrelation
+
     def process_and_visualize_data(self) -> None:
         """
         Processes the data by classifying voting types, exports the classified data to CSV,
         and generates visualizations based on the data.
         """
         # Classify voting types
-        self.classified_data = Classifier.classify_voting_types(self.merged_indices_data)
+        if self.classified_data is None:
+            self.classify_voting_types()
+
+        with self.progress.stage("export"):
+            # Export the classified data to CSV
+            output_path = f"{self.output_dir}/voting_types.csv"  # Customize this path as needed
+            ExportData(self.classified_data).to_csv(output_path)
+
+            # Export the municipality-level dominance data so it can be queried without rerunning the pipeline
+            ExportData(self.dominance_data).to_csv(f"{self.output_dir}/dominance.csv")
+
+            if self.lorenz_curves is not None:
+                ExportData(self.lorenz_curves).to_csv(f"{self.output_dir}/lorenz_curves.csv")
+
+            if self.municipality_competition is not None:
+                ExportData(self.municipality_competition).to_csv(
+                    f"{self.output_dir}/municipality_competition.csv"
+                )
+
+            if self.spatial_autocorrelation is not None:
+                ExportData(self.spatial_autocorrelation).to_csv(
+                    f"{self.output_dir}/spatial_autocorrelation.csv"
+                )
+                ExportData(self.lisa_clusters).to_csv(f"{self.output_dir}/lisa_clusters.csv")
+
+            # The same outputs as memory-mapped arrays, shared by the treemap workers and the query service
+            store_dir = f"{self.output_dir}/store"
+            tables = {"dominance": self.dominance_data, "candidates": self.classified_data}
+            if self.municipality_competition is not None:
+                tables["municipality_competition"] = self.municipality_competition
+            ResultStore(store_dir).write(
+                tables, sort_by={"dominance": "id_candidato", "candidates": "id_candidato"}
+            )
 
-        # Export the classified data to CSV
-        output_path = f"./output/{self.data_source}/voting_types.csv"  # Customize this path as needed
-        ExportData(self.classified_data).to_csv(output_path)
+            if self.database is not None:
+                self.record_run()
+
+        if not self.visualize:
+            print(f"Data processing for '{self.data_source}' completed (visualizations skipped).")
+            return
+
+        from src.utils.visualize import Visualize
 
         # Generate visualizations
-        Visualize(self.dominance_data, self.classified_data).generate_visualizations(self.data_source)
+        visualize = Visualize(
+            self.dominance_data,
+            self.classified_data,
+            renderer=self.renderer,
+            progress=self.progress,
+            store_dir=store_dir,
+            output_dir=self.output_dir,
+        )
+        if self.report_format == "html":
+            visualize.generate_html_report(self.data_source)
+        else:
+            visualize.generate_visualizations(self.data_source)
+        if self.geometry_cache is not None:
+            from src.utils.choropleth import ChoroplethMap
+
+            with self.progress.stage("choropleth_maps", total=len(self.classified_data)) as stage:
+                ChoroplethMap(
+                    self.dominance_data, self.geometry_cache, output_dir=self.output_dir
+                ).render_candidates(self.classified_data["id_candidato"].tolist(), data_source=self.data_source)
+                stage.advance(stage.total)
 
         print(f"Data processing and visualization for '{self.data_source}' completed.")
 
+    def record_run(self) -> int:
+        """
+        Record the run in the SQLite results database: its parameters and input hash, the classified indices,
+        the municipalities and the municipality-level dominance data of the classified candidates, in a single
+        transaction.
+
+        Returns:
+            int: The id of the run.
+        """
+        valid_votes_col = "qt_votos_nom_validos" if self.data_source == "tse" else "qt_city_mentions"
+        municipalities = self.dominance_data.drop_duplicates("id_municipio")[
+            ["id_municipio", "nm_municipio", "total_counts_city"]
+        ]
+        # The municipality-level rows of the classified candidates (the elected ones, unless elected_only is False)
+        classified = self.dominance_data["id_candidato"].isin(self.classified_data["id_candidato"])
+        dominance = self.dominance_data[classified]
+        dominance = dominance[["id_municipio", "id_candidato", valid_votes_col, "perc_counts", "dominance_index"]]
+        data = self.original_data
+        year = self.year
+        if year is None and "aa_eleicao" in data.columns and len(data):
+            year = int(data["aa_eleicao"].iloc[0])
+        ufs = data["sg_ue"].dropna().unique() if "sg_ue" in data.columns else []
+        parameters = {
+            "engine": self.engine,
+            "elected_only": self.elected_only,
+            "regions": self.region_hierarchy is not None,
+        }
+        return ResultsDatabase(self.database).record_run(
+            self.data_source,
+            {
+                "candidate_indices": self.classified_data,
+                "municipalities": municipalities,
+                "municipality_dominance": dominance,
+            },
+            year=year,
+            uf=ufs[0] if len(ufs) == 1 else None,
+            parameters=parameters,
+            input_hash=self.input_hash,
+        )
+
+    def classify_voting_types(self, engine: Optional[str] = None) -> pd.DataFrame:
+        """
+        Classify the candidates' voting types from the merged indices.
+
+        Args:
+            engine (str, optional): 'fast' to use the vectorized classification. Defaults to the analysis' engine.
+        """
+        if (engine or self.engine) == "fast":
+            self.classified_data = Classifier.classify_voting_types_vectorized(self.merged_indices_data)
+        else:
+            self.classified_data = Classifier.classify_voting_types(self.merged_indices_data)
+        return self.classified_data
+
+    def _compute_indices(self, elected_only: bool, engine: str) -> pd.DataFrame:
+        with self.progress.stage("dominance_index"):
+            self.calculate_dominance_index(engine)
+        with self.progress.stage("municipality_competition"):
+            self.calculate_municipality_competition()
+        self.filter_elected_candidates(elected_only)
+        with self.progress.stage("aggregate_dominance_index"):
+            self.aggregate_dominance_index()
+        self.calculate_concentration(engine)
+        self.calculate_gini()
+        if self.region_hierarchy is not None:
+            self.calculate_theil()
+        self.merge_indices()
+        with self.progress.stage("classification"):
+            return self.classify_voting_types(engine)
+
+    def compute_indices(self, elected_only: bool = True) -> pd.DataFrame:
+        """
+        Run the index calculations and the classification, without exporting or drawing anything.
+
+        With the 'verify' engine, the fast and the reference engines are both run and timed. The candidates
+        whose dominance_index, g_index, nem or voting_type differ are exported to
+        <output_dir>/engine_divergences.csv and an AssertionError is raised.
+
+        Args:
+            elected_only (bool, optional): If False, the concentration indices and the voting type are computed
+                for every candidate, not only the elected ones. Default is True.
+
+        Returns:
+            pd.DataFrame: The classified indices of the candidates.
+        """
+        self.elected_only = elected_only
+        if self.engine != "verify":
+            return self._compute_indices(elected_only, self.engine)
+
+        timings = {}
+        results = {}
+        # The reference engine runs last, so that its results are the ones kept
+        for engine in ("fast", "reference"):
+            start = time.perf_counter()
+            results[engine] = self._compute_indices(elected_only, engine)
+            timings[engine] = time.perf_counter() - start
+
+        speedup = timings["reference"] / timings["fast"] if timings["fast"] else float("inf")
+        print(
+            f"Reference engine: {timings['reference']:.3f}s, fast engine: {timings['fast']:.3f}s "
+            f"(speedup {speedup:.1f}x)."
+        )
+        divergences = compare_engine_results(results["reference"], results["fast"])
+        if len(divergences):
+            output_path = f"{self.output_dir}/engine_divergences.csv"
+            ExportData(divergences).to_csv(output_path)
+            print(divergences.to_string(index=False))
+            raise AssertionError(
+                f"The fast engine diverges from the reference for {len(divergences)} candidates (see {output_path})."
+            )
+        print(f"The engines agree on all {len(results['reference'])} candidates.")
+        return self.classified_data
+
     def run_main_analysis(self):
         try:
-            self.calculate_dominance_index()
-            self.filter_elected_candidates()
-            self.aggregate_dominance_index()
-            self.calculate_concentration()
-            self.merge_indices()
+            self.compute_indices()
+            if self.geometry_cache is not None:
+                self.calculate_spatial_autocorrelation()
             self.process_and_visualize_data()
         except Exception as e:
             print(f"An error occurred during the analysis: {str(e)}")
@@ -0,0 +1,209 @@
+"""
+Module to follow candidates across several elections of a UF (e.g. 2014, 2018 and 2022).
+
+Each election is computed with DataAnalysis and aligned with the others on the municipality code and on
+the candidate's identity: the CPF when the data has it, otherwise the UF and the accent-insensitive ballot
+name, since candidate numbers change when a candidate switches parties. The per-election results are cached
+by the hash of their input, so adding a new year only computes that year.
+"""
+
+import hashlib
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Optional, Union
+from src.main.data_analysis import DataAnalysis
+from src.utils.export_data import ExportData
+
+
+class LongitudinalAnalysis:
+    """
+    Class to build the panel of dominance, G-index, NEM and voting type of the candidates who ran in
+    several elections.
+    """
+
+    PANEL_COLUMNS = ["dominance_index", "g_index", "nem", "voting_type"]
+
+    def __init__(
+        self,
+        elections: Dict[str, Union[str, pd.DataFrame]],
+        data_source: str = "tse",
+        elected_only: bool = True,
+        cache_dir: str = "./output/cache/longitudinal",
+    ):
+        """
+        Args:
+            elections (Dict[str, str or pd.DataFrame]): The data of each election (path or DataFrame), by year.
+            data_source (str, optional): The type of data, either 'tse' or 'twitter'. Default is 'tse'.
+            elected_only (bool, optional): If False, the indices of every candidate are followed, not only those
+                of the elected ones. Default is True.
+            cache_dir (str, optional): Directory of the per-election results. Default is './output/cache/longitudinal'.
+        """
+        self.elections = dict(sorted(elections.items()))
+        self.data_source = data_source
+        self.elected_only = elected_only
+        self.cache_dir = Path(cache_dir)
+        self.results: Dict[str, Dict[str, pd.DataFrame]] = {}
+        self.candidate_panel: Optional[pd.DataFrame] = None
+        self.municipality_panel: Optional[pd.DataFrame] = None
+
+    def _fingerprint(self, source: Union[str, pd.DataFrame]) -> str:
+        """
+        Hash the input of an election (file contents or DataFrame values) together with the analysis options.
+        """
+        digest = hashlib.sha256(f"{self.data_source}:{self.elected_only}".encode())
+        if isinstance(source, pd.DataFrame):
+            digest.update(pd.util.hash_pandas_object(source, index=False).to_numpy().tobytes())
+        else:
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def candidate_keys(data: pd.DataFrame) -> pd.Series:
+        """
+        Identify the candidates across elections.
+
+        Args:
+            data (pd.DataFrame): Data encoded by CodeTable (with 'nm_urna_normalizado').
+
+        Returns:
+            pd.Series: The CPF if the data has a 'nr_cpf_candidato' column, otherwise 'UF:NORMALIZED NAME'.
+        """
+        if "nr_cpf_candidato" in data.columns:
+            return data["nr_cpf_candidato"].astype(str)
+        return data["sg_ue"].astype(str) + ":" + data["nm_urna_normalizado"]
+
+    def _compute_election(self, year: str, source: Union[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """
+        Compute the indices of one election, or load them from the cache if its input did not change.
+
+        Returns:
+            Dict[str, pd.DataFrame]: The candidate indices and the municipality-level dominance of the election.
+        """
+        cache_path = self.cache_dir / f"{self.data_source}_{year}_{self._fingerprint(source)}.pkl"
+        if cache_path.is_file():
+            print(f"Using the cached results of {year}.")
+            return pd.read_pickle(cache_path)
+
+        print(f"Computing the indices of {year}...")
+        analysis = DataAnalysis(source, data_source=self.data_source)
+        indices = analysis.compute_indices(self.elected_only).copy()
+        dominance = analysis.dominance_data
+        keys = self.candidate_keys(dominance)
+
+        candidate_keys = keys.groupby(dominance["id_candidato"]).first()
+        indices["candidate_key"] = indices["id_candidato"].map(candidate_keys)
+        municipality_col = "cd_municipio" if "cd_municipio" in dominance.columns else "nm_municipio_normalizado"
+        municipalities = pd.DataFrame(
+            {
+                "candidate_key": keys,
+                "cd_municipio": dominance[municipality_col],
+                "nm_municipio": dominance["nm_municipio"],
+                "perc_counts": dominance["perc_counts"],
+                "dominance_index": dominance["dominance_index"],
+            }
+        )
+
+        result = {"indices": indices, "municipalities": municipalities}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle(result, cache_path)
+        return result
+
+    def compute(self) -> Dict[str, Dict[str, pd.DataFrame]]:
+        """
+        Compute (or load from the cache) the results of every election.
+        """
+        for year, source in self.elections.items():
+            self.results[year] = self._compute_election(year, source)
+        return self.results
+
+    def build_candidate_panel(self) -> pd.DataFrame:
+        """
+        Build the panel of the candidates present in at least two elections.
+
+        Candidate keys that are ambiguous within an election (homonyms of the same UF when there is no CPF) are
+        left out, since they cannot be followed.
+
+        Returns:
+            pd.DataFrame: One row per candidate, with one column per index and year (e.g. 'g_index_2018'),
+            the voting type trajectory and the change of each index between the first and the last election.
+        """
+        if not self.results:
+            self.compute()
+
+        indices = pd.concat(
+            [result["indices"].assign(year=year) for year, result in self.results.items()], ignore_index=True
+        )
+        ambiguous = indices.duplicated(["year", "candidate_key"], keep=False)
+        if ambiguous.any():
+            print(f"{indices.loc[ambiguous, 'candidate_key'].nunique()} ambiguous candidate keys were left out.")
+        indices = indices[~ambiguous]
+
+        years = list(self.results)
+        panel = indices.pivot(index="candidate_key", columns="year", values=self.PANEL_COLUMNS)
+        panel = panel.reindex(columns=pd.MultiIndex.from_product([self.PANEL_COLUMNS, years]))
+        panel = panel[panel["dominance_index"].notna().sum(axis=1) >= 2]
+
+        latest = indices.drop_duplicates("candidate_key", keep="last").set_index("candidate_key")
+        result = latest.loc[panel.index, ["nm_urna_candidato", "sg_ue", "sg_partido"]].copy()
+        result["n_elections"] = panel["dominance_index"].notna().sum(axis=1)
+        for column in self.PANEL_COLUMNS:
+            for year in years:
+                result[f"{column}_{year}"] = panel[(column, year)]
+        result["voting_type_trajectory"] = panel["voting_type"].apply(
+            lambda row: " -> ".join(row.dropna()), axis=1
+        )
+        for column in ["dominance_index", "g_index", "nem"]:
+            values = panel[column].astype(float)
+            result[f"{column}_change"] = values.ffill(axis=1).iloc[:, -1] - values.bfill(axis=1).iloc[:, 0]
+
+        self.candidate_panel = result.reset_index()
+        return self.candidate_panel
+
+    def build_municipality_panel(self, value_col: str = "dominance_index") -> pd.DataFrame:
+        """
+        Build the municipality-level panel of the candidates of the candidate panel.
+
+        Args:
+            value_col (str, optional): 'dominance_index' or 'perc_counts'. Default is 'dominance_index'.
+
+        Returns:
+            pd.DataFrame: One row per candidate and municipality, with one column per year. Municipalities are
+            named as in the latest election.
+        """
+        if self.candidate_panel is None:
+            self.build_candidate_panel()
+
+        municipalities = pd.concat(
+            [result["municipalities"].assign(year=year) for year, result in self.results.items()], ignore_index=True
+        )
+        municipalities = municipalities[municipalities["candidate_key"].isin(self.candidate_panel["candidate_key"])]
+        panel = municipalities.pivot_table(
+            index=["candidate_key", "cd_municipio"], columns="year", values=value_col, aggfunc="sum"
+        )
+        panel.columns = [f"{value_col}_{year}" for year in panel.columns]
+        panel = panel.reset_index()
+
+        names = municipalities.drop_duplicates("cd_municipio", keep="last").set_index("cd_municipio")["nm_municipio"]
+        panel.insert(2, "nm_municipio", panel["cd_municipio"].map(names))
+        self.municipality_panel = panel
+        return panel
+
+    def run(self, uf: str) -> pd.DataFrame:
+        """
+        Compute the panels and export them to ./output/<data_source>/.
+
+        Args:
+            uf (str): The federal unit, used in the file names.
+
+        Returns:
+            pd.DataFrame: The candidate panel.
+        """
+        self.build_candidate_panel()
+        self.build_municipality_panel()
+        ExportData(self.candidate_panel).to_csv(f"./output/{self.data_source}/longitudinal_candidates_{uf}.csv")
+        ExportData(self.municipality_panel).to_csv(
+            f"./output/{self.data_source}/longitudinal_municipalities_{uf}.csv"
+        )
+        return self.candidate_panel
@@ -0,0 +1,534 @@
+"""
+Module to simulate district-based (voto distrital) elections from the municipality-level results.
+
+Municipalities are grouped into districts by assignment vectors (one district label per municipality), either
+supplied by the user or drawn at random as contiguous partitions of the UF. For every partition, the votes are
+summed per district and candidate, and the dominance index, G-index, NEM and voting type of the candidates are
+recomputed with the districts in place of the municipalities.
+
+A batch of partitions is aggregated with a single sparse product: the stacked one-hot district matrices of the
+batch times the municipalities x candidates vote matrix. The indices of the whole batch are then computed on
+the resulting (partition, district, candidate) array. Batches are evaluated across processes, and each
+candidate's indices are summarized by their distribution over the partitions.
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from scipy import sparse
+from scipy.sparse import csgraph
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Union
+from src.main.data_analysis import DataAnalysis
+from src.utils.code_table import CodeTable
+from src.utils.export_data import ExportData
+
+if TYPE_CHECKING:
+    from src.utils.choropleth import GeometryCache
+
+
+# Same types, in the same order, as Classifier.classify_voting_types_vectorized
+VOTING_TYPES = [
+    "Dispersa Dominante",
+    "Concentrada Dominante",
+    "Dispersa Compartilhada",
+    "Concentrada Compartilhada",
+    "Unclassified",
+]
+
+INDICES = ["dominance_index", "g_index", "nem"]
+
+
+def random_contiguous_partitions(
+    adjacency: sparse.csr_matrix, n_districts: int, n_partitions: int, seed=None
+) -> np.ndarray:
+    """
+    Draw random partitions of the municipalities into contiguous districts.
+
+    Each partition picks `n_districts` random seed municipalities and random lengths for the edges of the
+    contiguity graph (one per direction). Every municipality then joins the seed it is closest to, in one
+    multi-source Dijkstra run. A municipality's shortest path from its seed only crosses municipalities of the
+    same seed, so every district is contiguous. Municipalities that no seed can reach (islands, or parts of
+    the graph without a seed) join the district with the fewest municipalities.
+
+    Args:
+        adjacency (sparse.csr_matrix): Contiguity matrix (municipalities x municipalities); nonzero entries are
+            neighbours.
+        n_districts (int): Number of districts of each partition.
+        n_partitions (int): Number of partitions.
+        seed: Seed (or SeedSequence) of the random generator. Default is None.
+
+    Returns:
+        np.ndarray: The district of each municipality in each partition (partitions x municipalities).
+    """
+    n = adjacency.shape[0]
+    if not 0 < n_districts <= n:
+        raise ValueError(f"Cannot split {n} municipalities into {n_districts} districts.")
+    rng = np.random.default_rng(seed)
+    # Both directions of every contiguity are kept, so the graph can be searched as a directed one, which
+    # avoids the conversion scipy makes for undirected searches
+    graph = sparse.csr_matrix(adjacency, dtype=float, copy=True)
+    graph = (graph + graph.T).tocsr()
+    graph.eliminate_zeros()
+    _, components = csgraph.connected_components(graph, directed=False)
+
+    labels = np.empty((n_partitions, n), dtype=np.int32)
+    district_of_seed = np.full(n, -1, dtype=np.int32)
+    for partition in range(n_partitions):
+        graph.data = rng.exponential(size=graph.nnz)
+        seeds = rng.choice(n, n_districts, replace=False)
+        _, _, sources = csgraph.dijkstra(
+            graph, directed=True, indices=seeds, return_predecessors=True, min_only=True
+        )
+        district_of_seed[seeds] = np.arange(n_districts)
+        reached = sources >= 0
+        district = np.full(n, -1, dtype=np.int32)
+        district[reached] = district_of_seed[sources[reached]]
+        if not reached.all():
+            sizes = np.bincount(district[reached], minlength=n_districts)
+            for component in np.unique(components[~reached]):
+                members = (components == component) & ~reached
+                smallest = int(np.argmin(sizes))
+                district[members] = smallest
+                sizes[smallest] += members.sum()
+        labels[partition] = district
+        district_of_seed[seeds] = -1
+    return labels
+
+
+def _district_indices(matrices: Dict[str, np.ndarray], labels: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Compute the indices of every candidate under a batch of partitions, as DataAnalysis computes them per
+    municipality (dominance rows rounded to 6 decimals, concentration over the selected candidates' rows).
+
+    Args:
+        matrices (Dict[str, np.ndarray]): The municipality-level matrices built by `RedistrictingSimulator`.
+        labels (np.ndarray): The district of each municipality in each partition (partitions x municipalities).
+
+    Returns:
+        Dict[str, np.ndarray]: The indices and voting type codes (partitions x candidates), and the number of
+        districts and the largest relative deviation of a district's population from the mean (per partition).
+    """
+    n_partitions, n_municipalities = labels.shape
+    n_candidates = len(matrices["candidate_totals"])
+    n_districts = int(labels.max()) + 1
+
+    # One row per (partition, district): the batch's one-hot matrices stacked on top of each other
+    rows = (np.arange(n_partitions)[:, None] * n_districts + labels).ravel()
+    columns = np.tile(np.arange(n_municipalities), n_partitions)
+    assignment = sparse.csr_matrix(
+        (np.ones(rows.size), (rows, columns)), shape=(n_partitions * n_districts, n_municipalities)
+    )
+    aggregated = np.asarray(assignment @ matrices["columns"]).reshape(n_partitions, n_districts, -1)
+
+    votes = aggregated[..., :n_candidates]
+    total_counts, population, municipalities = (aggregated[..., -3], aggregated[..., -2], aggregated[..., -1])
+    if matrices["has_presence"]:
+        presence = aggregated[..., n_candidates : 2 * n_candidates] > 0
+    else:
+        presence = np.broadcast_to((municipalities > 0)[..., None], votes.shape)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Dominance: the district's share of the candidate's votes times the district's share of the party's votes
+        perc_counts = votes / total_counts[..., None] * 100
+        city_contribution = votes / matrices["party_totals"]
+        dominance_rows = np.where(presence, np.round(perc_counts * city_contribution / 100, 6), 0.0)
+        dominance_index = np.round(np.nansum(dominance_rows, axis=1) / 100, 6)
+
+        # G-index and NEM, with the district totals of the selected candidates
+        contrib_candidate = votes / matrices["candidate_totals"]
+        district_totals = np.where(presence, votes.sum(axis=2, keepdims=True), 0.0)
+        contrib_district = district_totals / district_totals.sum(axis=1, keepdims=True)
+        # Missing values are skipped, as in the grouped sums of IndexCalculator
+        g_index = np.nansum(np.where(presence, np.square(contrib_candidate - contrib_district), 0.0), axis=1)
+        rae_index = np.nansum(np.square(contrib_candidate), axis=1)
+        rae_index = np.where(rae_index > 0, rae_index, 1e-9)
+        nem = 1 / rae_index
+
+        # Population balance of the districts
+        occupied = municipalities > 0
+        mean_population = population.sum(axis=1) / occupied.sum(axis=1)
+        deviation = np.where(occupied, np.abs(population / mean_population[:, None] - 1), 0.0).max(axis=1)
+
+    return {
+        "dominance_index": dominance_index,
+        "g_index": g_index,
+        "nem": nem,
+        "voting_type": _classify(dominance_index, nem),
+        "n_districts": occupied.sum(axis=1),
+        "max_population_deviation": deviation,
+    }
+
+
+def _classify(dominance_index: np.ndarray, nem: np.ndarray) -> np.ndarray:
+    """
+    Classify the candidates of each partition with the thresholds of `Classifier.classify_voting_types_vectorized`,
+    set within the partition. Returns the positions of the types in VOTING_TYPES.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nem_log = np.log(nem)
+    std_dev = 0.0000005
+    dominance_mean = np.nanmean(dominance_index, axis=1, keepdims=True)
+    dominance_std = np.nanstd(dominance_index, axis=1, ddof=1, keepdims=True)
+    nem_log_mean = np.nanmean(nem_log, axis=1, keepdims=True)
+    nem_log_std = np.nanstd(nem_log, axis=1, ddof=1, keepdims=True)
+    high_dominance = dominance_index > dominance_mean + std_dev * dominance_std
+    low_dominance = dominance_index < dominance_mean - std_dev * dominance_std
+    high_fragmentation = nem_log > nem_log_mean + std_dev * nem_log_std
+    low_fragmentation = nem_log < nem_log_mean - std_dev * nem_log_std
+    return np.select(
+        [
+            high_dominance & high_fragmentation,
+            high_dominance & low_fragmentation,
+            low_dominance & high_fragmentation,
+            low_dominance & low_fragmentation,
+        ],
+        [0, 1, 2, 3],
+        default=4,
+    ).astype(np.int8)
+
+
+def _evaluate_partitions(
+    matrices: Dict[str, np.ndarray],
+    labels: Optional[np.ndarray],
+    adjacency: Optional[sparse.csr_matrix],
+    n_districts: int,
+    n_partitions: int,
+    seed,
+    batch_size: int,
+) -> Dict[str, np.ndarray]:
+    """
+    Evaluate a share of the partitions in a worker process: the given labels, or `n_partitions` random
+    contiguous partitions drawn with `seed`. Partitions are aggregated `batch_size` at a time.
+    """
+    if labels is None:
+        labels = random_contiguous_partitions(adjacency, n_districts, n_partitions, seed)
+    results = [
+        _district_indices(matrices, labels[start : start + batch_size])
+        for start in range(0, len(labels), batch_size)
+    ]
+    combined = {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+    combined["labels"] = labels
+    return combined
+
+
+class RedistrictingSimulator:
+    """
+    Class to recompute the candidates' indices under many hypothetical partitions of a UF into districts.
+    """
+
+    def __init__(
+        self,
+        data: Union[str, pd.DataFrame],
+        data_source: str = "tse",
+        elected_only: bool = True,
+        code_table: Optional[CodeTable] = None,
+        adjacency: Optional[sparse.csr_matrix] = None,
+        geometry_cache: Optional["GeometryCache"] = None,
+        weight_col: Optional[str] = None,
+    ):
+        """
+        Args:
+            data (str or pd.DataFrame): The municipality-level results of one UF, as accepted by DataAnalysis.
+            data_source (str, optional): The type of data, either 'tse' or 'twitter'. Default is 'tse'.
+            elected_only (bool, optional): If False, the indices of every candidate are simulated, not only
+                those of the elected ones. Default is True.
+            code_table (CodeTable, optional): The election's code table. Defaults to an in-memory table.
+            adjacency (sparse.csr_matrix, optional): Contiguity matrix of the municipalities, in the order of
+                `self.municipalities`. Needed for random partitions if no geometry_cache is given.
+            geometry_cache (GeometryCache, optional): Municipality boundaries, from which the contiguity matrix
+                is built as for the spatial autocorrelation.
+            weight_col (str, optional): Column with the municipalities' electorate or population, used to report
+                how balanced the districts are. Defaults to 'qt_aptos' if the data has it, otherwise to the
+                municipalities' total votes (or mentions).
+        """
+        self.data_source = data_source
+        self.elected_only = elected_only
+        self.data = DataAnalysis(data, data_source=data_source, code_table=code_table, visualize=False).original_data
+        self.adjacency = adjacency
+        self.geometry_cache = geometry_cache
+        self.valid_votes_col = "qt_votos_nom_validos" if data_source == "tse" else "qt_city_mentions"
+        self.weight_col = weight_col or ("qt_aptos" if "qt_aptos" in self.data.columns else None)
+
+        self.municipalities: Optional[pd.DataFrame] = None
+        self.candidates: Optional[pd.DataFrame] = None
+        self.matrices: Dict[str, np.ndarray] = {}
+        self.assignments: Optional[np.ndarray] = None
+        self.indices: Dict[str, np.ndarray] = {}
+        self.partitions: Optional[pd.DataFrame] = None
+        self.observed: Optional[pd.DataFrame] = None
+        self.summary: Optional[pd.DataFrame] = None
+        self._build_matrices()
+
+    def _build_matrices(self) -> None:
+        """
+        Build the municipalities x candidates vote matrix of the selected candidates, their presence matrix, and
+        the municipality totals, populations and party totals that do not depend on the partition.
+        """
+        data = self.data
+        votes = data[self.valid_votes_col].fillna(0).to_numpy(dtype=float)
+        municipality_ids, municipality = np.unique(data["id_municipio"].to_numpy(), return_inverse=True)
+        n_municipalities = len(municipality_ids)
+
+        total_counts = np.bincount(municipality, weights=votes, minlength=n_municipalities)
+        if self.weight_col is not None:
+            population = (
+                data.groupby("id_municipio")[self.weight_col].first().reindex(municipality_ids).to_numpy(dtype=float)
+            )
+        else:
+            population = total_counts
+        party_totals = data.groupby("id_partido")[self.valid_votes_col].sum()
+
+        selected = data
+        if self.data_source == "tse" and self.elected_only:
+            selected = data[data["ds_sit_totalizacao"] == "Eleito"]
+        candidate_ids, candidate = np.unique(selected["id_candidato"].to_numpy(), return_inverse=True)
+        n_candidates = len(candidate_ids)
+        cells = np.searchsorted(municipality_ids, selected["id_municipio"].to_numpy()) * n_candidates + candidate
+        selected_votes = selected[self.valid_votes_col].fillna(0).to_numpy(dtype=float)
+        vote_matrix = np.bincount(cells, weights=selected_votes, minlength=n_municipalities * n_candidates)
+        presence = np.bincount(cells, minlength=n_municipalities * n_candidates) > 0
+        has_presence = not presence.all()
+
+        candidates = selected.drop_duplicates("id_candidato").set_index("id_candidato").reindex(candidate_ids)
+        municipality_columns = [
+            column for column in ["id_municipio", "cd_municipio", "nm_municipio"] if column in data.columns
+        ]
+        self.municipalities = (
+            data.drop_duplicates("id_municipio").set_index("id_municipio").reindex(municipality_ids).reset_index()
+        )[municipality_columns]
+        self.candidates = candidates.reset_index()[["id_candidato", "nm_urna_candidato", "sg_ue", "sg_partido"]]
+
+        # Columns aggregated per district: votes, presence (only if some candidate lacks municipalities), total
+        # votes, population and number of municipalities
+        columns = [vote_matrix.reshape(n_municipalities, n_candidates)]
+        if has_presence:
+            columns.append(presence.reshape(n_municipalities, n_candidates).astype(float))
+        columns.append(np.column_stack([total_counts, population, np.ones(n_municipalities)]))
+        self.matrices = {
+            "columns": np.hstack(columns),
+            "has_presence": has_presence,
+            "candidate_totals": vote_matrix.reshape(n_municipalities, n_candidates).sum(axis=0),
+            "party_totals": candidates["id_partido"].map(party_totals).to_numpy(dtype=float),
+        }
+
+    def default_districts(self) -> int:
+        """
+        Return the default number of districts: one per seat, i.e. the number of elected candidates.
+        """
+        if "ds_sit_totalizacao" not in self.data.columns:
+            raise ValueError("Please give the number of districts; the data has no elected candidates.")
+        return int(self.data.loc[self.data["ds_sit_totalizacao"] == "Eleito", "id_candidato"].nunique())
+
+    def build_adjacency(self) -> sparse.csr_matrix:
+        """
+        Build the contiguity matrix of the municipalities from the geometry cache, in the order of
+        `self.municipalities`. Municipalities without boundaries have no neighbours.
+
+        Returns:
+            sparse.csr_matrix: The contiguity matrix.
+        """
+        if self.adjacency is not None:
+            return self.adjacency
+        if self.geometry_cache is None:
+            raise ValueError("Random partitions require a contiguity matrix (adjacency) or a geometry_cache.")
+
+        from src.utils.spatial import SpatialAutocorrelation
+
+        spatial = SpatialAutocorrelation(self.data, self.geometry_cache)
+        weights = spatial.build_weights()
+        order = pd.Index(spatial.codes).get_indexer(self.municipalities["cd_municipio"].astype(str))
+        present = np.flatnonzero(order >= 0)
+        neighbours = weights[order[present]][:, order[present]].tocoo()
+        n = len(self.municipalities)
+        self.adjacency = sparse.csr_matrix(
+            (np.ones(neighbours.nnz), (present[neighbours.row], present[neighbours.col])), shape=(n, n)
+        )
+        return self.adjacency
+
+    def _labels(self, assignments: Union[np.ndarray, pd.DataFrame]) -> np.ndarray:
+        """
+        Turn user-supplied assignments into district labels 0..k-1 (partitions x municipalities).
+
+        A DataFrame has one row per municipality, indexed by 'cd_municipio' (or 'nm_municipio' for data without
+        codes), and one column per partition. An array is partitions x municipalities, in the order of
+        `self.municipalities`.
+        """
+        if isinstance(assignments, pd.DataFrame):
+            key = "cd_municipio" if "cd_municipio" in self.municipalities.columns else "nm_municipio"
+            keys = self.municipalities[key]
+            index = assignments.index
+            if key == "cd_municipio":
+                keys, index = pd.to_numeric(keys), pd.to_numeric(index)
+            assignments = assignments.set_axis(index).reindex(keys)
+            if assignments.isna().any().any():
+                raise ValueError("Every municipality of the data needs a district in every partition.")
+            assignments = assignments.T.to_numpy()
+        assignments = np.asarray(assignments)
+        if assignments.ndim == 1:
+            assignments = assignments[None, :]
+        if assignments.shape[1] != len(self.municipalities):
+            raise ValueError(
+                f"The assignments have {assignments.shape[1]} municipalities; the data has {len(self.municipalities)}."
+            )
+        return np.stack([pd.factorize(row)[0] for row in assignments]).astype(np.int32)
+
+    def simulate(
+        self,
+        n_partitions: int = 10000,
+        n_districts: Optional[int] = None,
+        assignments: Optional[Union[np.ndarray, pd.DataFrame]] = None,
+        workers: Optional[int] = None,
+        seed: int = 12345,
+        batch_size: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Evaluate the candidates' indices under many partitions and summarize their distributions.
+
+        Random partitions are drawn by `random_contiguous_partitions`. Their districts are contiguous as long as
+        the contiguity graph is connected. Municipalities that no seed can reach (islands, or components of the
+        graph without a seed) are merged into the district with the fewest municipalities, which is then no
+        longer contiguous.
+
+        Args:
+            n_partitions (int, optional): Number of random contiguous partitions. Ignored if `assignments` is
+                given. Default is 10000.
+            n_districts (int, optional): Number of districts of the random partitions. Defaults to the number of
+                seats (elected candidates).
+            assignments (np.ndarray or pd.DataFrame, optional): User-supplied partitions (see `_labels`); any
+                hashable district labels can be used. Default is None.
+            workers (int, optional): Number of processes. Defaults to the CPU count.
+            seed (int, optional): Seed of the random partitions. Default is 12345.
+            batch_size (int, optional): Number of partitions aggregated at a time. Defaults to a batch of about
+                4 million (partition, district, candidate) cells.
+
+        Returns:
+            pd.DataFrame: The summary, one row per candidate (see `summarize`).
+        """
+        labels = self._labels(assignments) if assignments is not None else None
+        adjacency = None
+        if labels is None:
+            n_districts = n_districts or self.default_districts()
+            adjacency = self.build_adjacency()
+        else:
+            n_partitions = len(labels)
+            n_districts = int(labels.max()) + 1
+        if batch_size is None:
+            cells = n_districts * self.matrices["columns"].shape[1]
+            batch_size = max(1, 4_000_000 // cells)
+
+        workers = min(workers or os.cpu_count() or 1, n_partitions)
+        shares = [len(share) for share in np.array_split(np.arange(n_partitions), workers)]
+        bounds = np.cumsum([0] + shares)
+        tasks = [
+            (
+                self.matrices,
+                labels[bounds[i] : bounds[i + 1]] if labels is not None else None,
+                adjacency,
+                n_districts,
+                shares[i],
+                seed_sequence,
+                batch_size,
+            )
+            for i, seed_sequence in enumerate(np.random.SeedSequence(seed).spawn(workers))
+        ]
+
+        start = time.perf_counter()
+        if workers == 1:
+            results = [_evaluate_partitions(*tasks[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_evaluate_partitions, *zip(*tasks)))
+        elapsed = time.perf_counter() - start
+        print(
+            f"Evaluated {n_partitions:,} partitions into {n_districts} districts for {len(self.candidates)} "
+            f"candidates in {elapsed:.1f}s ({n_partitions / elapsed:,.0f} partitions/s)."
+        )
+
+        combined = {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+        self.assignments = combined.pop("labels")
+        self.partitions = pd.DataFrame(
+            {
+                "partition": np.arange(n_partitions),
+                "n_districts": combined.pop("n_districts"),
+                "max_population_deviation": combined.pop("max_population_deviation"),
+            }
+        )
+        self.indices = combined
+        return self.summarize()
+
+    def calculate_observed(self) -> pd.DataFrame:
+        """
+        Calculate the indices with every municipality as its own district, i.e. as DataAnalysis does.
+
+        Returns:
+            pd.DataFrame: One row per candidate with the indices and the voting type.
+        """
+        identity = np.arange(len(self.municipalities))[None, :]
+        result = _district_indices(self.matrices, identity)
+        self.observed = self.candidates.assign(
+            **{name: result[name][0] for name in INDICES},
+            voting_type=np.array(VOTING_TYPES)[result["voting_type"][0]],
+        )
+        return self.observed
+
+    def summarize(self, percentiles: Sequence[float] = (5, 25, 50, 75, 95)) -> pd.DataFrame:
+        """
+        Summarize the distribution of each candidate's indices over the simulated partitions.
+
+        Args:
+            percentiles (Sequence[float], optional): Percentiles reported for each index. Default is
+                (5, 25, 50, 75, 95).
+
+        Returns:
+            pd.DataFrame: One row per candidate with, for each index, its observed (municipality-level) value
+            and its mean, standard deviation and percentiles over the partitions ('g_index_observed',
+            'g_index_mean', 'g_index_p05', ...); and the observed voting type, the most frequent simulated one,
+            the share of partitions where it is that type and the share where it differs from the observed one.
+        """
+        if not self.indices:
+            raise ValueError("Please run simulate() first.")
+        observed = self.calculate_observed()
+        summary = self.candidates.copy()
+        for name in INDICES:
+            values = self.indices[name]
+            summary[f"{name}_observed"] = observed[name].to_numpy()
+            summary[f"{name}_mean"] = np.nanmean(values, axis=0)
+            summary[f"{name}_std"] = np.nanstd(values, axis=0)
+            for percentile, row in zip(percentiles, np.nanpercentile(values, percentiles, axis=0)):
+                summary[f"{name}_p{percentile:02g}"] = row
+
+        types = self.indices["voting_type"]
+        counts = np.stack([(types == code).sum(axis=0) for code in range(len(VOTING_TYPES))])
+        observed_codes = pd.Index(VOTING_TYPES).get_indexer(observed["voting_type"])
+        summary["voting_type_observed"] = observed["voting_type"].to_numpy()
+        summary["voting_type_mode"] = np.array(VOTING_TYPES)[counts.argmax(axis=0)]
+        summary["voting_type_mode_share"] = counts.max(axis=0) / len(types)
+        summary["voting_type_changed_share"] = (types != observed_codes).mean(axis=0)
+        self.summary = summary
+        return summary
+
+    def run(self, output_dir: Optional[str] = None, **kwargs) -> pd.DataFrame:
+        """
+        Run the simulation and export the summary, the partitions' balance and the assignments.
+
+        The summary and the partitions are saved to <output_dir>/redistricting_summary.csv and
+        redistricting_partitions.csv, and the district of each municipality in each partition to
+        redistricting_assignments.npy (partitions x municipalities, in the order of `self.municipalities`).
+
+        Args:
+            output_dir (str, optional): Directory of the outputs. Defaults to './output/<data_source>'.
+            **kwargs: The arguments of `simulate`.
+
+        Returns:
+            pd.DataFrame: The summary.
+        """
+        output_dir = Path(output_dir or f"./output/{self.data_source}")
+        self.simulate(**kwargs)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        ExportData(self.summary).to_csv(str(output_dir / "redistricting_summary.csv"))
+        ExportData(self.partitions).to_csv(str(output_dir / "redistricting_partitions.csv"))
+        np.save(output_dir / "redistricting_assignments.npy", self.assignments)
+        return self.summary
@@ -0,0 +1,145 @@
+"""
+Module to follow how the candidates' Twitter geography changes over time.
+
+The dated city mentions are bucketed in time windows (calendar weeks or months, named periods such as the
+campaign and the term, or rolling windows spanning several weeks or months). The dominance index, G-index,
+NEM and voting type of every candidate in every window are then computed in one grouped pass, with the
+window as an extra grouping key, instead of re-running the pipeline once per window.
+"""
+
+import pandas as pd
+from typing import Dict, Optional, Tuple
+from src.utils.calculator import IndexCalculator
+from src.utils.classifier import Classifier
+from src.utils.code_table import CodeTable
+from src.utils.export_data import ExportData
+
+
+class TemporalMentionAnalysis:
+    """
+    Class to calculate the candidates' indices per time window from dated city mentions.
+    """
+
+    def __init__(self, mentions: pd.DataFrame, code_table: Optional[CodeTable] = None):
+        """
+        Args:
+            mentions (pd.DataFrame): Dated city mentions with the candidates' UF and party, e.g. the output of
+                `CityMentionAnalyzer.identify_dated_city_mentions` merged with `merge_with_main_data`.
+            code_table (CodeTable, optional): The election's code table, used if the mentions do not have the
+                id columns yet. Defaults to an in-memory table.
+        """
+        if "id_candidato" not in mentions.columns:
+            mentions = (code_table if code_table is not None else CodeTable()).encode(mentions)
+        self.mentions = mentions.assign(date=pd.to_datetime(mentions["date"]))
+        self.indices: Optional[pd.DataFrame] = None
+
+    def assign_windows(
+        self,
+        freq: Optional[str] = "W",
+        periods: Optional[Dict[str, Tuple[str, str]]] = None,
+        rolling: int = 1,
+    ) -> pd.DataFrame:
+        """
+        Assign the mentions to time windows.
+
+        Args:
+            freq (str, optional): Calendar window, as a pandas period alias: 'W' (weeks) or 'M' (months).
+                Ignored if `periods` is given. Default is 'W'.
+            periods (Dict[str, Tuple[str, str]], optional): Named periods with their first and last day, e.g.
+                {'campanha': ('2022-08-16', '2022-10-02'), 'mandato': ('2023-02-01', '2027-01-31')}. Periods may
+                overlap; mentions outside every period are left out. Default is None.
+            rolling (int, optional): With `freq`, number of consecutive calendar windows each window spans.
+                A window is labelled by its last calendar window; windows not fully covered by the data, at its
+                start or end, are left out. Default is 1.
+
+        Returns:
+            pd.DataFrame: The mentions with a 'window' column; a mention is repeated once per window it falls in.
+        """
+        mentions = self.mentions
+        if periods:
+            frames = [
+                mentions[mentions["date"].between(pd.Timestamp(start), pd.Timestamp(end))].assign(window=name)
+                for name, (start, end) in periods.items()
+            ]
+            return pd.concat(frames, ignore_index=True)
+
+        calendar = mentions["date"].dt.to_period(freq)
+        if rolling <= 1:
+            return mentions.assign(window=calendar.astype(str))
+
+        # A mention of calendar window b belongs to the rolling windows ending at b, b+1, ..., b+rolling-1
+        windows = pd.concat([calendar + shift for shift in range(rolling)])
+        repeated = pd.concat([mentions] * rolling)
+        # Only windows spanning `rolling` calendar windows of data are kept: those ending after the last mention
+        # or starting before the first one would only be partially covered
+        keep = ((windows <= calendar.max()) & (windows - (rolling - 1) >= calendar.min())).to_numpy()
+        return repeated[keep].assign(window=windows[keep].astype(str).to_numpy()).reset_index(drop=True)
+
+    def calculate_indices(
+        self,
+        freq: Optional[str] = "W",
+        periods: Optional[Dict[str, Tuple[str, str]]] = None,
+        rolling: int = 1,
+    ) -> pd.DataFrame:
+        """
+        Calculate the dominance index, G-index, NEM and voting type of every candidate in every window.
+
+        The dominance and concentration indices are computed by the vectorized IndexCalculator functions
+        with the window as a grouping key; the voting types are classified within each window.
+
+        Args:
+            freq (str, optional): See `assign_windows`. Default is 'W'.
+            periods (Dict[str, Tuple[str, str]], optional): See `assign_windows`. Default is None.
+            rolling (int, optional): See `assign_windows`. Default is 1.
+
+        Returns:
+            pd.DataFrame: One row per window and candidate.
+        """
+        data = self.assign_windows(freq, periods, rolling)
+        # Mentions of the same city and candidate on different days of a window are one row of the window
+        keys = ["window", "id_candidato", "id_municipio"]
+        data = (
+            data.groupby(keys, as_index=False)
+            .agg(
+                qt_city_mentions=("qt_city_mentions", "sum"),
+                id_partido=("id_partido", "first"),
+                sg_ue=("sg_ue", "first"),
+            )
+        )
+
+        dominance = IndexCalculator.calculate_dominance_vectorized(data, "twitter", groups=["window"])
+        dominance_agg = dominance.groupby(["window", "id_candidato"])["dominance_index"].sum().reset_index()
+        dominance_agg["dominance_index"] = (dominance_agg["dominance_index"] / 100).round(6)
+
+        concentration = IndexCalculator.calculate_concentration_vectorized(data, "twitter", groups=["window"])
+        indices = dominance_agg.merge(concentration, on=["window", "id_candidato"])
+
+        candidates = self.mentions.drop_duplicates("id_candidato").set_index("id_candidato")
+        for column in ["nm_urna_candidato", "sg_ue", "sg_partido"]:
+            indices[column] = indices["id_candidato"].map(candidates[column])
+
+        # The voting type thresholds depend on the candidates compared, so they are set within each window
+        indices = pd.concat(
+            [Classifier.classify_voting_types_vectorized(window) for _, window in indices.groupby("window")],
+            ignore_index=True,
+        )
+        columns = [
+            "window", "id_candidato", "nm_urna_candidato", "sg_ue", "sg_partido",
+            "dominance_index", "g_index", "nem", "voting_type",
+        ]
+        self.indices = indices[columns].sort_values(["id_candidato", "window"]).reset_index(drop=True)
+        return self.indices
+
+    def run(
+        self,
+        freq: Optional[str] = "W",
+        periods: Optional[Dict[str, Tuple[str, str]]] = None,
+        rolling: int = 1,
+        output_path: str = "./output/twitter/temporal_indices.csv",
+    ) -> pd.DataFrame:
+        """
+        Calculate the indices per window and export them to CSV.
+        """
+        self.calculate_indices(freq, periods, rolling)
+        ExportData(self.indices).to_csv(output_path)
+        return self.indices
@@ -1,6 +1,7 @@
 
 import pandas as pd
 import numpy as np
+from typing import List, Optional, Tuple
 
 class IndexCalculator:
 
@@ -33,10 +34,10 @@ class IndexCalculator:
         )
 
         # Calculate the total valid votes for each municipality and calculate the contribution of each municipality to this total
-        total_valid_votes_municipality = data.groupby("nm_municipio")[
+        total_valid_votes_municipality = data.groupby("id_municipio")[
             valid_votes_col
         ].sum()
-        group["total_votos_validos"] = group["nm_municipio"].map(
+        group["total_votos_validos"] = group["id_municipio"].map(
             total_valid_votes_municipality
         )
 
@@ -98,4 +99,341 @@ class IndexCalculator:
         Returns:
             float: The NEM.
         """
-        return 1 / rae_index
\ No newline at end of file
+        return 1 / rae_index
+
+    @staticmethod
+    def calculate_dominance_vectorized(
+        data: pd.DataFrame, data_source: str = "tse", groups: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Calculate the dominance index of each candidate in each city, as `DataAnalysis.calculate_dominance_index`.
+
+        The municipality and party totals are summed with `np.bincount` over the integer ids instead of grouped
+        transforms. Used by the 'fast' engine.
+
+        Args:
+            data (pd.DataFrame): The data encoded by CodeTable.
+            data_source (str, optional): The type of data. Defaults to "tse".
+            groups (List[str], optional): Columns splitting the data into independent subsets (e.g. time windows);
+                the municipality and party totals are calculated within each subset. Defaults to None.
+
+        Returns:
+            pd.DataFrame: A copy of the data with the dominance columns.
+        """
+        valid_votes_col = (
+            "qt_votos_nom_validos" if data_source == "tse" else "qt_city_mentions"
+        )
+        data = data.copy()
+        votes = data[valid_votes_col].to_numpy(dtype=float)
+        if groups:
+            municipality = data.groupby(list(groups) + ["id_municipio"], sort=False).ngroup().to_numpy()
+            party = data.groupby(list(groups) + ["id_partido"], sort=False).ngroup().to_numpy()
+        else:
+            municipality = data["id_municipio"].to_numpy()
+            party = data["id_partido"].to_numpy()
+
+        # Missing counts are skipped, as in the grouped sums of the reference path
+        weights = np.nan_to_num(votes)
+        total_counts_city = np.bincount(municipality, weights=weights)[municipality]
+        data["total_counts_city"] = total_counts_city.astype(data[valid_votes_col].dtype)
+        data["perc_counts"] = (votes / total_counts_city) * 100
+        data["city_contribution"] = votes / np.bincount(party, weights=weights)[party]
+        data["total_cities"] = data.groupby(list(groups or []) + ["sg_ue"])["id_municipio"].transform("nunique")
+        data["dominance_index"] = (
+            (data["perc_counts"] * data["city_contribution"]) / 100
+        ).round(6)
+        return data
+
+    @staticmethod
+    def calculate_concentration_vectorized(
+        data: pd.DataFrame, data_source: str = "tse", groups: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Calculate the G index and the NEM of every candidate at once, as the per-candidate loop of
+        `DataAnalysis.calculate_concentration` does with `calculate_contributions`, `calculate_g_index`,
+        `calculate_rae_index` and `calculate_nem`. Used by the 'fast' engine.
+
+        Args:
+            data (pd.DataFrame): The data of the candidates (one row per candidate and municipality).
+            data_source (str, optional): The type of data. Defaults to "tse".
+            groups (List[str], optional): Columns splitting the data into independent subsets (e.g. time windows);
+                the municipality totals and the indices are calculated within each subset. Defaults to None.
+
+        Returns:
+            pd.DataFrame: One row per candidate (and subset) with the 'nem' and 'g_index' columns.
+        """
+        valid_votes_col = (
+            "qt_votos_nom_validos" if data_source == "tse" else "qt_city_mentions"
+        )
+        groups = list(groups or [])
+        votes = data[valid_votes_col].astype(float)
+        candidate = [data[column] for column in groups + ["id_candidato"]]
+        municipality = [data[column] for column in groups + ["id_municipio"]]
+
+        total_votos_validos = votes.groupby(municipality).transform("sum")
+        contrib_candidate = votes / votes.groupby(candidate).transform("sum")
+        contrib_municipality = total_votos_validos / total_votos_validos.groupby(candidate).transform("sum")
+
+        g_index = np.square(contrib_candidate - contrib_municipality).groupby(candidate).sum()
+        rae_index = np.square(contrib_candidate).groupby(candidate).sum()
+        # Same guard as calculate_rae_index against a division by zero in the NEM
+        rae_index = rae_index.where(rae_index > 0, 1e-9)
+
+        return pd.DataFrame({"nem": 1 / rae_index, "g_index": g_index}).reset_index()
+
+    @staticmethod
+    def _lorenz_curves(
+        rows: pd.DataFrame, key_cols: List[str], votes: pd.Series, weights: pd.Series, sort_key: pd.Series
+    ) -> pd.DataFrame:
+        """
+        Build the Lorenz curve of every group of rows with one sort and grouped cumulative sums.
+
+        Within each group, the rows are ordered by `sort_key`; the curve's x is the cumulative share of the
+        weights and its y the cumulative share of the votes. The Gini coefficient is one minus twice the area
+        under the curve, summed as trapezoids: 1 - sum(dx * (y + y_previous)).
+
+        Args:
+            rows (pd.DataFrame): The identifiers of the rows, e.g. 'id_candidato' and 'id_municipio'.
+            key_cols (List[str]): The columns of `rows` identifying the groups, e.g. ['id_candidato'].
+            votes (pd.Series): The votes of each row.
+            weights (pd.Series): The weight of each row (1 for the raw Gini).
+            sort_key (pd.Series): The order of the rows along the curve.
+
+        Returns:
+            pd.DataFrame: The rows with the 'x' and 'y' points of the curves and each row's 'gini_term'.
+        """
+        curves = rows.assign(votes=votes.to_numpy(), weight=weights.to_numpy(), sort_key=sort_key.to_numpy())
+        curves = curves.sort_values(key_cols + ["sort_key"], kind="stable")
+        grouped = curves.groupby(key_cols, sort=False)
+        vote_share = curves["votes"] / grouped["votes"].transform("sum")
+        weight_share = curves["weight"] / grouped["weight"].transform("sum")
+        curves["x"] = weight_share.groupby([curves[col] for col in key_cols], sort=False).cumsum()
+        curves["y"] = vote_share.groupby([curves[col] for col in key_cols], sort=False).cumsum()
+        curves["gini_term"] = weight_share * (2 * curves["y"] - vote_share)
+        return curves
+
+    @staticmethod
+    def calculate_gini_vectorized(
+        data: pd.DataFrame,
+        data_source: str = "tse",
+        weight_col: Optional[str] = None,
+        groups: Optional[List[str]] = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Calculate the Gini coefficient of every candidate's votes across municipalities, and the points of the
+        Lorenz curves, for all candidates at once.
+
+        The raw Gini ('gini') treats every municipality alike: it is 0 when the candidate has the same votes in
+        each municipality and tends to 1 when the votes come from a single one. The weighted Gini
+        ('gini_weighted') compares the candidate's votes with the size of the municipalities: municipalities are
+        ordered by votes per unit of weight, and it is 0 when the votes are proportional to the weights.
+
+        Args:
+            data (pd.DataFrame): The data of the candidates (one row per candidate and municipality).
+            data_source (str, optional): The type of data. Defaults to "tse".
+            weight_col (str, optional): Column with each municipality's electorate or population, e.g. 'qt_aptos'.
+                Defaults to the municipalities' total votes (or mentions) in the data.
+            groups (List[str], optional): Columns splitting the data into independent subsets (e.g. time windows).
+                Defaults to None.
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: One row per candidate (and subset) with the 'gini' and
+            'gini_weighted' columns, and the Lorenz curve points: 'curve' ('raw' or 'weighted'), the
+            'id_municipio' added at each point, the cumulative 'municipality_share' (share of the weights for
+            the weighted curve) and 'vote_share'. Every curve starts at (0, 0), which is not listed.
+        """
+        valid_votes_col = (
+            "qt_votos_nom_validos" if data_source == "tse" else "qt_city_mentions"
+        )
+        groups = list(groups or [])
+        key_cols = groups + ["id_candidato"]
+        votes = data[valid_votes_col].astype(float).fillna(0)
+        if weight_col is None:
+            weights = votes.groupby([data[column] for column in groups + ["id_municipio"]]).transform("sum")
+        else:
+            weights = data[weight_col].astype(float)
+
+        rows = data[key_cols + ["id_municipio"]]
+        raw = IndexCalculator._lorenz_curves(rows, key_cols, votes, pd.Series(1.0, index=data.index), votes)
+        # Municipalities without weight (e.g. no votes at all) have no place on the weighted curve
+        weighted_rows = (weights > 0).to_numpy()
+        weighted = IndexCalculator._lorenz_curves(
+            rows[weighted_rows], key_cols, votes[weighted_rows], weights[weighted_rows], (votes / weights)[weighted_rows]
+        )
+
+        gini = pd.DataFrame(
+            {
+                "gini": 1 - raw.groupby(key_cols)["gini_term"].sum(min_count=1),
+                "gini_weighted": 1 - weighted.groupby(key_cols)["gini_term"].sum(min_count=1),
+            }
+        ).reset_index()
+
+        lorenz = pd.concat([raw.assign(curve="raw"), weighted.assign(curve="weighted")], ignore_index=True)
+        lorenz = lorenz.rename(columns={"x": "municipality_share", "y": "vote_share"})
+        lorenz = lorenz[key_cols + ["curve", "id_municipio", "municipality_share", "vote_share"]]
+        return gini, lorenz
+
+    @staticmethod
+    def calculate_theil_decomposition(
+        data: pd.DataFrame,
+        levels: List[str],
+        data_source: str = "tse",
+        weight_col: Optional[str] = None,
+        groups: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Calculate the Theil index (GE(1)) of every candidate's votes across municipalities, decomposed exactly
+        over a hierarchy of nested regions, for all candidates at once.
+
+        With s the candidate's share of its votes in a municipality and p the municipality's share of the
+        weights, the index is T = sum(s * ln(s / p)): 0 when the votes are proportional to the weights, and
+        larger the more they concentrate. With S and P the same shares summed over a region, it splits into
+        one term per level:
+
+            T = sum over the outermost regions of S * ln(S / P)
+              + sum over each inner level's regions of S * ln((S / S_parent) / (P / P_parent))
+              + sum over the municipalities of s * ln((s / S_region) / (p / P_region))
+
+        The first terms measure the concentration between regions, the last one within the innermost regions.
+        Every term is a grouped sum over the same rows, so the components add up to T.
+
+        Args:
+            data (pd.DataFrame): The data of the candidates (one row per candidate and municipality), with the
+                level columns, e.g. as returned by `src.utils.regions.attach_regions`.
+            levels (List[str]): The region columns, from the outermost to the innermost, e.g.
+                ['nm_mesorregiao', 'nm_microrregiao'].
+            data_source (str, optional): The type of data. Defaults to "tse".
+            weight_col (str, optional): Column with each municipality's electorate or population, e.g. 'qt_aptos'.
+                Defaults to the municipalities' total votes (or mentions) in the data.
+            groups (List[str], optional): Columns splitting the data into independent subsets (e.g. time windows).
+                Defaults to None.
+
+        Returns:
+            pd.DataFrame: One row per candidate (and subset) with 'theil', a 'theil_between_<level>' column per
+            level and 'theil_within_<innermost level>', level names without their 'nm_' prefix (e.g.
+            'theil_between_mesorregiao').
+        """
+        valid_votes_col = (
+            "qt_votos_nom_validos" if data_source == "tse" else "qt_city_mentions"
+        )
+        groups = list(groups or [])
+        key_cols = groups + ["id_candidato"]
+        votes = data[valid_votes_col].astype(float).fillna(0)
+        if weight_col is None:
+            weights = votes.groupby([data[column] for column in groups + ["id_municipio"]]).transform("sum")
+        else:
+            weights = data[weight_col].astype(float)
+
+        # Municipalities without weight (e.g. no votes at all) cannot hold any of the candidate's votes
+        rows = (weights > 0).to_numpy()
+        data, votes, weights = data[rows], votes[rows], weights[rows]
+
+        votes, weights = votes.to_numpy(), weights.to_numpy()
+        candidate = data.groupby(key_cols).ngroup().to_numpy()
+        candidate_keys = data.groupby(key_cols).size().index
+
+        def region_sums(codes: np.ndarray):
+            return np.bincount(codes, weights=votes)[codes], np.bincount(codes, weights=weights)[codes]
+
+        # Each row's region at every level is numbered by combining its parent's code with the level's code,
+        # so that all the sums are bincounts over integers, from the candidate itself to the municipality
+        sums = [region_sums(candidate)]
+        codes = candidate
+        for level in levels:
+            level_codes, uniques = pd.factorize(data[level])
+            codes = pd.factorize(codes * (len(uniques) + 1) + level_codes)[0]
+            sums.append(region_sums(codes))
+        sums.append((votes, weights))
+
+        candidate_votes = sums[0][0]
+        s = np.divide(votes, candidate_votes, out=np.zeros_like(votes), where=candidate_votes > 0)
+        names = [level[3:] if level.startswith("nm_") else level for level in levels]
+        components = {}
+        for depth, name in enumerate(names + [None]):
+            (parent_votes, parent_weights), (region_votes, region_weights) = sums[depth : depth + 2]
+            # 0 * ln(0) is 0: rows without votes do not contribute
+            voted = s > 0
+            term = np.zeros_like(s)
+            term[voted] = s[voted] * np.log(
+                (region_votes[voted] / parent_votes[voted]) / (region_weights[voted] / parent_weights[voted])
+            )
+            component = f"theil_between_{name}" if name is not None else f"theil_within_{names[-1]}"
+            components[component] = np.bincount(candidate, weights=term, minlength=len(candidate_keys))
+
+        theil = pd.DataFrame(components, index=candidate_keys)
+        theil.insert(0, "theil", theil.sum(axis=1))
+        # Candidates without any votes have no distribution to measure
+        no_votes = np.bincount(candidate, weights=votes, minlength=len(candidate_keys)) == 0
+        theil[no_votes] = np.nan
+        return theil.reset_index()
+
+    @staticmethod
+    def calculate_municipality_competition(
+        data: pd.DataFrame, data_source: str = "tse", top_k: int = 3
+    ) -> pd.DataFrame:
+        """
+        Calculate competition metrics for every municipality at once.
+
+        This is the municipality-centric counterpart of the candidate indices. For each municipality it computes
+        the Herfindahl-Hirschman index (HHI) of the candidates' vote shares, the effective number of candidates
+        and parties (the inverse of the HHI), the fragmentation of the local vote (1 - HHI) and the top-k
+        candidates by share. Everything is computed with grouped operations over all municipalities together.
+
+        Args:
+            data (pd.DataFrame): The dominance data, with the 'total_counts_city' column already calculated.
+            data_source (str, optional): The type of data. Defaults to "tse".
+            top_k (int, optional): Number of leading candidates reported per municipality. Defaults to 3.
+
+        Returns:
+            pd.DataFrame: One row per municipality with its competition metrics.
+        """
+        valid_votes_col = (
+            "qt_votos_nom_validos" if data_source == "tse" else "qt_city_mentions"
+        )
+
+        municipality = data["id_municipio"]
+        share = data[valid_votes_col] / data["total_counts_city"]
+
+        competition = pd.DataFrame(
+            {
+                "nm_municipio": data["nm_municipio"].groupby(municipality).first(),
+                "total_counts_city": data["total_counts_city"].groupby(municipality).first(),
+                "n_candidates": (data[valid_votes_col] > 0).groupby(municipality).sum(),
+                "hhi_candidates": np.square(share).groupby(municipality).sum(),
+            }
+        )
+
+        # Votes are summed per party within each municipality before computing the party HHI
+        party_votes = data.groupby(["id_municipio", "id_partido"])[valid_votes_col].sum()
+        party_share = party_votes / party_votes.groupby(level="id_municipio").transform("sum")
+        competition["n_parties"] = (party_votes > 0).groupby(level="id_municipio").sum()
+        competition["hhi_parties"] = np.square(party_share).groupby(level="id_municipio").sum()
+
+        # Municipalities without any votes have an HHI of 0; their effective numbers are undefined
+        competition["effective_n_candidates"] = 1 / competition["hhi_candidates"].replace(0, np.nan)
+        competition["effective_n_parties"] = 1 / competition["hhi_parties"].replace(0, np.nan)
+        competition["fragmentation"] = 1 - competition["hhi_candidates"]
+
+        # Rank candidates within each municipality with a single sort, then keep the first k of each group
+        ranked = pd.DataFrame(
+            {
+                "id_municipio": municipality,
+                "nm_urna_candidato": data["nm_urna_candidato"],
+                "share": share,
+            }
+        ).sort_values(["id_municipio", "share"], ascending=[True, False])
+        ranked["rank"] = ranked.groupby("id_municipio").cumcount() + 1
+        top = ranked[ranked["rank"] <= top_k]
+        competition[f"top_{top_k}_combined_share"] = top.groupby("id_municipio")["share"].sum()
+
+        top_wide = top.pivot(index="id_municipio", columns="rank", values=["nm_urna_candidato", "share"])
+        top_wide.columns = [
+            f"top_{rank}_{'candidato' if column == 'nm_urna_candidato' else 'share'}"
+            for column, rank in top_wide.columns
+        ]
+        top_columns = [
+            f"top_{rank}_{suffix}" for rank in range(1, top_k + 1) for suffix in ("candidato", "share")
+        ]
+        competition = competition.join(top_wide.reindex(columns=top_columns))
+
+        return competition.reset_index()
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Module to draw choropleth maps of each candidate's vote share and dominance index per municipality.
+
+The municipality boundaries come from a user-supplied local shapefile or GeoPackage and are joined to the
+election data on the municipality code. Both sides must use the same coding (TSE or IBGE codes); pass the
+column names through `data_code_col` and `geo_code_col`. The reprojected, simplified geometries are cached
+once per UF as WKB, and the base layer is drawn once and only recoloured for each candidate.
+"""
+
+import os
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from pathlib import Path
+from typing import Dict, List, Optional
+from shapely.geometry.polygon import orient
+import matplotlib
+from matplotlib.path import Path as MplPath
+from matplotlib.patches import PathPatch
+from matplotlib.collections import PatchCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+class GeometryCache:
+    """
+    Load municipality boundaries for a UF, reprojected and simplified, caching the result on disk.
+    """
+
+    def __init__(
+        self,
+        boundaries_path: str,
+        geo_code_col: str = "CD_MUN",
+        uf_col: Optional[str] = None,
+        layer: Optional[str] = None,
+        crs: str = "EPSG:5880",
+        simplify_tolerance: float = 200.0,
+        cache_dir: str = "./output/cache/geometries",
+    ):
+        """
+        Args:
+            boundaries_path (str): Path to the shapefile or GeoPackage with the municipality boundaries.
+            geo_code_col (str, optional): Column with the municipality code. Default is 'CD_MUN'.
+            uf_col (str, optional): Column with the UF acronym, used to select the UF from a national file.
+                If None, the file is assumed to contain only the requested UF. Default is None.
+            layer (str, optional): Layer to read from a GeoPackage. Default is None.
+            crs (str, optional): Projected CRS used for the maps. Default is 'EPSG:5880' (SIRGAS 2000 / Brazil Polyconic).
+            simplify_tolerance (float, optional): Simplification tolerance in CRS units (meters). Default is 200.
+            cache_dir (str, optional): Directory where the cached geometries are stored.
+        """
+        self.boundaries_path = Path(boundaries_path)
+        self.geo_code_col = geo_code_col
+        self.uf_col = uf_col
+        self.layer = layer
+        self.crs = crs
+        self.simplify_tolerance = simplify_tolerance
+        self.cache_dir = Path(cache_dir)
+
+    def _cache_path(self, uf: str) -> Path:
+        # Every parameter of the read is part of the key, so that reading the same file with another layer,
+        # code column or UF column never returns the geometries cached by a previous read
+        parameters = [
+            str(self.boundaries_path.resolve()),
+            self.layer,
+            self.geo_code_col,
+            self.uf_col,
+            self.crs,
+            f"{self.simplify_tolerance:g}",
+        ]
+        digest = hashlib.sha256(repr(parameters).encode()).hexdigest()[:16]
+        return self.cache_dir / f"{self.boundaries_path.stem}_{uf.lower()}_{digest}.pkl"
+
+    def load(self, uf: str) -> gpd.GeoDataFrame:
+        """
+        Return the municipality geometries of a UF, from the cache when it is up to date.
+
+        Args:
+            uf (str): The federal unit acronym.
+
+        Returns:
+            gpd.GeoDataFrame: One row per municipality with 'code' and 'geometry' columns.
+        """
+        cache_path = self._cache_path(uf)
+        source_mtime = os.path.getmtime(self.boundaries_path)
+
+        if cache_path.is_file():
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached["source_mtime"] == source_mtime:
+                return gpd.GeoDataFrame(
+                    {"code": cached["codes"]}, geometry=shapely.from_wkb(cached["wkb"]), crs=cached["crs"]
+                )
+
+        boundaries = gpd.read_file(self.boundaries_path, layer=self.layer)
+        if self.uf_col is not None:
+            boundaries = boundaries[boundaries[self.uf_col].astype(str).str.upper() == uf.upper()]
+        boundaries = boundaries.to_crs(self.crs)
+
+        geometries = gpd.GeoDataFrame(
+            {"code": boundaries[self.geo_code_col].astype(str).to_numpy()},
+            geometry=boundaries.geometry.simplify(self.simplify_tolerance, preserve_topology=True).to_numpy(),
+            crs=self.crs,
+        )
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "wb") as f:
+            pickle.dump(
+                {
+                    "source_mtime": source_mtime,
+                    "crs": self.crs,
+                    "codes": geometries["code"].to_numpy(),
+                    "wkb": shapely.to_wkb(geometries.geometry.to_numpy()),
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        return geometries
+
+
+def _geometry_to_path(geometry) -> MplPath:
+    """
+    Convert a (multi)polygon to a single compound matplotlib path, keeping holes.
+    """
+    polygons = getattr(geometry, "geoms", [geometry])
+    rings = []
+    for polygon in polygons:
+        polygon = orient(polygon, 1.0)  # exterior counter-clockwise, holes clockwise
+        for ring in [polygon.exterior, *polygon.interiors]:
+            vertices = np.asarray(ring.coords)[:, :2]
+            codes = np.full(len(vertices), MplPath.LINETO, dtype=MplPath.code_type)
+            codes[0] = MplPath.MOVETO
+            codes[-1] = MplPath.CLOSEPOLY
+            rings.append(MplPath(vertices, codes))
+    return MplPath.make_compound_path(*rings)
+
+
+class ChoroplethMap:
+    """
+    Class to render choropleth maps of the candidates' municipality-level indices.
+    """
+
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        geometry_cache: GeometryCache,
+        data_code_col: str = "cd_municipio",
+        save_path=None,
+        output_dir: Optional[str] = None,
+    ):
+        """
+        Args:
+            data (pd.DataFrame): The dominance data (one row per candidate and municipality).
+            geometry_cache (GeometryCache): Source of the municipality boundaries.
+            data_code_col (str, optional): Column of `data` with the municipality code. Default is 'cd_municipio'.
+            save_path (str, optional): Base directory of the outputs. Defaults to the current directory.
+            output_dir (str, optional): Directory of the outputs of the data source, e.g. './output/2022/SP/tse'.
+                Defaults to <save_path>/output/<data_source>.
+        """
+        self.data = data
+        self.geometry_cache = geometry_cache
+        self.data_code_col = data_code_col
+        if save_path is None:
+            save_path = os.getcwd()
+        self.save_path = Path(save_path) / "output"
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+
+    def create_file_path(self, candidate_name, uf, political_party, column, data_source):
+        source_dir = self.output_dir if self.output_dir is not None else self.save_path / data_source
+        dir_path = source_dir / "maps"
+        dir_path.mkdir(parents=True, exist_ok=True)
+
+        clean_candidate_name = "".join(
+            e for e in candidate_name.replace(" ", "_") if e.isalnum() or e == "_"
+        )
+        clean_uf = "".join(e for e in uf if e.isalnum())
+        clean_party = "".join(e for e in political_party if e.isalnum())
+
+        return dir_path / f"{clean_candidate_name}_{clean_party}_{clean_uf}_{column}_map.png"
+
+    def render_candidates(
+        self,
+        candidates: Optional[List[int]] = None,
+        columns: List[str] = ("perc_counts", "dominance_index"),
+        data_source: str = "tse",
+    ) -> List[Path]:
+        """
+        Render one map per candidate and column, reusing the same figure and base layer for the whole batch.
+
+        Args:
+            candidates (List[int], optional): Ids of the candidates to map. Defaults to the elected candidates for
+                TSE data and to all candidates for Twitter data.
+            columns (List[str], optional): Columns to map. Defaults to the vote share and the dominance index.
+            data_source (str, optional): The type of data, either 'tse' or 'twitter'. Default is 'tse'.
+
+        Returns:
+            List[Path]: The paths of the saved maps.
+        """
+        data = self.data
+        if candidates is None:
+            if data_source == "tse":
+                data = data[data["ds_sit_totalizacao"] == "Eleito"]
+            candidates = data["id_candidato"].unique().tolist()
+
+        uf = str(self.data["sg_ue"].dropna().iloc[0])
+        geometries = self.geometry_cache.load(uf)
+
+        # Position of each data row in the geometry order; rows without a matching geometry are dropped
+        code_position = pd.Series(np.arange(len(geometries)), index=geometries["code"].to_numpy())
+        data = data.assign(
+            _position=data[self.data_code_col].astype(str).map(code_position)
+        ).dropna(subset=["_position"])
+        by_candidate: Dict[int, pd.DataFrame] = dict(tuple(data.groupby("id_candidato", sort=False)))
+
+        # The base layer is built once: one compound path per municipality, recoloured for every map
+        fig = Figure(figsize=(10, 8))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        cmap = matplotlib.colormaps["Reds"].copy()
+        cmap.set_bad("#e6e6e6")
+        collection = PatchCollection(
+            [PathPatch(_geometry_to_path(geometry)) for geometry in geometries.geometry],
+            cmap=cmap,
+            edgecolor="white",
+            linewidth=0.2,
+        )
+        collection.set_array(np.ma.masked_all(len(geometries)))
+        ax.add_collection(collection)
+        minx, miny, maxx, maxy = geometries.total_bounds
+        ax.set_xlim(minx, maxx)
+        ax.set_ylim(miny, maxy)
+        ax.set_aspect("equal")
+        ax.set_axis_off()
+        colorbar = fig.colorbar(collection, ax=ax, shrink=0.7)
+        fig.tight_layout()
+
+        saved = []
+        for candidate in candidates:
+            candidate_data = by_candidate.get(candidate)
+            if candidate_data is None:
+                print(f"No mapped municipalities for candidate {candidate}.")
+                continue
+            name = candidate_data["nm_urna_candidato"].iloc[0]
+            positions = candidate_data["_position"].to_numpy(dtype=int)
+            sg_partido = candidate_data["sg_partido"].dropna().values[0]
+            sg_ue = candidate_data["sg_ue"].dropna().values[0]
+
+            for column in columns:
+                values = np.full(len(geometries), np.nan)
+                values[positions] = candidate_data[column].to_numpy(dtype=float)
+                collection.set_array(np.ma.masked_invalid(values))
+                collection.set_clim(0, np.nanmax(values) or 1)
+                colorbar.set_label(column)
+                ax.set_title(f"{name} ({sg_partido}/{sg_ue}), {column}, {data_source}")
+
+                file_path = self.create_file_path(name, sg_ue, sg_partido, column, data_source)
+                fig.savefig(file_path, dpi=150)
+                saved.append(file_path)
+                print(f"Map saved as: {file_path}")
+
+        return saved
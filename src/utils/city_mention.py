@@ -1,63 +1,242 @@
 import pandas as pd
-from typing import List
+from typing import TYPE_CHECKING, Dict, List, Optional
 from unidecode import unidecode
 from .export_data import ExportData  # Assuming this is the correct import for your setup
+from .code_table import CodeTable, normalize_names
+from .progress import ProgressReporter
+from .tweet_index import TweetIndex
+
+# The deduplicator is only passed in by callers; it is not imported at runtime, so that analyses without
+# deduplication never load it
+if TYPE_CHECKING:
+    from .dedup import TweetDeduplicator
 
 class CityMentionAnalyzer:
     """
     This class is used to analyze city mentions in tweets data.
     """
 
-    def __init__(self, tweets_file_path: str, city_names: List[str]):
+    def __init__(
+        self, tweets_file_path: str, city_names: List[str], progress: Optional[ProgressReporter] = None
+    ):
         """
         Initialize CityMentionAnalyzer with the file path to tweets data and a list of city names.
 
         Args:
             tweets_file_path (str): Path to the CSV file containing tweets data.
             city_names (List[str]): List of city names.
+            progress (ProgressReporter, optional): Receives the progress events of the tweet scan.
+                Defaults to a reporter without sinks.
         """
         self.tweets_file_path = tweets_file_path
         self.city_names = city_names
+        self.progress = progress if progress is not None else ProgressReporter()
+        self.dedup_report: Optional[pd.DataFrame] = None
 
-    def identify_city_mentions(self) -> pd.DataFrame:
+    def identify_city_mentions(self, deduplicator: Optional['TweetDeduplicator'] = None) -> pd.DataFrame:
         """
         Identify city mentions in the tweets.
 
+        Args:
+            deduplicator (TweetDeduplicator, optional): If given, retweets, repeated and near-duplicate tweets are
+                removed before counting, and the tweets and mentions each candidate lost are stored in
+                `self.dedup_report`. Default is None.
+
         Returns:
             pd.DataFrame: DataFrame with city mentions information.
         """
+        tweets_df = self._read_tweets(deduplicator)
+        return self._scan_city_mentions(tweets_df, "city_mentions")
+
+    def _read_tweets(self, deduplicator: Optional['TweetDeduplicator'] = None) -> pd.DataFrame:
+        """
+        Read the tweets, removing the duplicated ones if a deduplicator is given.
+        """
         tweets_df = pd.read_csv(self.tweets_file_path)
+
+        if deduplicator is not None:
+            with self.progress.stage("deduplication", total=len(tweets_df)) as stage:
+                tweets_df, removed_df = deduplicator.deduplicate(tweets_df)
+                stage.advance(stage.total)
+            # Counted with the vectorized per-city search: deduplication can remove most of a retweet-heavy corpus
+            lost = self._match_cities(
+                removed_df, {'nm_urna_candidato': removed_df['nm_urna_candidato']}, "removed_city_mentions"
+            )
+            lost = lost.groupby('nm_urna_candidato').size()
+            self.dedup_report = deduplicator.report
+            self.dedup_report['mentions_lost'] = (
+                self.dedup_report['nm_urna_candidato'].map(lost).fillna(0).astype(int)
+            )
+            print(self.dedup_report.to_string(index=False))
+
+        return tweets_df
+
+    def identify_dated_city_mentions(
+        self, deduplicator: Optional['TweetDeduplicator'] = None, date_col: str = 'date'
+    ) -> pd.DataFrame:
+        """
+        Identify city mentions in the tweets, keeping the day of each mention so that they can be bucketed in
+        time windows (see `src.main.temporal.TemporalMentionAnalysis`).
+
+        Cities are matched as in `identify_city_mentions`, but with one vectorized substring search per city
+        over all tweets instead of a loop over the tweets.
+
+        Args:
+            deduplicator (TweetDeduplicator, optional): If given, duplicated tweets are removed first.
+            date_col (str, optional): Column with the date of the tweets. Default is 'date'.
+
+        Returns:
+            pd.DataFrame: The 'date' (day), 'nm_municipio', 'nm_urna_candidato' and 'qt_city_mentions' of every
+            day, city and candidate with at least one mention. Tweets without a valid date are left out.
+        """
+        tweets_df = self._read_tweets(deduplicator)
+        dates = pd.to_datetime(tweets_df[date_col], errors='coerce', utc=True).dt.tz_localize(None).dt.normalize()
+        mentions = self._match_cities(
+            tweets_df, {'date': dates, 'nm_urna_candidato': tweets_df['nm_urna_candidato']}, "dated_city_mentions"
+        )
+        return (
+            mentions.groupby(['date', 'nm_municipio', 'nm_urna_candidato'])
+            .size()
+            .rename('qt_city_mentions')
+            .reset_index()
+        )
+
+    def _match_cities(self, tweets_df: pd.DataFrame, columns: Dict[str, pd.Series], stage_name: str) -> pd.DataFrame:
+        """
+        Find the cities mentioned in each tweet, with one vectorized, accent and case insensitive substring search
+        per city over all tweets.
+
+        Args:
+            tweets_df (pd.DataFrame): The tweets, with a 'content' column.
+            columns (Dict[str, pd.Series]): Columns of the tweets to keep with each mention, aligned with `tweets_df`.
+            stage_name (str): Name of the progress stage.
+
+        Returns:
+            pd.DataFrame: One row per tweet and mentioned city, with 'nm_municipio' and the given columns.
+        """
+        content = tweets_df['content'].fillna('').map(unidecode).str.lower()
+        values = {name: column.to_numpy() for name, column in columns.items()}
+
+        frames = []
+        with self.progress.stage(stage_name, total=len(self.city_names)) as stage:
+            for city in self.city_names:
+                mentioned = content.str.contains(unidecode(city).lower(), regex=False).to_numpy()
+                if mentioned.any():
+                    frames.append(
+                        pd.DataFrame(
+                            {'nm_municipio': city, **{name: value[mentioned] for name, value in values.items()}}
+                        )
+                    )
+                stage.advance()
+
+        if not frames:
+            return pd.DataFrame(columns=['nm_municipio'] + list(columns))
+        return pd.concat(frames, ignore_index=True)
+
+    def _scan_city_mentions(self, tweets_df: pd.DataFrame, stage_name: str) -> pd.DataFrame:
+        """
+        Count the mentions of each city in the tweets of each candidate, scanning every tweet.
+        """
+        tweets_df = tweets_df.copy()
         tweets_df['content'] = tweets_df['content'].apply(unidecode)
 
         results = pd.DataFrame(columns=['nm_municipio', 'nm_urna_candidato', 'qt_city_mentions'])
-        for index, row in tweets_df.iterrows():
-            tweet_content = row['content']
-            deputy_name = row['nm_urna_candidato']
+        with self.progress.stage(stage_name, total=len(tweets_df)) as stage:
+            for index, row in tweets_df.iterrows():
+                tweet_content = row['content']
+                deputy_name = row['nm_urna_candidato']
 
-            for city in self.city_names:
-                city_unaccented = unidecode(city)
-                if city_unaccented.lower() in tweet_content.lower():
-                    existing_entry = results.loc[(results['nm_municipio'] == city) & (results['nm_urna_candidato'] == deputy_name)]
-                    if not existing_entry.empty:
-                        results.loc[(results['nm_municipio'] == city) & (results['nm_urna_candidato'] == deputy_name), 'qt_city_mentions'] += 1
-                    else:
-                        results = results.append({'nm_municipio': city, 'nm_urna_candidato': deputy_name, 'qt_city_mentions': 1}, ignore_index=True)
+                for city in self.city_names:
+                    city_unaccented = unidecode(city)
+                    if city_unaccented.lower() in tweet_content.lower():
+                        existing_entry = results.loc[(results['nm_municipio'] == city) & (results['nm_urna_candidato'] == deputy_name)]
+                        if not existing_entry.empty:
+                            results.loc[(results['nm_municipio'] == city) & (results['nm_urna_candidato'] == deputy_name), 'qt_city_mentions'] += 1
+                        else:
+                            results = results.append({'nm_municipio': city, 'nm_urna_candidato': deputy_name, 'qt_city_mentions': 1}, ignore_index=True)
+                stage.advance()
         return results
 
+    def index_tweets(self, index: TweetIndex) -> int:
+        """
+        Add the tweets of the tweets file to an index, skipping the ones already indexed, and save the index.
+        This is the only step that reads the tweets; mentions are then counted with `count_city_mentions`.
+
+        Args:
+            index (TweetIndex): The tweet index, e.g. TweetIndex('data/2022/SP/tweets.idx').
+
+        Returns:
+            int: Number of tweets added to the index.
+        """
+        tweets_df = pd.read_csv(self.tweets_file_path)
+        with self.progress.stage("tweet_index", total=len(tweets_df)) as stage:
+            added = index.add_tweets(tweets_df)
+            index.save()
+            stage.advance(stage.total)
+        print(f"{added} new tweets indexed ({len(index)} in the index).")
+        return added
+
+    def count_city_mentions(
+        self, index: TweetIndex, aliases: Optional[Dict[str, List[str]]] = None
+    ) -> pd.DataFrame:
+        """
+        Count the city mentions of each candidate's tweets with index lookups.
+
+        Unlike `identify_city_mentions`, which looks for the city name anywhere in the text, names and aliases
+        are matched on whole words, so that e.g. 'Ita' does not match 'Itapetininga'.
+
+        Args:
+            index (TweetIndex): The tweet index.
+            aliases (Dict[str, List[str]], optional): Other names of the cities, e.g. {'São Paulo': ['Sampa']}.
+
+        Returns:
+            pd.DataFrame: DataFrame with city mentions information.
+        """
+        aliases = aliases or {}
+        return index.count_mentions({city: list(aliases.get(city, [])) for city in self.city_names})
+
     @staticmethod
-    def merge_with_main_data(df: pd.DataFrame, main_data_file_path: str) -> pd.DataFrame:
+    def merge_with_main_data(
+        df: pd.DataFrame, main_data_file_path: str, code_table: Optional[CodeTable] = None
+    ) -> pd.DataFrame:
         """
-        Merge DataFrame with main data based on the 'deputy_name' column.
+        Merge DataFrame with main data based on the candidate's normalized ballot name, so that accent and
+        case differences between the Twitter and TSE spellings do not break the join.
+
+        Different candidates can share a ballot name. If `df` has the candidates' UF (sg_ue) or party
+        (sg_partido), these are part of the join key; names that are still ambiguous are not guessed, and
+        their rows are left without UF and party.
 
         Args:
             df (pd.DataFrame): DataFrame with city mentions information.
             main_data_file_path (str): Path to the main data file.
+            code_table (CodeTable, optional): The election's code table. If given, the merged rows are encoded
+                with the same candidate, municipality and party ids as the TSE data.
 
         Returns:
             pd.DataFrame: Merged DataFrame.
         """
         main_data_df = pd.read_csv(main_data_file_path)
-        return df.merge(main_data_df[['nm_urna_candidato', 'sg_ue', 'sg_partido']], on='nm_urna_candidato', how='left')
+        main_data_df['nm_urna_normalizado'] = normalize_names(main_data_df['nm_urna_candidato'])
+        main_data_df = main_data_df.drop_duplicates(['nm_urna_normalizado', 'sg_ue', 'sg_partido'])
+
+        keys = ['nm_urna_normalizado'] + [column for column in ('sg_ue', 'sg_partido') if column in df.columns]
+        ambiguous = main_data_df.duplicated(keys, keep=False)
+        if ambiguous.any():
+            names = sorted(main_data_df.loc[ambiguous, 'nm_urna_candidato'].unique())
+            print(
+                f"{len(names)} ballot names match several candidates and are left unmatched: "
+                f"{', '.join(names[:10])}{' ...' if len(names) > 10 else ''}"
+            )
+            main_data_df = main_data_df[~ambiguous]
+
+        df = df.assign(nm_urna_normalizado=normalize_names(df['nm_urna_candidato']))
+        merged = df.merge(
+            main_data_df[list(dict.fromkeys(keys + ['sg_ue', 'sg_partido']))], on=keys, how='left'
+        )
+        if code_table is not None:
+            merged = code_table.encode(merged)
+        return merged
 
 # # Usage
 # analyzer = CityMentionAnalyzer('data/2022/sp_tweets.csv', city_names)
@@ -15,7 +15,6 @@ Quadrant 4 - Dispersa-compartilhada (Low dominance, Low inequality): Candidates
 """
 
 import pandas as pd
-import matplotlib.pyplot as plt
 from typing import Tuple, List
 import pandas as pd
 import numpy as np
@@ -80,3 +79,35 @@ class Classifier:
         data_copy.loc[(data_copy['dominance_index'] < low_dominance) & (np.log(data_copy['nem']) < low_fragmentation), 'voting_type'] = 'Concentrada Compartilhada'
 
         return data_copy
+
+    @staticmethod
+    def classify_voting_types_vectorized(data) -> pd.DataFrame:
+        """
+        Classify candidates into the four voting types with the same thresholds as `classify_voting_types`,
+        taking the logarithm of the NEM once and assigning all types with a single `np.select`. Used by the
+        'fast' engine.
+
+        Returns:
+            pd.DataFrame: A DataFrame with an added 'voting_type' column, classifying the voting types for each candidate.
+        """
+        data_copy = data.copy()
+        dominance = data_copy['dominance_index']
+        nem_log = np.log(data_copy['nem'])
+
+        std_dev = 0.0000005
+        high_dominance = dominance.mean() + (std_dev * dominance.std())
+        low_dominance = dominance.mean() - (std_dev * dominance.std())
+        high_fragmentation = nem_log.mean() + (std_dev * nem_log.std())
+        low_fragmentation = nem_log.mean() - (std_dev * nem_log.std())
+
+        data_copy['voting_type'] = np.select(
+            [
+                (dominance > high_dominance) & (nem_log > high_fragmentation),
+                (dominance > high_dominance) & (nem_log < low_fragmentation),
+                (dominance < low_dominance) & (nem_log > high_fragmentation),
+                (dominance < low_dominance) & (nem_log < low_fragmentation),
+            ],
+            ['Dispersa Dominante', 'Concentrada Dominante', 'Dispersa Compartilhada', 'Concentrada Compartilhada'],
+            default='Unclassified',
+        )
+        return data_copy
@@ -0,0 +1,179 @@
+"""
+Module to assign stable integer ids to candidates, municipalities and parties.
+
+Ballot names (nm_urna_candidato) are not unique: homonymous candidates of different parties collide, and
+grouping or joining on free-text strings is slower than on integers. A code table is kept per election and
+assigns each entity an id the first time it is seen:
+
+- candidates are keyed on the UF, the TSE candidate number and the party;
+- municipalities are keyed on the TSE municipality code;
+- parties are keyed on their acronym.
+
+Sources without those codes (e.g. Twitter mentions) are matched on accent-insensitive normalized names.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import List, Optional
+from unidecode import unidecode
+
+
+_NON_ALPHANUMERIC = re.compile(r"[^A-Z0-9]+")
+
+# Key columns holding numeric TSE codes; they are compared as integers, whatever dtype they were read with
+_CODE_COLUMNS = {"nr_candidato", "cd_municipio"}
+
+
+def normalize_name(value) -> str:
+    """
+    Normalize a name so that accent, case, punctuation and spacing differences do not matter.
+
+    Args:
+        value: The raw name, e.g. 'São João d'Aliança'.
+
+    Returns:
+        str: The normalized name, e.g. 'SAO JOAO D ALIANCA'.
+    """
+    if pd.isna(value):
+        return ""
+    return _NON_ALPHANUMERIC.sub(" ", unidecode(str(value)).upper()).strip()
+
+
+def normalize_names(values: pd.Series) -> pd.Series:
+    """
+    Normalize a column of names, calling `normalize_name` once per distinct value.
+    """
+    unique = pd.unique(values)
+    return values.map(dict(zip(unique, (normalize_name(value) for value in unique))))
+
+
+def _key_column(name: str, values: pd.Series) -> pd.Series:
+    if name in _CODE_COLUMNS:
+        return pd.to_numeric(values, errors="coerce").astype("Int64").astype(str)
+    return values.astype(str).str.strip().str.upper()
+
+
+class CodeTable:
+    """
+    Persistent per-election table of candidate, municipality and party ids.
+    """
+
+    TABLES = {
+        "candidates": (
+            "id_candidato",
+            ["sg_ue", "nr_candidato", "sg_partido", "nm_urna_candidato", "nm_urna_normalizado"],
+        ),
+        "municipalities": (
+            "id_municipio",
+            ["sg_ue", "cd_municipio", "nm_municipio", "nm_municipio_normalizado"],
+        ),
+        "parties": ("id_partido", ["sg_partido"]),
+    }
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Args:
+            directory (str, optional): Directory where the tables are stored as CSV files, e.g.
+                './data/2022/codes'. If None, the table only lives in memory. Default is None.
+        """
+        self.directory = Path(directory) if directory is not None else None
+        self.tables = {}
+        for name, (id_col, columns) in self.TABLES.items():
+            path = self._path(name)
+            if path is not None and path.is_file():
+                self.tables[name] = pd.read_csv(path)
+            else:
+                self.tables[name] = pd.DataFrame(columns=[id_col] + columns)
+
+    def _path(self, name: str) -> Optional[Path]:
+        return self.directory / f"{name}.csv" if self.directory is not None else None
+
+    def save(self) -> None:
+        """
+        Write the tables to the table directory, if any.
+        """
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for name, table in self.tables.items():
+            table.to_csv(self._path(name), index=False)
+
+    def copy(self) -> "CodeTable":
+        """
+        Return an in-memory copy of the table, which never writes to the table directory. Worker processes
+        encoding data whose ids were already assigned use such a copy, so that only one process writes the files.
+        """
+        table = CodeTable()
+        table.tables = dict(self.tables)
+        return table
+
+    def _assign(self, name: str, data: pd.DataFrame, key_cols: List[str]) -> pd.Series:
+        """
+        Look up the ids of the rows of `data` by `key_cols`, assigning new ids to unseen keys.
+
+        Args:
+            name (str): The table, 'candidates', 'municipalities' or 'parties'.
+            data (pd.DataFrame): The rows to encode.
+            key_cols (List[str]): The columns identifying an entity.
+
+        Returns:
+            pd.Series: The ids, aligned with `data`.
+        """
+        id_col, columns = self.TABLES[name]
+        table = self.tables[name]
+
+        keys = pd.DataFrame({col: _key_column(col, data[col]) for col in key_cols}, index=data.index)
+        table_keys = pd.DataFrame({col: _key_column(col, table[col]) for col in key_cols})
+        table_keys[id_col] = table[id_col].to_numpy()
+        # When a name-only key matches several entries (homonyms), the oldest id wins
+        table_keys = table_keys.drop_duplicates(key_cols)
+
+        unique = keys.drop_duplicates().merge(table_keys, on=key_cols, how="left")
+        missing = unique[id_col].isna().to_numpy()
+        if missing.any():
+            next_id = int(table[id_col].max()) + 1 if len(table) else 0
+            unique.loc[missing, id_col] = np.arange(next_id, next_id + missing.sum())
+
+            # New entries keep the attributes of their first occurrence in the data
+            first_rows = data.loc[keys.drop_duplicates().index[missing]]
+            new_entries = first_rows.reindex(columns=columns)
+            new_entries.insert(0, id_col, unique.loc[missing, id_col].to_numpy())
+            self.tables[name] = pd.concat([table, new_entries], ignore_index=True)
+
+        ids = keys.merge(unique, on=key_cols, how="left")[id_col]
+        return pd.Series(ids.to_numpy(dtype=np.int64), index=data.index, name=id_col)
+
+    def encode(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add the 'id_candidato', 'id_municipio' and 'id_partido' columns to a DataFrame, plus the normalized
+        names used to match sources without TSE codes. The table is saved if it is persistent.
+
+        Args:
+            data (pd.DataFrame): TSE results or Twitter mentions, one row per candidate and municipality.
+
+        Returns:
+            pd.DataFrame: A copy of the data with the id columns.
+        """
+        data = data.copy()
+        data["nm_urna_normalizado"] = normalize_names(data["nm_urna_candidato"])
+        data["nm_municipio_normalizado"] = normalize_names(data["nm_municipio"])
+
+        if "sg_partido" in data.columns:
+            data["id_partido"] = self._assign("parties", data, ["sg_partido"])
+
+        if "nr_candidato" in data.columns:
+            candidate_keys = ["sg_ue", "nr_candidato", "sg_partido"]
+        else:
+            candidate_keys = [col for col in ["sg_ue", "nm_urna_normalizado", "sg_partido"] if col in data.columns]
+        data["id_candidato"] = self._assign("candidates", data, candidate_keys)
+
+        if "cd_municipio" in data.columns:
+            municipality_keys = ["cd_municipio"]
+        else:
+            municipality_keys = [col for col in ["sg_ue", "nm_municipio_normalizado"] if col in data.columns]
+        data["id_municipio"] = self._assign("municipalities", data, municipality_keys)
+
+        self.save()
+        return data
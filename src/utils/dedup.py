@@ -0,0 +1,199 @@
+"""
+Module to remove duplicated and near-duplicated tweets before counting city mentions.
+
+Retweets, copy-pasted campaign posts and tweets collected twice inflate the mention counts. Tweets are first
+normalized (retweet prefix, links and mentions removed, accents and case ignored) and exact duplicates are
+dropped by hash. Near-duplicates are then found with MinHash signatures of word shingles and LSH banding:
+tweets sharing a band bucket are compared with their bucket's first tweet, pairs whose estimated Jaccard
+similarity reaches the threshold are linked, and only the earliest tweet of each linked group is kept.
+Signatures are computed in chunks and each band is grouped once, so the cost grows linearly with the corpus.
+"""
+
+import re
+import zlib
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Tuple
+from unidecode import unidecode
+
+
+_RETWEET = re.compile(r"^\s*rt\s+@\w+:?\s*", re.IGNORECASE)
+_LINK_OR_MENTION = re.compile(r"https?://\S+|www\.\S+|@\w+")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Largest prime below 2**32. With 32-bit shingle hashes and coefficients, (a * x + b) wraps around it many
+# times, which mixes the hashes well, and never overflows uint64
+_PRIME = np.uint64(4294967291)
+
+
+def normalize_tweet(text) -> str:
+    """
+    Normalize a tweet for duplicate detection.
+
+    Args:
+        text: The tweet, e.g. 'RT @fulano: Obrigado, Campinas! https://t.co/xyz'.
+
+    Returns:
+        str: The normalized text, e.g. 'obrigado campinas'.
+    """
+    if pd.isna(text):
+        return ""
+    text = _LINK_OR_MENTION.sub(" ", _RETWEET.sub("", str(text)))
+    return " ".join(_TOKEN.findall(unidecode(text).lower()))
+
+
+class TweetDeduplicator:
+    """
+    Class to remove exact and near-duplicate tweets, per candidate or across all candidates.
+    """
+
+    SCOPES = ("candidate", "global")
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle_size: int = 3,
+        scope: str = "candidate",
+        content_col: str = "content",
+        candidate_col: str = "nm_urna_candidato",
+        chunk_size: int = 2000,
+        seed: int = 1,
+    ):
+        """
+        Args:
+            threshold (float, optional): Estimated Jaccard similarity of the word shingles above which two tweets
+                are near-duplicates. Default is 0.8.
+            num_perm (int, optional): Length of the MinHash signatures. Default is 128.
+            bands (int, optional): Number of LSH bands; must divide `num_perm`. More bands find more candidate
+                pairs at lower similarities. Default is 32.
+            shingle_size (int, optional): Number of words per shingle. Default is 3.
+            scope (str, optional): 'candidate' only compares the tweets of the same candidate, 'global' compares
+                all tweets, so a text posted for several candidates is kept once. Default is 'candidate'.
+            content_col (str, optional): Column with the text of the tweets. Default is 'content'.
+            candidate_col (str, optional): Column with the candidate of the tweets. Default is 'nm_urna_candidato'.
+            chunk_size (int, optional): Number of tweets whose signatures are computed together. Default is 2000.
+            seed (int, optional): Seed of the MinHash permutations. Default is 1.
+        """
+        if scope not in self.SCOPES:
+            raise ValueError(f"Invalid scope '{scope}'. Valid options are {', '.join(self.SCOPES)}.")
+        if num_perm % bands:
+            raise ValueError("The number of bands must divide the signature length (num_perm).")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.scope = scope
+        self.content_col = content_col
+        self.candidate_col = candidate_col
+        self.chunk_size = chunk_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+        self.report: Optional[pd.DataFrame] = None
+
+    def _shingles(self, text: str) -> List[int]:
+        tokens = text.split()
+        size = min(self.shingle_size, len(tokens))
+        return [
+            zlib.crc32(" ".join(tokens[i : i + size]).encode("utf-8"))
+            for i in range(len(tokens) - size + 1)
+        ] if size else []
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """
+        Compute the MinHash signatures of normalized texts.
+
+        Args:
+            texts (List[str]): The normalized texts. They must not be empty.
+
+        Returns:
+            np.ndarray: The signatures (texts x num_perm).
+        """
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(texts), self.chunk_size):
+            shingles = [self._shingles(text) for text in texts[start : start + self.chunk_size]]
+            lengths = np.array([len(s) for s in shingles])
+            values = np.fromiter((h for s in shingles for h in s), dtype=np.uint64, count=lengths.sum())
+            hashes = (self._a * (values[None, :] % _PRIME) + self._b) % _PRIME
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            signatures[start : start + len(shingles)] = np.minimum.reduceat(hashes, offsets, axis=1).T
+        return signatures
+
+    def _near_duplicates(self, signatures: np.ndarray, groups: np.ndarray) -> np.ndarray:
+        """
+        Link near-duplicate tweets through the LSH bands and flag all but the first tweet of each linked group.
+
+        Args:
+            signatures (np.ndarray): The MinHash signatures, in the order of the tweets.
+            groups (np.ndarray): The comparison scope of each tweet (candidate code, or 0 for the global scope).
+
+        Returns:
+            np.ndarray: True for the tweets to remove.
+        """
+        n = len(signatures)
+        rows = self.num_perm // self.bands
+        index = pd.Series(np.arange(n))
+        sources, targets = [], []
+        for band in range(self.bands):
+            key = np.zeros(n, dtype=np.uint64)
+            for column in signatures[:, band * rows : (band + 1) * rows].T:
+                key = key * np.uint64(1000003) ^ column
+            # Each tweet is compared with the first tweet of its bucket
+            first = index.groupby([groups, key]).transform("min").to_numpy()
+            candidates = np.flatnonzero(first != index.to_numpy())
+            similarity = (signatures[candidates] == signatures[first[candidates]]).mean(axis=1)
+            linked = candidates[similarity >= self.threshold]
+            sources.append(linked)
+            targets.append(first[linked])
+
+        # scipy is only needed here; it is imported lazily so that importing this module stays cheap
+        from scipy import sparse
+        from scipy.sparse.csgraph import connected_components
+
+        sources, targets = np.concatenate(sources), np.concatenate(targets)
+        graph = sparse.coo_matrix((np.ones(len(sources)), (sources, targets)), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+        keep = pd.Series(np.arange(n)).groupby(labels).transform("min").to_numpy()
+        return keep != np.arange(n)
+
+    def deduplicate(self, tweets: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Remove the exact and near-duplicate tweets, keeping the first occurrence.
+
+        Args:
+            tweets (pd.DataFrame): The tweets.
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: The kept tweets and the removed tweets. The number of tweets
+            removed per candidate is stored in `self.report`.
+        """
+        normalized = tweets[self.content_col].map(normalize_tweet)
+        if self.scope == "candidate":
+            groups = pd.factorize(tweets[self.candidate_col])[0]
+        else:
+            groups = np.zeros(len(tweets), dtype=np.int64)
+
+        exact = pd.DataFrame({"group": groups, "text": normalized.to_numpy()}).duplicated().to_numpy()
+
+        near = np.zeros(len(tweets), dtype=bool)
+        remaining = np.flatnonzero(~exact & (normalized != "").to_numpy())
+        if len(remaining):
+            signatures = self.signatures(normalized.to_numpy()[remaining].tolist())
+            near[remaining] = self._near_duplicates(signatures, groups[remaining])
+
+        candidate = tweets[self.candidate_col]
+        report = pd.DataFrame(
+            {
+                "tweets": candidate.value_counts(sort=False),
+                "exact_duplicates": pd.Series(exact, index=tweets.index).groupby(candidate).sum(),
+                "near_duplicates": pd.Series(near, index=tweets.index).groupby(candidate).sum(),
+            }
+        )
+        report["tweets_kept"] = report["tweets"] - report["exact_duplicates"] - report["near_duplicates"]
+        self.report = report.rename_axis(self.candidate_col).reset_index()
+
+        removed = exact | near
+        print(f"{removed.sum()} duplicated tweets removed ({exact.sum()} exact, {near.sum()} near-duplicates).")
+        return tweets[~removed], tweets[removed]
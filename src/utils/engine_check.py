@@ -0,0 +1,58 @@
+"""
+Module to compare the candidate indices computed by the reference and the fast engines of DataAnalysis.
+
+Optimized code paths must not change research results. Running both engines on the same input and comparing
+every candidate's indices shows whether a fast path can be adopted, and which candidates diverge if not.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Tuple
+
+
+# (relative, absolute) tolerance of each compared index. The dominance index is rounded to 6 decimal places,
+# so a difference in the last bits of the sums may move it by one rounding step.
+TOLERANCES: Dict[str, Tuple[float, float]] = {
+    "dominance_index": (1e-9, 1e-6),
+    "g_index": (1e-9, 1e-12),
+    "nem": (1e-9, 1e-12),
+}
+
+
+def compare_engine_results(
+    reference: pd.DataFrame, fast: pd.DataFrame, key: str = "id_candidato"
+) -> pd.DataFrame:
+    """
+    Compare the classified indices of the two engines, candidate by candidate.
+
+    Args:
+        reference (pd.DataFrame): The classified indices computed by the reference engine.
+        fast (pd.DataFrame): The classified indices computed by the fast engine.
+        key (str, optional): The column identifying the candidates. Default is 'id_candidato'.
+
+    Returns:
+        pd.DataFrame: The diverging candidates, with the values of both engines ('_reference' and '_fast'
+        suffixes) and the list of diverging columns. Empty if the engines agree.
+    """
+    merged = reference.merge(
+        fast, on=key, how="outer", suffixes=("_reference", "_fast"), indicator=True
+    )
+    diverging = pd.DataFrame(
+        {"missing": merged["_merge"] != "both"}, index=merged.index
+    )
+
+    for column, (rtol, atol) in TOLERANCES.items():
+        left = merged[f"{column}_reference"].to_numpy(dtype=float)
+        right = merged[f"{column}_fast"].to_numpy(dtype=float)
+        diverging[column] = ~np.isclose(left, right, rtol=rtol, atol=atol, equal_nan=True)
+    diverging["voting_type"] = merged["voting_type_reference"].fillna("") != merged["voting_type_fast"].fillna("")
+
+    rows = diverging.any(axis=1)
+    columns = [key] + [
+        f"{column}_{engine}" for column in list(TOLERANCES) + ["voting_type"] for engine in ("reference", "fast")
+    ]
+    result = merged.loc[rows, columns].copy()
+    result["diverging_columns"] = [
+        ",".join(diverging.columns[flags]) for flags in diverging.loc[rows].to_numpy()
+    ]
+    return result.reset_index(drop=True)
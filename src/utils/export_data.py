@@ -1,7 +1,5 @@
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from typing import List
+from typing import List, Optional
 import os
 from pathlib import Path
 
@@ -42,6 +40,10 @@ class ExportData:
             sheet_name (str, optional): The name of the sheet where the data will be saved. Default is 'Sheet1'.
             group_by (List[str], optional): Column(s) to group by. Each group will be written to a different sheet. Default is None.
         """
+        # openpyxl is only needed for Excel exports, so it is not imported with the module
+        from openpyxl import Workbook
+        from openpyxl.utils.dataframe import dataframe_to_rows
+
         wb = Workbook()
         if group_by:
             grouped_df = self.dataframe.groupby(group_by)
@@ -59,3 +61,24 @@ class ExportData:
                 wb.remove(wb['Sheet'])
 
         wb.save(file_path)
+
+    def to_sqlite(self, file_path: str, table: str, run_id: Optional[int] = None, data_source: str = "tse") -> int:
+        """
+        Export dataframe to a table of the SQLite results database (see `src.utils.results_db`).
+
+        Args:
+            file_path (str): The path of the database file.
+            table (str): 'candidate_indices', 'municipalities' or 'municipality_dominance'.
+            run_id (int, optional): The run the rows belong to. If None, a new run is recorded. Default is None.
+            data_source (str, optional): The data source of the new run. Default is 'tse'.
+
+        Returns:
+            int: The id of the run.
+        """
+        from src.utils.results_db import ResultsDatabase
+
+        database = ResultsDatabase(file_path)
+        if run_id is None:
+            return database.record_run(data_source, {table: self.dataframe})
+        database.insert(table, self.dataframe, run_id)
+        return run_id
@@ -0,0 +1,176 @@
+"""
+Module to build a single self-contained interactive HTML report with the treemaps of all candidates.
+
+Instead of one PNG per candidate, the report stores the municipality data of every candidate once, in
+compact columnar arrays with dictionary-encoded names, embeds plotly.js once, and draws each treemap in
+the browser when the candidate is selected. Candidates can be filtered by voting_type and party.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+
+def build_report_payload(
+    data: pd.DataFrame, classified_candidates: pd.DataFrame, valid_votes_col: str
+) -> Dict:
+    """
+    Encode the candidates and their municipality rows as compact columnar arrays.
+
+    Municipality, party and voting type names are stored once in dictionaries and referenced by position.
+    The municipality rows are sorted by candidate, and each candidate points to its slice of the row arrays
+    through an offsets array, so the browser can cut a candidate's rows without scanning the others.
+
+    Args:
+        data (pd.DataFrame): The dominance data (one row per candidate and municipality).
+        classified_candidates (pd.DataFrame): The classified indices of the candidates.
+        valid_votes_col (str): The column with the votes/mentions.
+
+    Returns:
+        Dict: The JSON-serializable payload.
+    """
+    candidates = classified_candidates.drop_duplicates("id_candidato").reset_index(drop=True)
+    candidate_codes = pd.Series(np.arange(len(candidates)), index=candidates["id_candidato"])
+
+    rows = data[data["id_candidato"].isin(candidate_codes.index) & (data[valid_votes_col] > 0)]
+    row_candidate = rows["id_candidato"].map(candidate_codes).to_numpy()
+    order = np.argsort(row_candidate, kind="stable")
+    row_candidate = row_candidate[order]
+    rows = rows.iloc[order]
+
+    municipality_codes, municipalities = pd.factorize(rows["nm_municipio"])
+    party_codes, parties = pd.factorize(candidates["sg_partido"].fillna(""))
+    voting_type_codes, voting_types = pd.factorize(candidates["voting_type"].fillna("Unclassified"))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(row_candidate, minlength=len(candidates)))])
+
+    return {
+        "valid_votes_col": valid_votes_col,
+        "municipalities": municipalities.tolist(),
+        "parties": parties.tolist(),
+        "voting_types": voting_types.tolist(),
+        "candidates": {
+            "name": candidates["nm_urna_candidato"].tolist(),
+            "uf": candidates["sg_ue"].fillna("").tolist(),
+            "party": party_codes.tolist(),
+            "voting_type": voting_type_codes.tolist(),
+            "dominance_index": candidates["dominance_index"].round(6).tolist(),
+            "g_index": candidates["g_index"].round(6).tolist(),
+            "nem": candidates["nem"].round(3).tolist(),
+            "offset": offsets.tolist(),
+        },
+        "rows": {
+            "municipality": municipality_codes.tolist(),
+            "value": rows[valid_votes_col].astype("int64").tolist(),
+            "dominance_index": rows["dominance_index"].round(6).tolist(),
+        },
+    }
+
+
+def render_report(payload: Dict, plotlyjs: str, title: str) -> str:
+    """
+    Fill the HTML template with the payload and the plotly.js bundle (or a <script src> tag).
+
+    Args:
+        payload (Dict): The output of `build_report_payload`.
+        plotlyjs (str): The plotly.js source, or a complete <script src=...> tag.
+        title (str): The page title.
+
+    Returns:
+        str: The HTML document.
+    """
+    if not plotlyjs.lstrip().startswith("<script"):
+        plotlyjs = f"<script>{plotlyjs}</script>"
+    # '</' is escaped so that names can never close the data <script> element
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    # plotly.js goes in last so that its source is never scanned for the other placeholders
+    return (
+        HTML_TEMPLATE.replace("__TITLE__", title)
+        .replace("__DATA__", data)
+        .replace("__PLOTLYJS__", plotlyjs)
+    )
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<style>
+  body { font-family: sans-serif; margin: 0; display: flex; height: 100vh; }
+  #sidebar { width: 320px; padding: 12px; border-right: 1px solid #ddd; display: flex; flex-direction: column; }
+  #sidebar select, #sidebar input { width: 100%; margin-bottom: 8px; }
+  #candidates { flex: 1; }
+  #main { flex: 1; display: flex; flex-direction: column; }
+  #summary { padding: 8px 12px; font-size: 14px; }
+  #treemap { flex: 1; }
+</style>
+__PLOTLYJS__
+</head>
+<body>
+<div id="sidebar">
+  <h3>__TITLE__</h3>
+  <label>voting_type <select id="voting_type"><option value="">(all)</option></select></label>
+  <label>sg_partido <select id="party"><option value="">(all)</option></select></label>
+  <input id="search" placeholder="nm_urna_candidato">
+  <select id="candidates" size="20"></select>
+</div>
+<div id="main">
+  <div id="summary"></div>
+  <div id="treemap"></div>
+</div>
+<script type="application/json" id="data">__DATA__</script>
+<script>
+(function () {
+  const D = JSON.parse(document.getElementById("data").textContent);
+  const C = D.candidates, R = D.rows;
+  const $ = (id) => document.getElementById(id);
+
+  function fill(select, names) {
+    names.forEach((name, i) => select.add(new Option(name, i)));
+  }
+  fill($("voting_type"), D.voting_types);
+  fill($("party"), D.parties);
+
+  function refreshList() {
+    const vt = $("voting_type").value, party = $("party").value;
+    const search = $("search").value.toLowerCase();
+    const list = $("candidates");
+    list.innerHTML = "";
+    C.name.forEach((name, i) => {
+      if (vt !== "" && C.voting_type[i] !== +vt) return;
+      if (party !== "" && C.party[i] !== +party) return;
+      if (search && !name.toLowerCase().includes(search)) return;
+      list.add(new Option(name + " (" + D.parties[C.party[i]] + ")", i));
+    });
+    if (list.options.length) { list.selectedIndex = 0; draw(+list.value); }
+  }
+
+  function draw(i) {
+    const start = C.offset[i], end = C.offset[i + 1];
+    const uf = C.uf[i];
+    const labels = [], parents = [], values = [], colors = [];
+    for (let r = start; r < end; r++) {
+      labels.push(D.municipalities[R.municipality[r]]);
+      parents.push(uf);
+      values.push(R.value[r]);
+      colors.push(R.dominance_index[r]);
+    }
+    const title = C.name[i] + " (" + D.parties[C.party[i]] + "/" + uf + "), classificação " + D.voting_types[C.voting_type[i]];
+    $("summary").textContent = title + " | dominance_index " + C.dominance_index[i] + " | g_index " + C.g_index[i] + " | nem " + C.nem[i];
+    Plotly.react("treemap", [{
+      type: "treemap", labels: labels, parents: parents, values: values, text: colors,
+      marker: { colors: colors, colorscale: "Reds" }, textinfo: "label+value",
+      hovertemplate: "<b>%{label}</b><br>" + D.valid_votes_col + ": %{value}<br>dominance_index: %{text:.6f}<extra></extra>"
+    }], { margin: { t: 10, l: 0, r: 0, b: 0 } }, { responsive: true });
+  }
+
+  ["voting_type", "party"].forEach((id) => $(id).addEventListener("change", refreshList));
+  $("search").addEventListener("input", refreshList);
+  $("candidates").addEventListener("change", (e) => draw(+e.target.value));
+  refreshList();
+})();
+</script>
+</body>
+</html>
+"""
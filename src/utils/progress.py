@@ -0,0 +1,205 @@
+"""
+Module to report the progress of long-running analyses as structured events.
+
+A ProgressReporter sends events to callbacks ("sinks") when a stage starts, while it processes its items and
+when it ends. Every event is a JSON-serializable dictionary:
+
+    {"event": "progress", "run_id": "...", "stage": "treemaps", "timestamp": 1700000000.0,
+     "processed": 120, "total": 160, "elapsed_seconds": 12.5, "throughput": 9.6, "eta_seconds": 4.2,
+     "status": "running"}
+
+Two sinks are included: JSONLinesSink appends the events to a file, and OpenMetricsSink keeps a text-format
+metrics file up to date for the textfile collector of a local node exporter.
+"""
+
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+class Stage:
+    """
+    Handle of a running stage, used to report the items it processed.
+    """
+
+    def __init__(self, reporter: "ProgressReporter", name: str, total: Optional[int]):
+        self.reporter = reporter
+        self.name = name
+        self.total = total
+        self.processed = 0
+        self.start = time.time()
+        self._last_emit = 0.0
+
+    def advance(self, n: int = 1) -> None:
+        """
+        Report that `n` more items were processed. Progress events are throttled to one every
+        `reporter.min_interval` seconds, plus one when the last item is processed.
+        """
+        self.processed += n
+        now = time.time()
+        finished = self.total is not None and self.processed >= self.total
+        if finished or now - self._last_emit >= self.reporter.min_interval:
+            self._last_emit = now
+            self.reporter.emit(self.event("progress", "running", now))
+
+    def event(self, event: str, status: str, now: Optional[float] = None) -> Dict:
+        now = time.time() if now is None else now
+        elapsed = now - self.start
+        throughput = self.processed / elapsed if elapsed > 0 else None
+        eta = None
+        if self.total is not None and throughput:
+            eta = max(self.total - self.processed, 0) / throughput
+        return {
+            "event": event,
+            "run_id": self.reporter.run_id,
+            "stage": self.name,
+            "timestamp": now,
+            "processed": self.processed,
+            "total": self.total,
+            "elapsed_seconds": elapsed,
+            "throughput": throughput,
+            "eta_seconds": eta,
+            "status": status,
+        }
+
+
+class ProgressReporter:
+    """
+    Class to emit stage start/end and progress events to a list of callbacks.
+    """
+
+    def __init__(
+        self,
+        sinks: Optional[List[Callable[[Dict], None]]] = None,
+        run_id: Optional[str] = None,
+        min_interval: float = 0.5,
+    ):
+        """
+        Args:
+            sinks (List[Callable], optional): Callbacks receiving each event dictionary. Default is no sink.
+            run_id (str, optional): Identifier of the run, added to every event. Defaults to a random id.
+            min_interval (float, optional): Minimum number of seconds between two progress events of a stage.
+                Default is 0.5.
+        """
+        self.sinks = list(sinks or [])
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.min_interval = min_interval
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> None:
+        """
+        Add a callback receiving each event.
+        """
+        self.sinks.append(callback)
+
+    def emit(self, event: Dict) -> None:
+        for sink in self.sinks:
+            sink(event)
+
+    def start_stage(self, name: str, total: Optional[int] = None) -> Stage:
+        """
+        Start a stage and emit its 'stage_start' event.
+
+        Args:
+            name (str): The stage name, e.g. 'concentration'.
+            total (int, optional): Number of items the stage will process, if known.
+
+        Returns:
+            Stage: The handle used to report progress.
+        """
+        stage = Stage(self, name, total)
+        self.emit(stage.event("stage_start", "running", stage.start))
+        return stage
+
+    def end_stage(self, stage: Stage, status: str = "completed") -> None:
+        """
+        Emit the 'stage_end' event of a stage.
+        """
+        self.emit(stage.event("stage_end", status))
+
+    @contextmanager
+    def stage(self, name: str, total: Optional[int] = None):
+        """
+        Context manager running a stage; the 'stage_end' event has the 'failed' status if an exception is raised.
+        """
+        stage = self.start_stage(name, total)
+        try:
+            yield stage
+        except BaseException:
+            self.end_stage(stage, "failed")
+            raise
+        self.end_stage(stage)
+
+
+class JSONLinesSink:
+    """
+    Sink appending each event to a JSON lines file.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, event: Dict) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+
+
+class OpenMetricsSink:
+    """
+    Sink keeping a metrics file in the OpenMetrics text format, with the latest state of every stage.
+
+    Point the node exporter's textfile collector (--collector.textfile.directory) to the file's directory.
+    The file is written to a temporary file and renamed, so the exporter never reads a partial file.
+    """
+
+    METRICS = {
+        "processed": ("stage_items_processed", "Items processed by the stage."),
+        "total": ("stage_items", "Items the stage has to process."),
+        "elapsed_seconds": ("stage_elapsed_seconds", "Seconds since the stage started."),
+        "throughput": ("stage_throughput_items_per_second", "Items processed per second."),
+        "eta_seconds": ("stage_eta_seconds", "Estimated seconds until the stage ends."),
+        "running": ("stage_running", "1 while the stage is running, 0 once it ended."),
+        "failed": ("stage_failed", "1 if the stage raised an exception."),
+        "timestamp": ("stage_last_event_timestamp_seconds", "Unix time of the stage's last event."),
+    }
+
+    def __init__(self, path: str, prefix: str = "electoral_geography"):
+        """
+        Args:
+            path (str): Path of the metrics file, e.g. '/var/lib/node_exporter/textfile/electoral_geography.prom'.
+            prefix (str, optional): Prefix of the metric names. Default is 'electoral_geography'.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.stages: Dict[str, Dict] = {}
+
+    def __call__(self, event: Dict) -> None:
+        state = dict(event)
+        state["running"] = int(event["status"] == "running")
+        state["failed"] = int(event["status"] == "failed")
+        self.stages[event["stage"]] = state
+        self.write()
+
+    def render(self) -> str:
+        lines = []
+        for key, (name, help_text) in self.METRICS.items():
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for stage, state in self.stages.items():
+                if state.get(key) is None:
+                    continue
+                labels = f'run_id="{state["run_id"]}",stage="{stage}"'
+                lines.append(f"{metric}{{{labels}}} {float(state[key])}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        temporary = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        temporary.write_text(self.render(), encoding="utf-8")
+        os.replace(temporary, self.path)
@@ -0,0 +1,105 @@
+"""
+Load test for the local query service (src/utils/query_service.py).
+
+Fires a mix of candidate, party/voting_type and municipality queries at a running service from several
+threads and reports throughput and p50/p99 latency.
+
+Usage:
+    python -m src.utils.query_load_test --url http://127.0.0.1:8000 --requests 5000 --concurrency 8
+"""
+
+import json
+import time
+import random
+import argparse
+import numpy as np
+from typing import List
+from urllib.parse import quote
+from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_query_mix(base_url: str, sample: int = 50) -> List[str]:
+    """
+    Build the list of query URLs to replay, based on the candidates the service currently holds.
+
+    Args:
+        base_url (str): The service base URL.
+        sample (int, optional): Number of candidates and municipalities to sample. Default is 50.
+
+    Returns:
+        List[str]: The query URLs.
+    """
+    with urlopen(f"{base_url}/candidates") as response:
+        candidates = json.loads(response.read())
+
+    ids = [row["id_candidato"] for row in candidates]
+    parties = sorted({row["sg_partido"] for row in candidates if row.get("sg_partido")})
+    voting_types = sorted({row["voting_type"] for row in candidates if row.get("voting_type")})
+
+    municipalities = set()
+    for candidate_id in random.sample(ids, min(len(ids), 5)):
+        with urlopen(f"{base_url}/candidate?id={candidate_id}") as response:
+            municipalities.update(row["nm_municipio"] for row in json.loads(response.read())["municipalities"])
+    municipalities = sorted(municipalities)
+
+    urls = []
+    urls += [f"{base_url}/candidate?id={candidate_id}" for candidate_id in random.sample(ids, min(len(ids), sample))]
+    urls += [
+        f"{base_url}/municipality?name={quote(name)}&limit=10"
+        for name in random.sample(municipalities, min(len(municipalities), sample))
+    ]
+    urls += [
+        f"{base_url}/candidates?party={quote(party)}&voting_type={quote(voting_type)}"
+        for party in parties
+        for voting_type in voting_types
+    ]
+    return urls
+
+
+def run_load_test(base_url: str, total_requests: int = 5000, concurrency: int = 8) -> dict:
+    """
+    Replay the query mix against the service and measure latencies.
+
+    Args:
+        base_url (str): The service base URL.
+        total_requests (int, optional): Number of requests to send. Default is 5000.
+        concurrency (int, optional): Number of client threads. Default is 8.
+
+    Returns:
+        dict: Throughput and latency percentiles in milliseconds.
+    """
+    urls = build_query_mix(base_url)
+    plan = [random.choice(urls) for _ in range(total_requests)]
+
+    def _timed_get(url: str) -> float:
+        start = time.perf_counter()
+        with urlopen(url) as response:
+            response.read()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.fromiter(executor.map(_timed_get, plan), dtype=float) * 1000
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "throughput_rps": round(total_requests / elapsed, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "max_ms": round(float(latencies.max()), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the local query service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    report = run_load_test(args.url.rstrip("/"), args.requests, args.concurrency)
+    for key, value in report.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,410 @@
+"""
+Lightweight local HTTP service to query the outputs of a finished analysis run.
+
+The classified indices (voting_types.csv) and the municipality-level dominance data (dominance.csv)
+are read from the run's memory-mapped result store if it has one, otherwise from the CSV files, and loaded once into in-memory indexes by candidate, municipality, party and voting_type, so that
+questions such as "top dominant candidates in Campinas" are answered without rereading the CSV files.
+The files are watched and the indexes are rebuilt whenever a new run's outputs land.
+
+Usage:
+    python -m src.utils.query_service --source tse --port 8000
+
+Endpoints (all GET, JSON output):
+    /health
+    /candidates?party=PT&voting_type=Concentrada%20Dominante&uf=SP&limit=50
+    /candidate?name=CANDIDATO&party=PT
+    /candidate?id=123
+    /municipality?name=Campinas&limit=10&sort=dominance_index
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unidecode import unidecode
+from src.utils.result_store import ResultStore
+
+
+def normalize_key(value: str) -> str:
+    """
+    Normalize a lookup key so that queries are accent and case insensitive.
+
+    Args:
+        value (str): The raw key, e.g. a municipality name.
+
+    Returns:
+        str: The normalized key.
+    """
+    return " ".join(unidecode(str(value)).lower().split())
+
+
+def _to_records(data: pd.DataFrame) -> List[Dict]:
+    """
+    Convert a DataFrame to a list of records with missing values as None, so they serialize to valid JSON.
+    """
+    return data.astype(object).where(data.notna(), None).to_dict("records")
+
+
+class QueryIndex:
+    """
+    In-memory indexes over the classified indices and the municipality-level dominance data.
+    """
+
+    def __init__(self, output_dir: str):
+        """
+        Args:
+            output_dir (str): Directory with the outputs of a run, e.g. './output/tse'.
+        """
+        self.output_dir = Path(output_dir)
+        self.voting_types_path = self.output_dir / "voting_types.csv"
+        self.dominance_path = self.output_dir / "dominance.csv"
+        self.store = ResultStore(self.output_dir / "store")
+        self._state: Optional[Dict] = None
+        self._mtimes = None
+        self._lock = threading.Lock()
+
+    def _current_mtimes(self):
+        return tuple(
+            os.path.getmtime(path) if path.is_file() else None
+            for path in (self.voting_types_path, self.dominance_path, self.store.directory / "CURRENT")
+        )
+
+    def _read_outputs(self):
+        """
+        Read the classified indices and the dominance data, from the result store if the run wrote one.
+        """
+        if self.store.current_version() is not None:
+            self.store.open()
+            return self.store.to_frame("candidates"), self.store.to_frame("dominance")
+        classified = pd.read_csv(self.voting_types_path)
+        dominance = (
+            pd.read_csv(self.dominance_path)
+            if self.dominance_path.is_file()
+            else pd.DataFrame(columns=["nm_municipio", "id_candidato", "nm_urna_candidato"])
+        )
+        return classified, dominance
+
+    def load(self) -> None:
+        """
+        Read the run outputs and build the indexes. The new indexes replace the old ones in a single
+        assignment, so concurrent queries always see a consistent snapshot.
+        """
+        mtimes = self._current_mtimes()
+        classified, dominance = self._read_outputs()
+
+        # Candidates are keyed by id_candidato: homonyms (the same ballot name in different parties or
+        # federal units) are distinct candidates, and a ballot name maps to all of their ids.
+        candidates: Dict[int, Dict] = {}
+        by_name: Dict[str, List[int]] = {}
+        by_party: Dict[str, List[int]] = {}
+        by_voting_type: Dict[str, List[int]] = {}
+        by_uf: Dict[str, List[int]] = {}
+        classified = classified.sort_values("dominance_index", ascending=False)
+        for record in _to_records(classified):
+            candidate_id = int(record["id_candidato"])
+            candidates[candidate_id] = record
+            by_name.setdefault(normalize_key(record["nm_urna_candidato"]), []).append(candidate_id)
+            by_party.setdefault(normalize_key(record.get("sg_partido")), []).append(candidate_id)
+            by_voting_type.setdefault(normalize_key(record.get("voting_type")), []).append(candidate_id)
+            by_uf.setdefault(normalize_key(record.get("sg_ue")), []).append(candidate_id)
+
+        # Municipality rows are joined with the candidate classification so that a single lookup
+        # answers "who dominates this municipality" including each candidate's voting type.
+        municipality_columns = [
+            column
+            for column in [
+                "id_candidato", "nm_urna_candidato", "sg_partido", "nm_municipio", "perc_counts", "dominance_index"
+            ]
+            + [column for column in dominance.columns if column.startswith("qt_")]
+            if column in dominance.columns
+        ]
+        dominance = (
+            dominance[municipality_columns]
+            .merge(classified[["id_candidato", "voting_type"]], on="id_candidato", how="left")
+            .sort_values("dominance_index", ascending=False)
+        )
+        by_municipality = {
+            normalize_key(municipality): _to_records(group.drop(columns="nm_municipio"))
+            for municipality, group in dominance.groupby("nm_municipio", sort=False)
+        }
+        by_candidate_municipality = {
+            int(candidate_id): _to_records(
+                group.drop(columns=["id_candidato", "nm_urna_candidato", "voting_type"])
+            )
+            for candidate_id, group in dominance.groupby("id_candidato", sort=False)
+        }
+
+        state = {
+            "candidates": candidates,
+            "by_name": by_name,
+            "by_party": by_party,
+            "by_voting_type": by_voting_type,
+            "by_uf": by_uf,
+            "by_municipality": by_municipality,
+            "by_candidate_municipality": by_candidate_municipality,
+            "loaded_at": time.time(),
+        }
+        with self._lock:
+            self._state = state
+            self._mtimes = mtimes
+        print(
+            f"Query index loaded from {self.output_dir}: {len(candidates)} candidates, "
+            f"{len(by_municipality)} municipalities."
+        )
+
+    def reload_if_changed(self) -> bool:
+        """
+        Rebuild the indexes if the run outputs changed on disk.
+
+        Returns:
+            bool: True if the indexes were rebuilt.
+        """
+        if self._current_mtimes() == self._mtimes:
+            return False
+        try:
+            self.load()
+        except Exception as e:
+            # The files may still be being written; keep serving the previous snapshot.
+            print(f"Could not reload the query index: {str(e)}")
+            return False
+        return True
+
+    def watch(self, interval: float = 2.0) -> threading.Thread:
+        """
+        Start a daemon thread that polls the run outputs and hot-reloads the indexes.
+
+        Args:
+            interval (float, optional): Polling interval in seconds. Default is 2.0.
+
+        Returns:
+            threading.Thread: The watcher thread.
+        """
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        thread = threading.Thread(target=_loop, daemon=True)
+        thread.start()
+        return thread
+
+    def health(self) -> Dict:
+        state = self._state
+        return {
+            "output_dir": str(self.output_dir),
+            "loaded_at": state["loaded_at"],
+            "candidates": len(state["candidates"]),
+            "municipalities": len(state["by_municipality"]),
+        }
+
+    def query_candidates(
+        self,
+        party: Optional[str] = None,
+        voting_type: Optional[str] = None,
+        uf: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        List candidates filtered by party, voting type and federal unit, sorted by dominance index.
+
+        Args:
+            party (str, optional): Party acronym (sg_partido).
+            voting_type (str, optional): Voting type, e.g. 'Concentrada Dominante'.
+            uf (str, optional): Federal unit (sg_ue).
+            limit (int, optional): Maximum number of candidates to return.
+
+        Returns:
+            List[Dict]: The classified indices of the matching candidates.
+        """
+        state = self._state
+        selections = [
+            set(index.get(normalize_key(value), []))
+            for index, value in (
+                (state["by_party"], party),
+                (state["by_voting_type"], voting_type),
+                (state["by_uf"], uf),
+            )
+            if value is not None
+        ]
+        records = state["candidates"].values()
+        if selections:
+            ids = set.intersection(*selections)
+            records = [record for record in records if int(record["id_candidato"]) in ids]
+        return list(records)[:limit]
+
+    def query_candidate(
+        self, name: Optional[str] = None, party: Optional[str] = None, candidate_id: Optional[int] = None
+    ) -> Optional[Dict]:
+        """
+        Return a candidate's indices together with its municipality-level dominance data.
+
+        Args:
+            name (str, optional): The candidate's ballot name (nm_urna_candidato).
+            party (str, optional): Party acronym (sg_partido), to tell apart candidates with the same ballot name.
+            candidate_id (int, optional): The candidate's id (id_candidato). Takes precedence over the name.
+
+        Returns:
+            Optional[Dict]: The candidate's data, or None if the candidate is unknown.
+
+        Raises:
+            ValueError: If the ballot name matches several candidates and no party tells them apart.
+        """
+        state = self._state
+        if candidate_id is None:
+            ids = state["by_name"].get(normalize_key(name), [])
+            if party is not None:
+                party_key = normalize_key(party)
+                ids = [i for i in ids if normalize_key(state["candidates"][i].get("sg_partido")) == party_key]
+            if len(ids) > 1:
+                matches = ", ".join(f"id {i} ({state['candidates'][i].get('sg_partido')})" for i in ids)
+                raise ValueError(
+                    f"Ballot name '{name}' matches {len(ids)} candidates: {matches}. "
+                    "Pass 'party' or 'id' to choose one."
+                )
+            candidate_id = ids[0] if ids else None
+        if candidate_id not in state["candidates"]:
+            return None
+        return {
+            **state["candidates"][candidate_id],
+            "municipalities": state["by_candidate_municipality"].get(candidate_id, []),
+        }
+
+    def query_municipality(
+        self, name: str, limit: Optional[int] = 10, sort_by: str = "dominance_index"
+    ) -> Optional[List[Dict]]:
+        """
+        Return the top candidates of a municipality.
+
+        Args:
+            name (str): The municipality name (nm_municipio).
+            limit (int, optional): Maximum number of candidates to return. Default is 10.
+            sort_by (str, optional): Column used to rank the candidates. Default is 'dominance_index'.
+
+        Returns:
+            Optional[List[Dict]]: The ranked candidates, or None if the municipality is unknown.
+
+        Raises:
+            ValueError: If `sort_by` is not a numeric column of the municipality data.
+        """
+        rows = self._state["by_municipality"].get(normalize_key(name))
+        if rows is None:
+            return None
+        if sort_by == "dominance_index":
+            # Rows are stored pre-sorted by dominance index, so the common case is a slice.
+            return rows[:limit]
+        if sort_by not in rows[0]:
+            raise ValueError(f"Unknown sort column '{sort_by}'.")
+        values = [row[sort_by] for row in rows if row[sort_by] is not None]
+        if any(isinstance(value, bool) or not isinstance(value, (int, float)) for value in values):
+            raise ValueError(f"Cannot sort by '{sort_by}': it is not a numeric column.")
+        # Missing values (NaN in the outputs) are ranked last
+        return sorted(rows, key=lambda row: (row[sort_by] is not None, row[sort_by] or 0), reverse=True)[:limit]
+
+
+class _QueryServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 makes concurrent clients wait for TCP retransmits.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def _make_handler(index: QueryIndex):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload) -> None:
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                limit = None
+                if "limit" in params:
+                    limit = int(params["limit"]) if params["limit"].isdigit() else -1
+                    if limit < 0:
+                        return self._send(
+                            400, {"error": f"Invalid limit '{params['limit']}'; expected a non-negative integer."}
+                        )
+                if url.path == "/health":
+                    return self._send(200, index.health())
+                if url.path == "/candidates":
+                    return self._send(
+                        200,
+                        index.query_candidates(
+                            params.get("party"), params.get("voting_type"), params.get("uf"), limit
+                        ),
+                    )
+                if url.path == "/candidate":
+                    candidate_id = None
+                    if "id" in params:
+                        if not params["id"].isdigit():
+                            return self._send(400, {"error": f"Invalid id '{params['id']}'; expected an integer."})
+                        candidate_id = int(params["id"])
+                    result = index.query_candidate(params.get("name", ""), params.get("party"), candidate_id)
+                    if result is None:
+                        return self._send(
+                            404, {"error": f"Unknown candidate '{params.get('id', params.get('name'))}'."}
+                        )
+                    return self._send(200, result)
+                if url.path == "/municipality":
+                    result = index.query_municipality(
+                        params.get("name", ""), 10 if limit is None else limit, params.get("sort", "dominance_index")
+                    )
+                    if result is None:
+                        return self._send(404, {"error": f"Unknown municipality '{params.get('name')}'."})
+                    return self._send(200, result)
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            except Exception as e:
+                return self._send(500, {"error": str(e)})
+            return self._send(404, {"error": f"Unknown endpoint '{url.path}'."})
+
+        def log_message(self, format, *args):
+            # Per-request logging dominates latency under load; keep the console quiet.
+            pass
+
+    return QueryHandler
+
+
+def serve(output_dir: str, host: str = "127.0.0.1", port: int = 8000, reload_interval: float = 2.0) -> None:
+    """
+    Load the run outputs and serve queries until interrupted.
+
+    Args:
+        output_dir (str): Directory with the outputs of a run, e.g. './output/tse'.
+        host (str, optional): Interface to bind. Default is '127.0.0.1'.
+        port (int, optional): Port to bind. Default is 8000.
+        reload_interval (float, optional): Seconds between checks for new outputs. Default is 2.0.
+    """
+    index = QueryIndex(output_dir)
+    index.load()
+    index.watch(reload_interval)
+    server = _QueryServer((host, port), _make_handler(index))
+    print(f"Serving queries over {output_dir} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve queries over the outputs of an analysis run.")
+    parser.add_argument("--source", default="tse", help="Data source whose outputs are served (tse or twitter).")
+    parser.add_argument("--output-dir", default=None, help="Overrides ./output/<source>.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--reload-interval", type=float, default=2.0)
+    args = parser.parse_args()
+    serve(args.output_dir or f"./output/{args.source}", args.host, args.port, args.reload_interval)
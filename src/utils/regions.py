@@ -0,0 +1,91 @@
+"""
+Module to attach a municipality -> microregion -> mesoregion hierarchy to the election data.
+
+The hierarchy is supplied by the user as a CSV file or a DataFrame with one row per municipality, e.g. built
+from the IBGE territorial division. Municipalities are matched on the TSE municipality code if the hierarchy
+has a 'cd_municipio' column, otherwise on their accent-insensitive normalized name (and UF, if both sides
+have 'sg_ue'). Any other set of nested levels (e.g. IBGE's intermediate and immediate regions) can be used by
+naming its columns, from the outermost to the innermost level.
+"""
+
+import pandas as pd
+from typing import List, Optional, Union
+from src.utils.code_table import normalize_names
+
+
+REGION_LEVELS = ["nm_mesorregiao", "nm_microrregiao"]
+
+
+def load_region_hierarchy(source: Union[str, pd.DataFrame], levels: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a region hierarchy and check that it has the level columns.
+
+    Args:
+        source (str or pd.DataFrame): Path of the CSV file, or the hierarchy itself.
+        levels (List[str], optional): The level columns, from the outermost to the innermost. Defaults to
+            REGION_LEVELS.
+
+    Returns:
+        pd.DataFrame: The hierarchy.
+
+    Raises:
+        ValueError: If the hierarchy has no municipality key or lacks a level column.
+    """
+    levels = levels or REGION_LEVELS
+    hierarchy = source.copy() if isinstance(source, pd.DataFrame) else pd.read_csv(source)
+    if "cd_municipio" not in hierarchy.columns and "nm_municipio" not in hierarchy.columns:
+        raise ValueError("The region hierarchy needs a 'cd_municipio' or an 'nm_municipio' column.")
+    missing = [level for level in levels if level not in hierarchy.columns]
+    if missing:
+        raise ValueError(f"The region hierarchy lacks the columns {', '.join(missing)}.")
+    return hierarchy
+
+
+def attach_regions(data: pd.DataFrame, hierarchy: pd.DataFrame, levels: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Add the region columns to the data.
+
+    Municipalities missing from the hierarchy are kept as regions of their own at every level, so that their
+    votes are still counted; their number is printed.
+
+    Args:
+        data (pd.DataFrame): The data, one row per candidate and municipality.
+        hierarchy (pd.DataFrame): The hierarchy, as returned by `load_region_hierarchy`.
+        levels (List[str], optional): The level columns. Defaults to REGION_LEVELS.
+
+    Returns:
+        pd.DataFrame: A copy of the data with the level columns.
+    """
+    levels = levels or REGION_LEVELS
+    hierarchy = hierarchy.copy()
+
+    if "cd_municipio" in hierarchy.columns and "cd_municipio" in data.columns:
+        keys = pd.DataFrame({"cd_municipio": pd.to_numeric(data["cd_municipio"], errors="coerce")})
+        hierarchy["cd_municipio"] = pd.to_numeric(hierarchy["cd_municipio"], errors="coerce")
+    else:
+        keys = pd.DataFrame({"nm_municipio_normalizado": normalize_names(data["nm_municipio"])})
+        hierarchy["nm_municipio_normalizado"] = normalize_names(hierarchy["nm_municipio"])
+        if "sg_ue" in hierarchy.columns and "sg_ue" in data.columns:
+            keys["sg_ue"] = data["sg_ue"].to_numpy()
+    key_cols = list(keys.columns)
+
+    # The hierarchy is joined with the distinct municipalities only, then spread to the rows
+    row_codes = keys.groupby(key_cols, sort=False, dropna=False).ngroup().to_numpy()
+    municipalities = keys.drop_duplicates().merge(
+        hierarchy.drop_duplicates(key_cols)[key_cols + levels], on=key_cols, how="left"
+    )
+    names = data["nm_municipio"].groupby(row_codes).first()
+
+    unmatched = municipalities[levels].isna().any(axis=1).to_numpy()
+    if unmatched.any():
+        print(
+            f"{unmatched.sum()} municipalities are not in the region hierarchy; each is kept as a region of its own."
+        )
+        for level in levels:
+            municipalities.loc[unmatched, level] = "municipio:" + names[unmatched].astype(str).to_numpy()
+
+    regions = {}
+    for level in levels:
+        codes, categories = pd.factorize(municipalities[level])
+        regions[level] = pd.Categorical.from_codes(codes[row_codes], categories)
+    return data.assign(**regions)
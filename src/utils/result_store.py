@@ -0,0 +1,211 @@
+"""
+Module to persist the outputs of a run as memory-mapped arrays that any process can open without copying.
+
+Each table (e.g. the municipality-level dominance data and the classified candidates) is stored column by
+column as `.npy` files. Text columns are dictionary-encoded: the array holds integer codes and the distinct
+values are kept in a small JSON file. Readers open the arrays with `np.load(mmap_mode="r")`, so the data is
+not parsed, and processes reading the same store (treemap workers, the query service, per-UF batch jobs)
+share one copy in the OS page cache instead of holding a private DataFrame each.
+
+A write goes to a new version directory, and the `CURRENT` file is then switched to it in one rename, so a
+reader never sees a half-written store. Readers of the previous version keep their open maps.
+
+Layout:
+    <directory>/CURRENT                       name of the current version
+    <directory>/<version>/<table>/table.json  columns, dtypes, row count and sort key
+    <directory>/<version>/<table>/<column>.npy
+    <directory>/<version>/<table>/dictionaries.json
+"""
+
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class ResultStore:
+    """
+    Versioned store of memory-mapped result tables.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory (str): Directory of the store, e.g. './output/tse/store'.
+        """
+        self.directory = Path(directory)
+        self.version: Optional[str] = None
+        self._tables: Dict[str, Dict] = {}
+        self._arrays: Dict[tuple, np.ndarray] = {}
+
+    def current_version(self) -> Optional[str]:
+        """
+        Return the version the `CURRENT` file points to, or None if nothing was written yet.
+        """
+        current = self.directory / "CURRENT"
+        return current.read_text().strip() if current.is_file() else None
+
+    def write(self, tables: Dict[str, pd.DataFrame], sort_by: Optional[Dict[str, str]] = None) -> str:
+        """
+        Write a new version of the store and make it the current one.
+
+        Args:
+            tables (Dict[str, pd.DataFrame]): The tables to store, by name, e.g. {'dominance': dominance_data}.
+            sort_by (Dict[str, str], optional): Column each table is sorted by, so that the rows of one key
+                (e.g. 'id_candidato') are a contiguous slice found with `rows`. Default is None.
+
+        Returns:
+            str: The new version.
+        """
+        sort_by = sort_by or {}
+        version = f"{time.time_ns():x}"
+        staging = self.directory / f".{version}.tmp"
+        for name, data in tables.items():
+            key = sort_by.get(name)
+            if key is not None:
+                data = data.sort_values(key, kind="stable")
+            self._write_table(staging / name, data, key)
+        os.replace(staging, self.directory / version)
+
+        current = self.directory / f".CURRENT.{os.getpid()}.tmp"
+        current.write_text(version)
+        previous = self.current_version()
+        os.replace(current, self.directory / "CURRENT")
+
+        # The previous version is kept for the readers that still have it open; older ones are removed
+        for path in self.directory.iterdir():
+            if path.is_dir() and not path.name.startswith(".") and path.name not in (version, previous):
+                shutil.rmtree(path, ignore_errors=True)
+        print(f"Result store written to {self.directory / version}.")
+        return version
+
+    @staticmethod
+    def _write_table(directory: Path, data: pd.DataFrame, key: Optional[str]) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        # Numbers held in object columns (e.g. the pivoted top-k shares) are stored as numbers
+        data = data.infer_objects()
+        columns = []
+        dictionaries = {}
+        for column in data.columns:
+            values = data[column]
+            if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+                array = values.to_numpy()
+            else:
+                codes, categories = pd.factorize(values)
+                array = codes.astype(np.int32)
+                dictionaries[column] = [str(category) for category in categories]
+            np.save(directory / f"{column}.npy", np.ascontiguousarray(array))
+            columns.append({"name": column, "dtype": str(array.dtype), "dictionary": column in dictionaries})
+
+        (directory / "dictionaries.json").write_text(json.dumps(dictionaries, ensure_ascii=False), encoding="utf-8")
+        metadata = {"rows": len(data), "sorted_by": key, "columns": columns}
+        (directory / "table.json").write_text(json.dumps(metadata), encoding="utf-8")
+
+    def open(self) -> "ResultStore":
+        """
+        Open the current version. Arrays are only mapped when a column is first read.
+
+        Raises:
+            FileNotFoundError: If nothing was written to the store yet.
+        """
+        version = self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"No result store in {self.directory}.")
+        tables = {}
+        for path in (self.directory / version).iterdir():
+            metadata = json.loads((path / "table.json").read_text(encoding="utf-8"))
+            metadata["dictionaries"] = json.loads((path / "dictionaries.json").read_text(encoding="utf-8"))
+            tables[path.name] = metadata
+        self._tables, self._arrays, self.version = tables, {}, version
+        return self
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reopen the store if a new version was written.
+
+        Returns:
+            bool: True if the store was reopened.
+        """
+        if self.current_version() == self.version:
+            return False
+        self.open()
+        return True
+
+    @property
+    def tables(self) -> List[str]:
+        return list(self._tables)
+
+    def columns(self, table: str) -> List[str]:
+        return [column["name"] for column in self._tables[table]["columns"]]
+
+    def column(self, table: str, name: str) -> np.ndarray:
+        """
+        Return a column as a read-only memory-mapped array. Dictionary-encoded columns are returned as codes.
+        """
+        if (table, name) not in self._arrays:
+            path = self.directory / self.version / table / f"{name}.npy"
+            self._arrays[table, name] = np.load(path, mmap_mode="r")
+        return self._arrays[table, name]
+
+    def dictionary(self, table: str, name: str) -> List[str]:
+        """
+        Return the distinct values of a dictionary-encoded column, in the order of their codes.
+        """
+        return self._tables[table]["dictionaries"][name]
+
+    def rows(self, table: str, value) -> slice:
+        """
+        Find the rows of one key of a sorted table with a binary search, e.g. the municipalities of a candidate.
+
+        Args:
+            table (str): The table, which must have been written with a `sort_by` column.
+            value: The key, e.g. an 'id_candidato'.
+
+        Returns:
+            slice: The rows of the key.
+        """
+        key = self._tables[table]["sorted_by"]
+        if key is None:
+            raise ValueError(f"Table '{table}' is not sorted; write it with a sort_by column.")
+        values = self.column(table, key)
+        return slice(int(np.searchsorted(values, value, "left")), int(np.searchsorted(values, value, "right")))
+
+    def to_frame(self, table: str, columns: Optional[List[str]] = None, rows: slice = slice(None)) -> pd.DataFrame:
+        """
+        Build a DataFrame from some columns and rows of a table, decoding the dictionary-encoded columns.
+
+        Args:
+            table (str): The table.
+            columns (List[str], optional): The columns. Defaults to all of them.
+            rows (slice, optional): The rows, e.g. the result of `rows`. Defaults to all of them.
+
+        Returns:
+            pd.DataFrame: The data, copied out of the maps.
+        """
+        encoded = {column["name"]: column["dictionary"] for column in self._tables[table]["columns"]}
+        data = {}
+        for name in columns or list(encoded):
+            values = np.asarray(self.column(table, name)[rows])
+            if encoded[name]:
+                values = pd.Categorical.from_codes(values, self.dictionary(table, name)).astype(object)
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+@lru_cache(maxsize=None)
+def shared_store(directory: str) -> ResultStore:
+    """
+    Open a store once per process, e.g. in the workers of a process pool, and reuse it for every task.
+
+    Args:
+        directory (str): Directory of the store.
+
+    Returns:
+        ResultStore: The opened store.
+    """
+    return ResultStore(directory).open()
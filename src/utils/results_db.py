@@ -0,0 +1,228 @@
+"""
+Module to keep the results of every run in an embedded SQLite database, instead of overwriting the CSV files.
+
+Each run gets a row in `runs`, with its data source, election, UF, parameters and the hash of its input. The
+candidate indices, the municipalities and the municipality-level dominance data of the run are stored in
+`candidate_indices`, `municipalities` and `municipality_dominance` with the run's id, so that runs, parameter
+settings and UFs can be compared with SQL:
+
+    SELECT r.uf, c.sg_partido, avg(c.g_index)
+    FROM candidate_indices c JOIN runs r USING (run_id)
+    WHERE r.year = 2022 AND r.data_source = 'tse'
+    GROUP BY r.uf, c.sg_partido;
+
+A run is written with one `executemany` per table inside a single transaction, so it is either fully
+recorded or not at all. The per-row cost of the inserts dominates, so `municipality_dominance` only keeps the
+counts, share and dominance of each candidate in each municipality; names and totals are in the small tables. Columns that a run has and the tables do not (e.g. the Theil components of a given
+region hierarchy) are added to the tables.
+"""
+
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    data_source TEXT NOT NULL,
+    year INTEGER,
+    uf TEXT,
+    parameters TEXT,
+    input_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_election ON runs (year, uf, data_source);
+CREATE INDEX IF NOT EXISTS idx_runs_input_hash ON runs (input_hash);
+
+CREATE TABLE IF NOT EXISTS candidate_indices (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    id_candidato INTEGER NOT NULL,
+    nm_urna_candidato TEXT,
+    sg_ue TEXT,
+    sg_partido TEXT,
+    dominance_index REAL,
+    g_index REAL,
+    nem REAL,
+    voting_type TEXT,
+    PRIMARY KEY (run_id, id_candidato)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_candidate_indices_name ON candidate_indices (nm_urna_candidato);
+CREATE INDEX IF NOT EXISTS idx_candidate_indices_party ON candidate_indices (sg_partido, voting_type);
+
+CREATE TABLE IF NOT EXISTS municipalities (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    id_municipio INTEGER NOT NULL,
+    nm_municipio TEXT,
+    total_counts_city REAL,
+    PRIMARY KEY (run_id, id_municipio)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_municipalities_name ON municipalities (nm_municipio);
+
+CREATE TABLE IF NOT EXISTS municipality_dominance (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    id_municipio INTEGER NOT NULL,
+    id_candidato INTEGER NOT NULL,
+    counts REAL,
+    perc_counts REAL,
+    dominance_index REAL,
+    PRIMARY KEY (run_id, id_municipio, id_candidato)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_municipality_dominance_candidate ON municipality_dominance (run_id, id_candidato);
+"""
+
+# Columns of the pipeline's DataFrames that are renamed in the database
+COLUMN_NAMES = {
+    "municipality_dominance": {"qt_votos_nom_validos": "counts", "qt_city_mentions": "counts"},
+}
+
+# Primary keys (after the run id); rows are inserted in key order, so the B-trees are appended to
+TABLE_KEYS = {
+    "candidate_indices": ["id_candidato"],
+    "municipalities": ["id_municipio"],
+    "municipality_dominance": ["id_municipio", "id_candidato"],
+}
+
+
+def _sql_type(values: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+        return "INTEGER"
+    if pd.api.types.is_numeric_dtype(values):
+        return "REAL"
+    return "TEXT"
+
+
+class ResultsDatabase:
+    """
+    SQLite database with the history of the analysis runs.
+    """
+
+    TABLES = tuple(TABLE_KEYS)
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path of the database file, e.g. './output/results.sqlite'. It is created if needed.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        """
+        Context manager opening a connection, committing on success, rolling back on error and closing it.
+        """
+        # Runs of several UFs may be recorded at the same time; a writer waits for the others to commit
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            # The write-ahead log lets readers query the history while a run is being written
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA foreign_keys = ON")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _columns(self, connection: sqlite3.Connection, table: str) -> Dict[str, str]:
+        return {row[1]: row[2] for row in connection.execute(f"PRAGMA table_info({table})")}
+
+    def _insert(self, connection: sqlite3.Connection, table: str, data: pd.DataFrame, run_id: int) -> int:
+        """
+        Insert the rows of a DataFrame with one executemany, adding the table columns it lacks.
+        """
+        if table not in self.TABLES:
+            raise ValueError(f"Invalid table '{table}'. Valid options are {', '.join(self.TABLES)}.")
+        data = data.rename(columns=COLUMN_NAMES.get(table, {}))
+        keys = [key for key in TABLE_KEYS[table] if key in data.columns]
+        if keys:
+            data = data.sort_values(keys)
+        existing = self._columns(connection, table)
+        columns = [column for column in data.columns if column != "run_id"]
+        for column in columns:
+            if column not in existing:
+                connection.execute(f'ALTER TABLE {table} ADD COLUMN "{column}" {_sql_type(data[column])}')
+
+        # Rows are converted to Python values column by column; missing values become NULL
+        values = [
+            data[column].astype(object).where(data[column].notna(), None).tolist()
+            if not pd.api.types.is_numeric_dtype(data[column]) or data[column].isna().any()
+            else data[column].tolist()
+            for column in columns
+        ]
+        rows = zip(np.full(len(data), run_id).tolist(), *values)
+        names = ", ".join(f'"{column}"' for column in ["run_id"] + columns)
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        connection.executemany(f"INSERT INTO {table} ({names}) VALUES ({placeholders})", rows)
+        return len(data)
+
+    def record_run(
+        self,
+        data_source: str,
+        tables: Dict[str, pd.DataFrame],
+        year: Optional[int] = None,
+        uf: Optional[str] = None,
+        parameters: Optional[Dict] = None,
+        input_hash: Optional[str] = None,
+    ) -> int:
+        """
+        Record a run and its results in a single transaction.
+
+        Args:
+            data_source (str): The type of data, either 'tse' or 'twitter'.
+            tables (Dict[str, pd.DataFrame]): The results by table name ('candidate_indices', 'municipalities'
+                and/or 'municipality_dominance').
+            year (int, optional): The election year.
+            uf (str, optional): The federal unit.
+            parameters (Dict, optional): The run's parameters, stored as JSON.
+            input_hash (str, optional): The hash of the run's input.
+
+        Returns:
+            int: The id of the run.
+        """
+        start = time.perf_counter()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (created_at, data_source, year, uf, parameters, input_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), data_source, year, uf, json.dumps(parameters or {}, sort_keys=True), input_hash),
+            )
+            run_id = cursor.lastrowid
+            rows = sum(self._insert(connection, table, data, run_id) for table, data in tables.items())
+        with self.connect() as connection:
+            # Without statistics, the query planner prefers the primary keys over the candidate index; a sampled
+            # ANALYZE keeps them up to date in milliseconds, however long the history
+            connection.execute("PRAGMA analysis_limit = 1000")
+            connection.execute("ANALYZE")
+        print(f"Run {run_id} recorded in {self.path}: {rows} rows in {time.perf_counter() - start:.2f}s.")
+        return run_id
+
+    def insert(self, table: str, data: pd.DataFrame, run_id: int) -> int:
+        """
+        Add rows to a table for an existing run, in their own transaction.
+
+        Returns:
+            int: Number of rows inserted.
+        """
+        with self.connect() as connection:
+            return self._insert(connection, table, data, run_id)
+
+    def query(self, sql: str, parameters: tuple = ()) -> pd.DataFrame:
+        """
+        Run a read query and return its result.
+
+        Args:
+            sql (str): The query, e.g. 'SELECT * FROM runs WHERE uf = ?'.
+            parameters (tuple, optional): The query parameters.
+
+        Returns:
+            pd.DataFrame: The result.
+        """
+        with self.connect() as connection:
+            return pd.read_sql_query(sql, connection, params=parameters)
@@ -0,0 +1,248 @@
+"""
+Module to measure the spatial autocorrelation of the candidates' vote shares.
+
+The concentration indices ignore geography: a candidate with votes in 20 adjacent municipalities scores the
+same as one with votes in 20 scattered ones. Global Moran's I and local LISA statistics tell them apart.
+A row-standardized queen contiguity matrix is built once per UF from the municipality boundaries and all
+candidates are computed together, as columns of one matrix, with sparse matrix-matrix products.
+Pseudo p-values come from permutations that are run in batches across processes.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+from typing import Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from src.utils.choropleth import GeometryCache
+
+
+def _permutation_counts(
+    weights: sparse.csr_matrix, z: np.ndarray, n_permutations: int, seed
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run a batch of permutations and count how often the simulated statistics reach the observed ones.
+
+    The global statistic is simulated with total permutations of the municipalities. The local statistics use
+    conditional permutations: each municipality keeps its own value and gets k_i distinct random neighbours.
+
+    Args:
+        weights (sparse.csr_matrix): Row-standardized contiguity matrix (municipalities x municipalities).
+        z (np.ndarray): Centered vote shares (municipalities x candidates).
+        n_permutations (int): Number of permutations in this batch.
+        seed: Seed (or SeedSequence) of this batch's random generator.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Counts of simulated values >= observed, for the global statistic
+        (one per candidate) and for the local statistics (municipalities x candidates).
+    """
+    rng = np.random.default_rng(seed)
+    n = z.shape[0]
+    s0 = weights.sum()
+    m2 = np.square(z).sum(axis=0)
+
+    observed_global = (n / s0) * (z * (weights @ z)).sum(axis=0) / m2
+    observed_lag = weights @ z
+
+    neighbours = np.diff(weights.indptr)
+    max_neighbours = min(max(int(neighbours.max()), 1), n - 1)
+    mask = np.arange(max_neighbours)[None, :] < neighbours[:, None]
+    row_weights = np.zeros((n, max_neighbours))
+    for i in np.flatnonzero(neighbours):
+        row_weights[i, : neighbours[i]] = weights.data[weights.indptr[i] : weights.indptr[i + 1]]
+
+    global_counts = np.zeros(z.shape[1], dtype=np.int64)
+    local_counts = np.zeros(z.shape, dtype=np.int64)
+    for _ in range(n_permutations):
+        permuted = z[rng.permutation(n)]
+        simulated_global = (n / s0) * (permuted * (weights @ permuted)).sum(axis=0) / m2
+        global_counts += simulated_global >= observed_global
+
+        # Random neighbours for every municipality, drawn without replacement and excluding the municipality
+        # itself: as in PySAL, one permuted pool of the n - 1 other positions is shared by all municipalities,
+        # each taking its first k_i entries, shifted past its own position
+        pool = rng.permutation(n - 1)[:max_neighbours]
+        draws = pool[None, :] + (pool[None, :] >= np.arange(n)[:, None])
+        simulated_lag = np.einsum("nk,nkc->nc", row_weights * mask, z[draws])
+        # The local statistic is z_i * lag_i / m2; comparing lags times z_i keeps the sign right
+        local_counts += (z * simulated_lag) >= (z * observed_lag)
+
+    return global_counts, local_counts
+
+
+def _pseudo_p_values(counts: np.ndarray, n_permutations: int) -> np.ndarray:
+    """
+    Turn "simulated >= observed" counts into folded pseudo p-values, as in PySAL.
+    """
+    larger = np.minimum(counts, n_permutations - counts)
+    return (larger + 1) / (n_permutations + 1)
+
+
+class SpatialAutocorrelation:
+    """
+    Class to calculate global Moran's I and local LISA clusters of the candidates' vote shares.
+    """
+
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        geometry_cache: GeometryCache,
+        data_code_col: str = "cd_municipio",
+        value_col: str = "perc_counts",
+        snap_tolerance: Optional[float] = None,
+    ):
+        """
+        Args:
+            data (pd.DataFrame): The dominance data (one row per candidate and municipality).
+            geometry_cache (GeometryCache): Source of the municipality boundaries.
+            data_code_col (str, optional): Column of `data` with the municipality code. Default is 'cd_municipio'.
+            value_col (str, optional): Column analysed. Default is 'perc_counts', the candidate's vote share.
+            snap_tolerance (float, optional): Distance under which two boundaries count as touching, to make up
+                for the gaps left by simplification. Defaults to the cache's simplification tolerance.
+        """
+        self.data = data
+        self.geometry_cache = geometry_cache
+        self.data_code_col = data_code_col
+        self.value_col = value_col
+        self.snap_tolerance = (
+            geometry_cache.simplify_tolerance if snap_tolerance is None else snap_tolerance
+        )
+        self.codes: Optional[np.ndarray] = None
+        self.weights: Optional[sparse.csr_matrix] = None
+
+    def build_weights(self) -> sparse.csr_matrix:
+        """
+        Build the row-standardized queen contiguity matrix of the UF's municipalities.
+
+        Only municipalities present in the data are kept. Municipalities without neighbours keep an empty row.
+
+        Returns:
+            sparse.csr_matrix: The contiguity matrix, in the order of `self.codes`.
+        """
+        uf = str(self.data["sg_ue"].dropna().iloc[0])
+        geometries = self.geometry_cache.load(uf)
+        data_codes = set(self.data[self.data_code_col].astype(str))
+        geometries = geometries[geometries["code"].isin(data_codes)].reset_index(drop=True)
+
+        tree = shapely.STRtree(geometries.geometry.to_numpy())
+        left, right = tree.query(
+            shapely.buffer(geometries.geometry.to_numpy(), self.snap_tolerance), predicate="intersects"
+        )
+        keep = left != right
+        n = len(geometries)
+        contiguity = sparse.csr_matrix(
+            (np.ones(keep.sum()), (left[keep], right[keep])), shape=(n, n)
+        )
+        contiguity.data[:] = 1.0  # duplicated pairs are summed by the constructor
+
+        row_sums = np.asarray(contiguity.sum(axis=1)).ravel()
+        scale = np.divide(1.0, row_sums, out=np.zeros(n), where=row_sums > 0)
+        self.weights = sparse.diags(scale) @ contiguity
+        self.weights = self.weights.tocsr()
+        self.codes = geometries["code"].to_numpy()
+        return self.weights
+
+    def _value_matrix(self, candidates) -> pd.DataFrame:
+        """
+        Pivot the analysed column to a municipalities x candidates matrix aligned with the weights.
+        A candidate without a row in a municipality has a share of 0 there.
+        """
+        data = self.data[self.data["id_candidato"].isin(candidates)]
+        values = data.pivot_table(
+            index=data[self.data_code_col].astype(str),
+            columns="id_candidato",
+            values=self.value_col,
+            aggfunc="sum",
+        )
+        return values.reindex(index=self.codes, columns=candidates).fillna(0.0)
+
+    def calculate(
+        self,
+        candidates=None,
+        permutations: int = 999,
+        alpha: float = 0.05,
+        workers: Optional[int] = None,
+        seed: int = 12345,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Calculate global Moran's I and the LISA clusters of every candidate.
+
+        Args:
+            candidates (list, optional): Ids of the candidates to analyse. Defaults to all candidates in the data.
+            permutations (int, optional): Number of permutations for the pseudo p-values. Default is 999.
+            alpha (float, optional): Significance level of the LISA clusters. Default is 0.05.
+            workers (int, optional): Number of processes running permutation batches. Defaults to the CPU count.
+            seed (int, optional): Seed of the permutations. Default is 12345.
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: The global statistics (one row per candidate) and the local
+            statistics (one row per candidate and municipality) with their cluster labels.
+        """
+        if self.weights is None:
+            self.build_weights()
+        if candidates is None:
+            candidates = self.data["id_candidato"].unique().tolist()
+
+        values = self._value_matrix(list(candidates))
+        z = values.to_numpy(dtype=float)
+        z = z - z.mean(axis=0)
+        n = z.shape[0]
+        m2 = np.square(z).sum(axis=0)
+        # A candidate with the same share everywhere has no variance and no defined statistic
+        m2 = np.where(m2 > 0, m2, np.nan)
+
+        lag = self.weights @ z
+        morans_i = (n / self.weights.sum()) * (z * lag).sum(axis=0) / m2
+        local_i = n * z * lag / m2
+
+        global_counts = np.zeros(z.shape[1], dtype=np.int64)
+        local_counts = np.zeros(z.shape, dtype=np.int64)
+        if permutations > 0:
+            workers = workers or os.cpu_count() or 1
+            batches = [len(batch) for batch in np.array_split(np.arange(permutations), workers) if len(batch)]
+            seeds = np.random.SeedSequence(seed).spawn(len(batches))
+            with ProcessPoolExecutor(max_workers=len(batches)) as executor:
+                results = executor.map(
+                    _permutation_counts,
+                    [self.weights] * len(batches),
+                    [z] * len(batches),
+                    batches,
+                    seeds,
+                )
+                for batch_global, batch_local in results:
+                    global_counts += batch_global
+                    local_counts += batch_local
+
+        names = self.data.drop_duplicates("id_candidato").set_index("id_candidato")["nm_urna_candidato"]
+        global_stats = pd.DataFrame(
+            {
+                "id_candidato": values.columns,
+                "nm_urna_candidato": values.columns.map(names),
+                "morans_i": morans_i,
+                "expected_i": -1 / (n - 1),
+                "p_value": _pseudo_p_values(global_counts, permutations) if permutations > 0 else np.nan,
+            }
+        )
+
+        p_local = _pseudo_p_values(local_counts, permutations) if permutations > 0 else np.full(z.shape, np.nan)
+        # Where z_i is 0 the local statistic is 0 whatever the neighbours, so every permutation ties with it and
+        # the folded count would look extreme; it has no pseudo p-value and is never significant
+        p_local = np.where(z == 0, np.nan, p_local)
+        quadrant = np.select(
+            [(z > 0) & (lag > 0), (z < 0) & (lag < 0), (z < 0) & (lag > 0), (z > 0) & (lag < 0)],
+            ["HH", "LL", "LH", "HL"],
+            default="ns",
+        )
+        cluster = np.where(p_local <= alpha, quadrant, "ns")
+
+        local_stats = pd.DataFrame(
+            {
+                "id_candidato": np.tile(values.columns.to_numpy(), n),
+                self.data_code_col: np.repeat(self.codes, z.shape[1]),
+                "local_i": local_i.ravel(),
+                "p_value": p_local.ravel(),
+                "cluster": cluster.ravel(),
+            }
+        )
+        return global_stats, local_stats
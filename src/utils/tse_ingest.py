@@ -0,0 +1,359 @@
+"""
+Module to aggregate TSE's raw zone-level (votacao_candidato_munzona) and section-level (votacao_secao)
+results to the (municipality, candidate) level that DataAnalysis expects.
+
+For a national election these files run to tens of millions of rows, so they are streamed in chunks,
+either from the CSV file or straight out of its zip archive, and only the running per-(municipality,
+candidate) totals are kept in memory.
+
+TSE distributes its results as zip archives with one CSV per UF (plus a national 'BRASIL' file). The members
+are read in place, decompressed and decoded from latin-1 on the fly, and their UF is taken from their name,
+so the archives never need to be extracted.
+"""
+
+import io
+import os
+import time
+import zipfile
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+
+# Raw TSE column -> column name used by DataAnalysis. Older munzona files call the vote column
+# QT_VOTOS_NOMINAIS; section files identify the candidate by NR_VOTAVEL/NM_VOTAVEL and have no party.
+# When a file has several raw columns for the same output column, the first one listed here is used.
+RAW_COLUMNS = {
+    "SG_UE": "sg_ue",
+    "CD_MUNICIPIO": "cd_municipio",
+    "NM_MUNICIPIO": "nm_municipio",
+    "NR_CANDIDATO": "nr_candidato",
+    "NR_VOTAVEL": "nr_candidato",
+    "NM_URNA_CANDIDATO": "nm_urna_candidato",
+    "NM_VOTAVEL": "nm_urna_candidato",
+    "SG_PARTIDO": "sg_partido",
+    "DS_SIT_TOT_TURNO": "ds_sit_totalizacao",
+    "QT_VOTOS_NOMINAIS_VALIDOS": "qt_votos_nom_validos",
+    "QT_VOTOS_NOMINAIS": "qt_votos_nom_validos",
+    "QT_VOTOS": "qt_votos_nom_validos",
+    "DS_CARGO": "ds_cargo",
+}
+
+OUTPUT_COLUMNS = [
+    "sg_ue",
+    "cd_municipio",
+    "nm_municipio",
+    "nr_candidato",
+    "nm_urna_candidato",
+    "sg_partido",
+    "ds_sit_totalizacao",
+    "qt_votos_nom_validos",
+]
+
+
+# File name keywords of the raw zone- and section-level results, and of the municipality-level export
+SECTION_FILE_KEYWORDS = ["votacao", "secao"]
+RAW_FILE_KEYWORDS = [["votacao", "munzona"], SECTION_FILE_KEYWORDS]
+MUNICIPALITY_FILE_KEYWORDS = ["votacao", "municipio"]
+
+# Members of the archives with the results of the whole country, which repeat those of every UF
+NATIONAL_UFS = {"BR", "BRASIL"}
+
+
+def validate_file(file_path: str, keywords: List[str]) -> bool:
+    """
+    Validate if file at given path contains the required keywords in its name.
+
+    Args:
+        file_path (str): The path to the file.
+        keywords (List[str]): The list of keywords to be found in the file name.
+
+    Returns:
+        bool: True if all keywords are found in the file name, False otherwise.
+    """
+    file_name = os.path.basename(file_path)
+    return all(keyword in file_name for keyword in keywords)
+
+
+def is_raw_file(file_path: str) -> bool:
+    """
+    Check if a file (or zip member) holds raw zone- or section-level results, by its name.
+    """
+    return any(validate_file(file_path, keywords) for keywords in RAW_FILE_KEYWORDS)
+
+
+def get_year_uf_from_filename(file_path: str) -> Tuple[str, str]:
+    """
+    Extract the year and federal unit from the file name.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        tuple: The extracted year and federal unit.
+    """
+    file_name = os.path.basename(file_path)
+    year, uf = file_name.split("_")[-2:]
+    uf = uf.split(".")[0]  # remove file extension
+    return year, uf
+
+
+def resolve_columns(header: List[str]) -> Dict[str, str]:
+    """
+    Map the raw columns of a file to the columns used by DataAnalysis, keeping a single raw column per output
+    column, in the priority order of RAW_COLUMNS (e.g. QT_VOTOS_NOMINAIS_VALIDOS over QT_VOTOS_NOMINAIS over
+    QT_VOTOS).
+
+    Args:
+        header (List[str]): The columns of the raw file.
+
+    Returns:
+        Dict[str, str]: The raw columns to read, renamed to their output column.
+    """
+    columns = {}
+    for raw, column in RAW_COLUMNS.items():
+        if raw in header and column not in columns.values():
+            columns[raw] = column
+    return columns
+
+
+def read_candidates(
+    path: str, cargo: str = "DEPUTADO FEDERAL", sep: str = ";", encoding: str = "latin-1"
+) -> pd.DataFrame:
+    """
+    Read a candidate list, e.g. TSE's consulta_cand file, to add the party and totalization status to
+    section-level results, which do not carry them.
+
+    Args:
+        path (str): Path to the CSV file, or to a zip archive with a single CSV.
+        cargo (str, optional): Office to keep (DS_CARGO), case-insensitive. Default is 'DEPUTADO FEDERAL'.
+        sep (str, optional): Field separator. Default is ';'.
+        encoding (str, optional): Encoding of the file. Default is 'latin-1', the encoding of the TSE files.
+
+    Returns:
+        pd.DataFrame: One row per candidate, keyed by 'sg_ue' and 'nr_candidato'.
+
+    Raises:
+        ValueError: If the file does not identify the candidates by UF and number.
+    """
+    data = pd.read_csv(path, sep=sep, encoding=encoding, dtype=str)
+    data = data.rename(columns=resolve_columns(data.columns.tolist()))
+    if "ds_cargo" in data.columns and cargo:
+        data = data[data["ds_cargo"].str.upper() == cargo.upper()]
+    if not {"sg_ue", "nr_candidato"} <= set(data.columns):
+        raise ValueError(f"The candidate list '{path}' has no SG_UE and NR_CANDIDATO columns.")
+    data["nr_candidato"] = data["nr_candidato"].astype("int64")
+    columns = ["sg_ue", "nr_candidato", "nm_urna_candidato", "sg_partido", "ds_sit_totalizacao"]
+    return data[[column for column in columns if column in data.columns]].drop_duplicates(["sg_ue", "nr_candidato"])
+
+
+def choose_member(archive: zipfile.ZipFile, member: Optional[str] = None) -> str:
+    """
+    Return the CSV member to read from an archive: the given one, or the only CSV of the archive.
+
+    Raises:
+        ValueError: If no member is given and the archive does not have exactly one CSV.
+    """
+    if member is not None:
+        return member
+    members = [name for name in archive.namelist() if name.lower().endswith(".csv")]
+    if len(members) != 1:
+        raise ValueError(
+            f"The archive '{archive.filename}' has {len(members)} CSV members; please choose one of them."
+        )
+    return members[0]
+
+
+def uf_members(zip_path: str, ufs: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    List the results files of a TSE archive by UF, from the member names.
+
+    Args:
+        zip_path (str): Path of the archive, e.g. 'votacao_candidato_munzona_2022.zip'.
+        ufs (List[str], optional): UFs to keep, case-insensitive, e.g. ['SP', 'RJ']. Defaults to every UF except
+            the national file, which repeats the others; name 'BRASIL' to select it.
+
+    Returns:
+        Dict[str, str]: The member of each UF, e.g. {'SP': 'votacao_candidato_munzona_2022_SP.csv'}.
+    """
+    wanted = {uf.upper() for uf in ufs} if ufs else None
+    members = {}
+    with zipfile.ZipFile(zip_path) as archive:
+        for name in archive.namelist():
+            if not name.lower().endswith(".csv"):
+                continue
+            if not (is_raw_file(name) or validate_file(name, MUNICIPALITY_FILE_KEYWORDS)):
+                continue
+            _, uf = get_year_uf_from_filename(name)
+            if (uf.upper() in wanted) if wanted is not None else (uf.upper() not in NATIONAL_UFS):
+                members[uf.upper()] = name
+    return members
+
+
+def read_member(
+    zip_path: str,
+    member: Optional[str] = None,
+    sep: str = ";",
+    encoding: str = "latin-1",
+    candidates: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Read a results file straight out of its zip archive.
+
+    Raw zone- and section-level members are aggregated to municipality level by `TSEAggregator`; other
+    members are decoded while they are decompressed and parsed as they are.
+
+    Args:
+        zip_path (str): Path of the archive.
+        member (str, optional): Member to read. Required when the archive has more than one CSV.
+        sep (str, optional): Field separator. Default is ';'.
+        encoding (str, optional): Encoding of the member. Default is 'latin-1', the encoding of the TSE files.
+        candidates (pd.DataFrame, optional): Candidate attributes, required by section-level members
+            (see `read_candidates`).
+
+    Returns:
+        pd.DataFrame: One row per municipality and candidate.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        member = choose_member(archive, member)
+        if is_raw_file(member):
+            return TSEAggregator(zip_path, member, candidates=candidates).aggregate()
+        with io.TextIOWrapper(archive.open(member), encoding=encoding) as f:
+            return pd.read_csv(f, sep=sep)
+
+
+def _normalize_situation(situation: pd.Series) -> pd.Series:
+    """
+    Map the raw totalization status ('ELEITO POR QP', 'ELEITO POR MÉDIA', 'SUPLENTE', ...) to the values of
+    the municipality export, where elected candidates are 'Eleito'.
+    """
+    upper = situation.fillna("").str.upper()
+    return upper.str.capitalize().where(~upper.str.startswith("ELEITO"), "Eleito")
+
+
+class TSEAggregator:
+    """
+    Class to stream raw TSE results and aggregate them to (municipality, candidate) vote counts.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        member: Optional[str] = None,
+        cargo: str = "DEPUTADO FEDERAL",
+        chunksize: int = 1_000_000,
+        candidates: Optional[pd.DataFrame] = None,
+    ):
+        """
+        Args:
+            source (str): Path to a raw CSV file, or to the zip archive that contains it.
+            member (str, optional): Member of the zip archive to read, e.g. 'votacao_secao_2022_SP.csv'.
+                Required when the archive has more than one CSV.
+            cargo (str, optional): Office to keep (DS_CARGO), case-insensitive. Default is 'DEPUTADO FEDERAL'.
+            chunksize (int, optional): Number of rows read at a time. Default is 1,000,000.
+            candidates (pd.DataFrame, optional): Candidate attributes ('sg_ue', 'nr_candidato', 'sg_partido',
+                'ds_sit_totalizacao', ...) to add to section-level files, which do not carry them.
+        """
+        self.source = source
+        self.member = member
+        self.cargo = cargo
+        self.chunksize = chunksize
+        self.candidates = candidates
+        self.stats: Dict[str, float] = {}
+
+    def _open(self):
+        """
+        Open the raw CSV as a binary stream, decompressing it on the fly if it is inside a zip archive.
+        """
+        if not zipfile.is_zipfile(self.source):
+            return open(self.source, "rb")
+        archive = zipfile.ZipFile(self.source)
+        self.member = choose_member(archive, self.member)
+        return archive.open(self.member)
+
+    def _read_header(self) -> List[str]:
+        with self._open() as f:
+            return pd.read_csv(f, sep=";", encoding="latin-1", nrows=0).columns.tolist()
+
+    def aggregate(self) -> pd.DataFrame:
+        """
+        Stream the raw file and aggregate the votes per municipality and candidate.
+
+        Only integer keys (municipality code and candidate number) are grouped per chunk; names and party are
+        kept once per municipality and per candidate. Memory is bounded by the number of distinct
+        (municipality, candidate) pairs, not by the number of rows.
+
+        Returns:
+            pd.DataFrame: One row per municipality and candidate, with the columns of the TSE municipality export.
+
+        Raises:
+            ValueError: If the file (e.g. a section-level file) lacks the candidates' party or totalization
+                status and no `candidates` provide them.
+        """
+        rename = resolve_columns(self._read_header())
+        usecols = list(rename)
+        provided = set(rename.values()) | (set(self.candidates.columns) if self.candidates is not None else set())
+        missing = [column for column in ("sg_partido", "ds_sit_totalizacao") if column not in provided]
+        if missing:
+            raise ValueError(
+                f"'{self.member or self.source}' has no {' or '.join(missing)} column (section-level files do not "
+                "carry them); pass the candidate list, e.g. TSE's consulta_cand file, as `candidates`."
+            )
+        dtype = {
+            column: ("int64" if rename[column].startswith(("cd_", "nr_", "qt_")) else "str") for column in usecols
+        }
+
+        totals: Optional[pd.Series] = None
+        municipalities: List[pd.DataFrame] = []
+        candidates: List[pd.DataFrame] = []
+        rows = 0
+        start = time.perf_counter()
+
+        with self._open() as f:
+            for chunk in pd.read_csv(
+                f, sep=";", encoding="latin-1", usecols=usecols, dtype=dtype, chunksize=self.chunksize
+            ):
+                rows += len(chunk)
+                chunk = chunk.rename(columns=rename)
+                if "ds_cargo" in chunk.columns and self.cargo:
+                    chunk = chunk[chunk["ds_cargo"].str.upper() == self.cargo.upper()]
+                # Section files also list party-label (2 digits), blank (95) and null (96) votes
+                chunk = chunk[chunk["nr_candidato"] >= 100]
+
+                partial = chunk.groupby(["sg_ue", "cd_municipio", "nr_candidato"])["qt_votos_nom_validos"].sum()
+                totals = partial if totals is None else totals.add(partial, fill_value=0)
+
+                municipalities.append(chunk[["cd_municipio", "nm_municipio"]].drop_duplicates("cd_municipio"))
+                candidate_columns = [
+                    column
+                    for column in ["sg_ue", "nr_candidato", "nm_urna_candidato", "sg_partido", "ds_sit_totalizacao"]
+                    if column in chunk.columns
+                ]
+                candidates.append(chunk[candidate_columns].drop_duplicates(["sg_ue", "nr_candidato"]))
+
+                elapsed = time.perf_counter() - start
+                print(f"{rows:,} rows read ({rows / elapsed:,.0f} rows/s)")
+
+        elapsed = time.perf_counter() - start
+        self.stats = {"rows": rows, "seconds": elapsed, "rows_per_second": rows / elapsed if elapsed else 0.0}
+        print(f"Aggregated {rows:,} rows in {elapsed:.1f}s ({self.stats['rows_per_second']:,.0f} rows/s).")
+
+        data = totals.astype("int64").reset_index()
+        municipality_names = pd.concat(municipalities).drop_duplicates("cd_municipio")
+        candidate_attributes = pd.concat(candidates).drop_duplicates(["sg_ue", "nr_candidato"])
+        if self.candidates is not None:
+            extra = [column for column in self.candidates.columns if column not in candidate_attributes.columns]
+            candidate_attributes = candidate_attributes.merge(
+                self.candidates[["sg_ue", "nr_candidato"] + extra].drop_duplicates(["sg_ue", "nr_candidato"]),
+                on=["sg_ue", "nr_candidato"],
+                how="left",
+            )
+        if "ds_sit_totalizacao" in candidate_attributes.columns:
+            candidate_attributes["ds_sit_totalizacao"] = _normalize_situation(
+                candidate_attributes["ds_sit_totalizacao"]
+            )
+
+        data = data.merge(municipality_names, on="cd_municipio", how="left").merge(
+            candidate_attributes, on=["sg_ue", "nr_candidato"], how="left"
+        )
+        return data.reindex(columns=OUTPUT_COLUMNS)
+
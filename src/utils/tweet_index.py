@@ -0,0 +1,197 @@
+"""
+Module to index tweets once and count city mentions by index lookups instead of rescanning the corpus.
+
+The unidecoded, lower-cased tweets are split into alphanumeric tokens. For each token the index keeps a
+sorted array of positional postings, `tweet_id << POSITION_BITS | position`. A city name or alias is
+matched as a phrase: the postings of its tokens are shifted by their offset in the phrase and intersected.
+Each tweet also records its candidate, so the mentions of a city are counted per candidate with one
+`np.bincount`. New tweets are appended to the index without touching the existing postings.
+"""
+
+import hashlib
+import pickle
+import re
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from unidecode import unidecode
+
+
+POSITION_BITS = 16
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text) -> List[str]:
+    """
+    Split a text into accent-insensitive, lower-case alphanumeric tokens.
+
+    Args:
+        text: The text, e.g. 'Obrigado, São Paulo!'.
+
+    Returns:
+        List[str]: The tokens, e.g. ['obrigado', 'sao', 'paulo'].
+    """
+    if pd.isna(text):
+        return []
+    return _TOKEN.findall(unidecode(str(text)).lower())
+
+
+class TweetIndex:
+    """
+    Persistent positional inverted index of tweets, with the candidate of each tweet.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path (str, optional): File where the index is pickled. It is loaded if it exists. If None, the index
+                only lives in memory. Default is None.
+        """
+        self.path = Path(path) if path is not None else None
+        self.postings: Dict[str, np.ndarray] = {}
+        self.candidates: List[str] = []
+        self.tweet_candidate = np.zeros(0, dtype=np.int64)
+        self.tweet_keys: Dict[str, int] = {}
+        if self.path is not None and self.path.is_file():
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            self.postings = state["postings"]
+            self.candidates = state["candidates"]
+            self.tweet_candidate = state["tweet_candidate"]
+            self.tweet_keys = state["tweet_keys"]
+
+    def __len__(self) -> int:
+        return len(self.tweet_candidate)
+
+    def save(self) -> None:
+        """
+        Pickle the index to its file, if any.
+        """
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            "postings": self.postings,
+            "candidates": self.candidates,
+            "tweet_candidate": self.tweet_candidate,
+            "tweet_keys": self.tweet_keys,
+        }
+        with open(self.path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _tweet_keys(tweets: pd.DataFrame, content_col: str, candidate_col: str) -> pd.Series:
+        """
+        Identify the tweets, so that a tweet added twice is only indexed once: by their URL if the data has a
+        'url' column, otherwise by a hash of their candidate, date and content.
+        """
+        if "url" in tweets.columns:
+            return tweets["url"].astype(str)
+        columns = [column for column in [candidate_col, "date", content_col] if column in tweets.columns]
+        text = tweets[columns].astype(str).agg("\x1f".join, axis=1)
+        return text.map(lambda value: hashlib.sha1(value.encode("utf-8")).hexdigest())
+
+    def add_tweets(
+        self, tweets: pd.DataFrame, content_col: str = "content", candidate_col: str = "nm_urna_candidato"
+    ) -> int:
+        """
+        Index new tweets. Tweets already in the index are skipped.
+
+        Args:
+            tweets (pd.DataFrame): The tweets, with their text and candidate.
+            content_col (str, optional): Column with the text of the tweets. Default is 'content'.
+            candidate_col (str, optional): Column with the candidate of the tweets. Default is 'nm_urna_candidato'.
+
+        Returns:
+            int: Number of tweets added.
+        """
+        keys = self._tweet_keys(tweets, content_col, candidate_col)
+        new = ~keys.isin(self.tweet_keys.keys()) & ~keys.duplicated()
+        tweets, keys = tweets[new], keys[new]
+
+        candidate_codes = {name: code for code, name in enumerate(self.candidates)}
+        for name in tweets[candidate_col].unique():
+            if name not in candidate_codes:
+                candidate_codes[name] = len(self.candidates)
+                self.candidates.append(name)
+
+        first_id = len(self)
+        new_postings: Dict[str, List[int]] = {}
+        for offset, text in enumerate(tweets[content_col].to_numpy()):
+            base = (first_id + offset) << POSITION_BITS
+            for position, token in enumerate(tokenize(text)[: 1 << POSITION_BITS]):
+                new_postings.setdefault(token, []).append(base | position)
+
+        # New tweets have larger ids than the indexed ones, so appending keeps every postings array sorted
+        for token, postings in new_postings.items():
+            postings = np.array(postings, dtype=np.int64)
+            if token in self.postings:
+                postings = np.concatenate([self.postings[token], postings])
+            self.postings[token] = postings
+
+        self.tweet_candidate = np.concatenate(
+            [self.tweet_candidate, tweets[candidate_col].map(candidate_codes).to_numpy(dtype=np.int64)]
+        )
+        self.tweet_keys.update(zip(keys, range(first_id, first_id + len(tweets))))
+        return len(tweets)
+
+    def lookup(self, phrase: str) -> np.ndarray:
+        """
+        Find the tweets containing a phrase, matched on whole tokens.
+
+        Args:
+            phrase (str): A city name or alias, e.g. 'São José dos Campos'.
+
+        Returns:
+            np.ndarray: The sorted ids of the matching tweets.
+        """
+        tokens = tokenize(phrase)
+        if not tokens or any(token not in self.postings for token in tokens):
+            return np.zeros(0, dtype=np.int64)
+
+        matches = self.postings[tokens[0]]
+        for offset, token in enumerate(tokens[1:], start=1):
+            matches = np.intersect1d(matches, self.postings[token] - offset, assume_unique=True)
+            if not len(matches):
+                break
+        return np.unique(matches >> POSITION_BITS)
+
+    def count_mentions(self, cities: Union[List[str], Dict[str, List[str]]]) -> pd.DataFrame:
+        """
+        Count the tweets of each candidate that mention each city.
+
+        Args:
+            cities (List[str] or Dict[str, List[str]]): The city names, or a mapping of each city name to
+                aliases (e.g. {'São Paulo': ['Sampa']}). A tweet mentioning a city under several names counts once.
+
+        Returns:
+            pd.DataFrame: The 'nm_municipio', 'nm_urna_candidato' and 'qt_city_mentions' of every city
+            mentioned at least once by a candidate's tweets.
+        """
+        if not isinstance(cities, dict):
+            cities = {city: [] for city in cities}
+
+        frames = []
+        for city, aliases in cities.items():
+            tweet_ids = np.zeros(0, dtype=np.int64)
+            for phrase in [city] + list(aliases):
+                tweet_ids = np.union1d(tweet_ids, self.lookup(phrase))
+            if not len(tweet_ids):
+                continue
+            counts = np.bincount(self.tweet_candidate[tweet_ids], minlength=len(self.candidates))
+            mentioned = np.flatnonzero(counts)
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "nm_municipio": city,
+                        "nm_urna_candidato": [self.candidates[code] for code in mentioned],
+                        "qt_city_mentions": counts[mentioned],
+                    }
+                )
+            )
+
+        if not frames:
+            return pd.DataFrame(columns=["nm_municipio", "nm_urna_candidato", "qt_city_mentions"])
+        return pd.concat(frames, ignore_index=True)
@@ -1,21 +1,139 @@
 from pathlib import Path
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
 import os
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+import squarify
+import matplotlib
+from matplotlib.colors import Normalize
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from src.utils.html_report import build_report_payload, render_report
+from src.utils.progress import ProgressReporter
+from src.utils.result_store import shared_store
+
+
+def write_squarify_treemap(
+    official_data: pd.DataFrame, valid_votes_col: str, title: str, file_path: Path
+) -> Path:
+    """
+    Lay out a treemap with squarify and draw it with matplotlib's Agg canvas, without a browser.
+    Produces the same 1000x600 (scale 2) image, labels, values and 'Reds' dominance_index colour scale.
+    """
+    # squarify expects positive sizes sorted in decreasing order
+    official_data = official_data[official_data[valid_votes_col] > 0].sort_values(
+        valid_votes_col, ascending=False
+    )
+    values = official_data[valid_votes_col].to_numpy(dtype=float)
+    dominance = official_data["dominance_index"].to_numpy(dtype=float)
+
+    width, height = 1000, 570  # plot area below the 30 px title margin
+    rects = squarify.squarify(squarify.normalize_sizes(values, width, height), 0, 0, width, height)
+
+    fig = Figure(figsize=(10, 6), dpi=200)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, height / 600])
+    norm = Normalize(vmin=dominance.min(), vmax=dominance.max())
+    colors = matplotlib.colormaps["Reds"](norm(dominance))
+    x, y, dx, dy = (np.array([rect[key] for rect in rects]) for key in ("x", "y", "dx", "dy"))
+    corners = np.stack([
+        np.column_stack([x, y]),
+        np.column_stack([x + dx, y]),
+        np.column_stack([x + dx, y + dy]),
+        np.column_stack([x, y + dy]),
+    ], axis=1)
+    ax.add_collection(PolyCollection(corners, facecolors=colors, edgecolors="white", linewidths=1))
+
+    # Labels are only drawn where they fit, with dark text on light cells and light text on dark ones
+    for rect, label, value, color in zip(
+        rects, official_data["nm_municipio"], official_data[valid_votes_col], colors
+    ):
+        if rect["dx"] < 40 or rect["dy"] < 20:
+            continue
+        luminance = 0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]
+        ax.text(
+            rect["x"] + 4,
+            rect["y"] + 4,
+            f"{label}\n{value}",
+            ha="left",
+            va="top",
+            fontsize=6,
+            color="black" if luminance > 0.5 else "white",
+            clip_on=True,
+        )
+
+    ax.set_xlim(0, width)
+    ax.set_ylim(height, 0)
+    ax.set_axis_off()
+    fig.suptitle(title, x=0.01, y=0.995, ha="left", va="top", fontsize=9)
+    # Fast zlib level: PNG compression dominates the rendering time of these flat-colour images
+    fig.savefig(str(file_path), pil_kwargs={"compress_level": 1})
+    return file_path
+
+
+def write_stored_treemap(
+    store_dir: str, id_candidato: int, valid_votes_col: str, title: str, file_path: Path
+) -> Path:
+    """
+    Draw a candidate's treemap from the memory-mapped result store. Workers only receive the store directory
+    and the candidate id, and read the candidate's rows from the maps shared by all processes.
+    """
+    store = shared_store(store_dir)
+    rows = store.rows("dominance", id_candidato)
+    official_data = store.to_frame("dominance", ["nm_municipio", valid_votes_col, "dominance_index"], rows)
+    return write_squarify_treemap(official_data, valid_votes_col, title, file_path)
 
 
 class Visualize:
+    RENDERERS = ("plotly", "matplotlib")
+
     def __init__(
-        self, data: pd.DataFrame, classified_candidates: pd.DataFrame, save_path=None
+        self,
+        data: pd.DataFrame,
+        classified_candidates: pd.DataFrame,
+        save_path=None,
+        renderer: str = "plotly",
+        progress: Optional[ProgressReporter] = None,
+        store_dir: Optional[str] = None,
+        output_dir: Optional[str] = None,
     ):
+        """
+        Args:
+            data (pd.DataFrame): The dominance data (one row per candidate and municipality).
+            classified_candidates (pd.DataFrame): The classified indices of the candidates.
+            save_path (str, optional): Base directory of the outputs. Defaults to the current directory.
+            renderer (str, optional): Treemap backend, 'plotly' (plotly + kaleido) or 'matplotlib'
+                (squarify layout drawn on matplotlib's Agg canvas, no headless browser). Default is 'plotly'.
+            progress (ProgressReporter, optional): Receives the progress events of the treemaps and the report.
+                Defaults to a reporter without sinks.
+            store_dir (str, optional): Result store holding the same dominance data (see
+                `src.utils.result_store`). If given, the treemap workers read the candidates' rows from it
+                instead of receiving a pickled copy of them. Default is None.
+            output_dir (str, optional): Directory of the outputs of the data source, e.g. './output/2022/SP/tse'.
+                Defaults to <save_path>/output/<data_source>.
+        """
+        if renderer not in self.RENDERERS:
+            raise ValueError(
+                f"Invalid renderer '{renderer}'. Valid options are {', '.join(self.RENDERERS)}."
+            )
         self.data = data
         self.classified_candidates = classified_candidates
         if save_path is None:
             save_path = os.getcwd()
         self.save_path = Path(save_path) / "output"
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.renderer = renderer
+        self.progress = progress if progress is not None else ProgressReporter()
+        self.store_dir = store_dir
+        self._candidate_groups = {}
+
+    def _source_dir(self, data_source: str) -> Path:
+        return self.output_dir if self.output_dir is not None else self.save_path / data_source
 
-    def create_file_path(self, candidate_name, uf, political_party, data_source):
-        dir_path = self.save_path / data_source / "electoral_geography"
+    def create_file_path(self, candidate_name, uf, political_party, data_source, id_candidato=None):
+        dir_path = self._source_dir(data_source) / "electoral_geography"
         dir_path.mkdir(parents=True, exist_ok=True)
 
         # Clean candidate name, uf and party for usage in file name
@@ -28,41 +146,92 @@ class Visualize:
         clean_uf = "".join(e for e in uf if e.isalnum())
         clean_party = "".join(e for e in political_party if e.isalnum())
 
-        # Create file name
-        file_name = f"{clean_candidate_name}_{clean_party}_{clean_uf}_treemap.png"
+        # Create file name; homonymous candidates are told apart by their id
+        suffix = f"_{id_candidato}" if id_candidato is not None else ""
+        file_name = f"{clean_candidate_name}_{clean_party}_{clean_uf}{suffix}_treemap.png"
 
         return dir_path / file_name
 
-    def plot_elected_official_treemap(
-        self, nm_urna_candidato: str, data_source: str = "tse"
-    ) -> None:
+    def _official_data(self, id_candidato: int, data_source: str):
+        """
+        Return the rows of a candidate and the column with its votes/mentions.
+
+        The data is grouped by candidate id once per data source, so that homonymous candidates keep their own
+        rows and rendering many candidates does not rescan the whole DataFrame for each of them.
+        """
         if data_source == "tse":
             valid_votes_col = "qt_votos_nom_validos"
-            official_data = self.data[
-                (self.data["ds_sit_totalizacao"] == "Eleito")
-                & (self.data["nm_urna_candidato"] == nm_urna_candidato)
-            ].copy()
         elif data_source == "twitter":
             valid_votes_col = "qt_city_mentions"
-            official_data = self.data[
-                (self.data["nm_urna_candidato"] == nm_urna_candidato)
-            ].copy()
         else:
             raise ValueError(
                 f"Invalid data_source '{data_source}'. Valid options are 'tse' and 'twitter'."
             )
 
+        if data_source not in self._candidate_groups:
+            data = self.data
+            if data_source == "tse":
+                data = data[data["ds_sit_totalizacao"] == "Eleito"]
+            self._candidate_groups[data_source] = dict(
+                tuple(data.groupby("id_candidato", sort=False))
+            )
+
+        official_data = self._candidate_groups[data_source].get(id_candidato)
+        if official_data is None:
+            official_data = self.data.iloc[0:0]
+        return official_data.copy(), valid_votes_col
+
+    def _treemap_job(self, id_candidato: int, data_source: str = "tse"):
+        """
+        Prepare everything needed to draw a candidate's treemap: its rows, the votes column, the title and
+        the output path. Returns None if the candidate has no votes.
+        """
+        official_data, valid_votes_col = self._official_data(id_candidato, data_source)
+        candidates = self.classified_candidates
+        candidate = candidates.loc[candidates["id_candidato"] == id_candidato].iloc[0]
+        nm_urna_candidato = candidate["nm_urna_candidato"]
+
         if official_data[valid_votes_col].sum() == 0:
             print(f"No data available for candidate {nm_urna_candidato}.")
-            return
+            return None
 
-        candidate_quadrant = self.classified_candidates.loc[
-            self.classified_candidates["nm_urna_candidato"] == nm_urna_candidato,
-            "voting_type",
-        ].iloc[0]
+        candidate_quadrant = candidate["voting_type"]
 
         official_data.loc[:, "voting_type"] = candidate_quadrant
 
+        # Get party and uf from the first non-null entry
+        sg_partido = official_data["sg_partido"].dropna().values[0]
+        sg_ue = official_data["sg_ue"].dropna().values[0]
+
+        title = f"{nm_urna_candidato} ({sg_partido}/{sg_ue}), classificação {candidate_quadrant}, {data_source}"
+
+        # Create the file path
+        homonyms = (candidates["nm_urna_candidato"] == nm_urna_candidato).sum() > 1
+        file_path = self.create_file_path(
+            nm_urna_candidato, sg_ue, sg_partido, data_source, id_candidato if homonyms else None
+        )
+
+        return official_data, valid_votes_col, title, file_path
+
+    def plot_elected_official_treemap(
+        self, id_candidato: int, data_source: str = "tse"
+    ) -> None:
+        job = self._treemap_job(id_candidato, data_source)
+        if job is None:
+            return
+
+        if self.renderer == "matplotlib":
+            write_squarify_treemap(*job)
+        else:
+            self._write_plotly_treemap(*job)
+        print(f"Treemap saved as: {job[-1]}")
+
+    def _write_plotly_treemap(
+        self, official_data: pd.DataFrame, valid_votes_col: str, title: str, file_path: Path
+    ) -> None:
+        # plotly is only imported by the renderer and the report that use it
+        import plotly.graph_objects as go
+
         fig = go.Figure(
             go.Treemap(
                 labels=official_data["nm_municipio"],
@@ -78,32 +247,98 @@ class Visualize:
             )
         )
 
-        # Get party and uf from the first non-null entry
-        sg_partido = official_data["sg_partido"].dropna().values[0]
-        sg_ue = official_data["sg_ue"].dropna().values[0]
-
         fig.update_layout(
-            title=f"{nm_urna_candidato} ({sg_partido}/{sg_ue}), classificação {candidate_quadrant}, {data_source}",
+            title=title,
             margin=dict(t=30, l=0, r=0, b=0),
             width=1000,
             height=600,
         )
 
-        # Create the file path
-        file_path = self.create_file_path(
-            nm_urna_candidato, sg_ue, sg_partido, data_source
-        )
-
         fig.write_image(str(file_path), scale=2)
-        print(f"Treemap saved as: {file_path}")
 
-    def generate_visualizations(self, data_source: str = "tse") -> None:
+    def generate_visualizations(self, data_source: str = "tse", workers: Optional[int] = None) -> None:
+        """
+        Draw the treemap of every classified candidate.
+
+        Args:
+            data_source (str, optional): The type of data, either 'tse' or 'twitter'. Default is 'tse'.
+            workers (int, optional): Number of processes drawing treemaps with the matplotlib renderer.
+                Defaults to the CPU count; 1 draws them in this process. Ignored by the plotly renderer.
+        """
         assert data_source in [
             "tse",
             "twitter",
         ], "Invalid data_source, should be 'tse' or 'twitter'."
 
-        candidates = self.classified_candidates["nm_urna_candidato"].unique()
+        candidates = self.classified_candidates["id_candidato"].unique()
+
+        with self.progress.stage("treemaps", total=len(candidates)) as stage:
+            if self.renderer != "matplotlib" or workers == 1:
+                for candidate in candidates:
+                    self.plot_elected_official_treemap(candidate, data_source)
+                    stage.advance()
+                return
+
+            # The matplotlib renderer is CPU-bound and needs no browser, so the treemaps are drawn in parallel
+            jobs = [job for job in (self._treemap_job(c, data_source) for c in candidates) if job is not None]
+            # Candidates without votes have no treemap to wait for
+            stage.advance(len(candidates) - len(jobs))
+            if self.store_dir is not None:
+                jobs = [
+                    (self.store_dir, int(official_data["id_candidato"].iloc[0]), *rest)
+                    for official_data, *rest in jobs
+                ]
+                write_treemap = write_stored_treemap
+            else:
+                write_treemap = write_squarify_treemap
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for file_path in executor.map(write_treemap, *zip(*jobs), chunksize=8):
+                    print(f"Treemap saved as: {file_path}")
+                    stage.advance()
+
+    def generate_html_report(
+        self, data_source: str = "tse", file_path=None, include_plotlyjs=True
+    ) -> Path:
+        """
+        Write a single self-contained interactive HTML report with the treemaps of all classified candidates,
+        rendered in the browser on demand and filterable by voting_type and party.
 
-        for candidate in candidates:
-            self.plot_elected_official_treemap(candidate, data_source)
+        Args:
+            data_source (str, optional): The type of data, either 'tse' or 'twitter'. Default is 'tse'.
+            file_path (str, optional): Path of the report. Defaults to electoral_geography.html in the
+                outputs of the data source.
+            include_plotlyjs (bool or str, optional): True embeds plotly.js in the file (works offline),
+                'cdn' loads it from the plotly CDN instead. Default is True.
+
+        Returns:
+            Path: The path of the report.
+        """
+        assert data_source in [
+            "tse",
+            "twitter",
+        ], "Invalid data_source, should be 'tse' or 'twitter'."
+        valid_votes_col = "qt_votos_nom_validos" if data_source == "tse" else "qt_city_mentions"
+
+        data = self.data
+        if data_source == "tse":
+            data = data[data["ds_sit_totalizacao"] == "Eleito"]
+        import plotly.offline as plotly_offline
+
+        with self.progress.stage("html_report", total=len(self.classified_candidates)) as stage:
+            payload = build_report_payload(data, self.classified_candidates, valid_votes_col)
+
+            if include_plotlyjs == "cdn":
+                plotlyjs = f'<script src="https://cdn.plot.ly/plotly-{plotly_offline.get_plotlyjs_version()}.min.js"></script>'
+            else:
+                plotlyjs = plotly_offline.get_plotlyjs()
+
+            if file_path is None:
+                file_path = self._source_dir(data_source) / "electoral_geography.html"
+            file_path = Path(file_path)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            file_path.write_text(
+                render_report(payload, plotlyjs, f"Electoral geography ({data_source})"), encoding="utf-8"
+            )
+            stage.advance(stage.total)
+        print(f"Report saved as: {file_path}")
+        return file_path
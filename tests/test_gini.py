@@ -0,0 +1,139 @@
+"""
+Tests of the vectorized Gini coefficients (IndexCalculator.calculate_gini_vectorized) against a direct
+per-candidate computation.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.calculator import IndexCalculator
+
+
+def direct_gini(votes: np.ndarray, weights: np.ndarray) -> float:
+    """
+    Gini coefficient of the votes relative to the weights, from the pairwise definition:
+    sum_ij w_i w_j |r_i - r_j| / (2 W V), with r = votes / weights. No sorting is involved, so ties do not matter.
+    """
+    ratios = votes / weights
+    pairs = np.outer(weights, weights) * np.abs(ratios[:, None] - ratios[None, :])
+    return pairs.sum() / (2 * weights.sum() * votes.sum())
+
+
+@pytest.fixture
+def data() -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    rows = []
+    for candidate in range(6):
+        for municipality in range(15):
+            # Some candidates have no row in some municipalities
+            if candidate % 2 and municipality % 4 == 0:
+                continue
+            rows.append(
+                {
+                    "id_candidato": candidate,
+                    "id_municipio": municipality,
+                    "qt_votos_nom_validos": int(rng.integers(0, 300)),
+                    "qt_aptos": 1000 + 100 * municipality,
+                }
+            )
+    data = pd.DataFrame(rows)
+    # Ties: a candidate with the same votes in most of its municipalities
+    data.loc[(data["id_candidato"] == 2) & (data["id_municipio"] < 10), "qt_votos_nom_validos"] = 50
+    return data
+
+
+def _by_candidate(gini: pd.DataFrame) -> pd.DataFrame:
+    return gini.set_index("id_candidato")
+
+
+def test_raw_gini_matches_direct_computation(data):
+    gini, _ = IndexCalculator.calculate_gini_vectorized(data)
+    gini = _by_candidate(gini)
+    for candidate, rows in data.groupby("id_candidato"):
+        votes = rows["qt_votos_nom_validos"].to_numpy(dtype=float)
+        expected = direct_gini(votes, np.ones_like(votes))
+        assert gini.loc[candidate, "gini"] == pytest.approx(expected, abs=1e-12)
+
+
+def test_weighted_gini_matches_direct_computation(data):
+    gini, _ = IndexCalculator.calculate_gini_vectorized(data, weight_col="qt_aptos")
+    gini = _by_candidate(gini)
+    for candidate, rows in data.groupby("id_candidato"):
+        votes = rows["qt_votos_nom_validos"].to_numpy(dtype=float)
+        weights = rows["qt_aptos"].to_numpy(dtype=float)
+        assert gini.loc[candidate, "gini_weighted"] == pytest.approx(direct_gini(votes, weights), abs=1e-12)
+
+
+def test_default_weights_are_municipality_totals(data):
+    gini, _ = IndexCalculator.calculate_gini_vectorized(data)
+    gini = _by_candidate(gini)
+    totals = data.groupby("id_municipio")["qt_votos_nom_validos"].sum()
+    for candidate, rows in data.groupby("id_candidato"):
+        weights = rows["id_municipio"].map(totals).to_numpy(dtype=float)
+        votes = rows["qt_votos_nom_validos"].to_numpy(dtype=float)
+        assert gini.loc[candidate, "gini_weighted"] == pytest.approx(direct_gini(votes, weights), abs=1e-12)
+
+
+def test_ties_do_not_depend_on_row_order(data):
+    gini, _ = IndexCalculator.calculate_gini_vectorized(data, weight_col="qt_aptos")
+    shuffled, _ = IndexCalculator.calculate_gini_vectorized(
+        data.sample(frac=1, random_state=0), weight_col="qt_aptos"
+    )
+    pd.testing.assert_frame_equal(
+        _by_candidate(gini).sort_index(), _by_candidate(shuffled).sort_index(), check_exact=False, atol=1e-12
+    )
+
+
+def test_equal_votes_have_zero_gini():
+    data = pd.DataFrame(
+        {"id_candidato": 0, "id_municipio": range(5), "qt_votos_nom_validos": 10, "qt_aptos": 100}
+    )
+    gini, _ = IndexCalculator.calculate_gini_vectorized(data, weight_col="qt_aptos")
+    assert gini.loc[0, "gini"] == pytest.approx(0, abs=1e-12)
+    assert gini.loc[0, "gini_weighted"] == pytest.approx(0, abs=1e-12)
+
+
+def test_zero_vote_candidate_has_no_gini(data):
+    data.loc[data["id_candidato"] == 3, "qt_votos_nom_validos"] = 0
+    gini, _ = IndexCalculator.calculate_gini_vectorized(data, weight_col="qt_aptos")
+    gini = _by_candidate(gini)
+    assert np.isnan(gini.loc[3, "gini"])
+    assert np.isnan(gini.loc[3, "gini_weighted"])
+    assert gini.drop(index=3)[["gini", "gini_weighted"]].notna().all().all()
+
+
+def test_zero_weight_municipalities_are_left_out_of_the_weighted_gini(data):
+    data.loc[data["id_municipio"].isin([1, 2]), "qt_aptos"] = 0
+    gini, lorenz = IndexCalculator.calculate_gini_vectorized(data, weight_col="qt_aptos")
+    gini = _by_candidate(gini)
+    for candidate, rows in data.groupby("id_candidato"):
+        votes = rows["qt_votos_nom_validos"].to_numpy(dtype=float)
+        weights = rows["qt_aptos"].to_numpy(dtype=float)
+        kept = weights > 0
+        assert gini.loc[candidate, "gini_weighted"] == pytest.approx(
+            direct_gini(votes[kept], weights[kept]), abs=1e-12
+        )
+        # The raw Gini still counts every municipality
+        assert gini.loc[candidate, "gini"] == pytest.approx(direct_gini(votes, np.ones_like(votes)), abs=1e-12)
+    weighted = lorenz[lorenz["curve"] == "weighted"]
+    assert not weighted["id_municipio"].isin([1, 2]).any()
+
+
+def test_lorenz_curves_are_monotone_and_end_at_one(data):
+    _, lorenz = IndexCalculator.calculate_gini_vectorized(data, weight_col="qt_aptos")
+    for _, curve in lorenz.groupby(["id_candidato", "curve"]):
+        assert np.all(np.diff(curve["municipality_share"]) >= 0)
+        assert np.all(np.diff(curve["vote_share"]) >= -1e-12)
+        assert curve["municipality_share"].iloc[-1] == pytest.approx(1)
+        assert curve["vote_share"].iloc[-1] == pytest.approx(1)
+        # Under the diagonal: municipalities are ordered from the lowest votes per unit of weight
+        assert np.all(curve["vote_share"].to_numpy() <= curve["municipality_share"].to_numpy() + 1e-12)
+
+
+def test_groups_are_independent(data):
+    both = pd.concat([data.assign(window="a"), data.assign(window="b", qt_aptos=data["qt_aptos"][::-1].to_numpy())])
+    gini, _ = IndexCalculator.calculate_gini_vectorized(both, weight_col="qt_aptos", groups=["window"])
+    alone, _ = IndexCalculator.calculate_gini_vectorized(data, weight_col="qt_aptos")
+    first = gini[gini["window"] == "a"].drop(columns="window").reset_index(drop=True)
+    pd.testing.assert_frame_equal(first, alone, check_exact=False, atol=1e-12)
@@ -0,0 +1,142 @@
+"""
+Tests of the redistricting simulator (src.main.redistricting): the district-level indices against DataAnalysis,
+and the contiguity of the random partitions.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from src.main.data_analysis import DataAnalysis
+from src.main.redistricting import VOTING_TYPES, RedistrictingSimulator, random_contiguous_partitions
+
+INDICES = ["dominance_index", "g_index", "nem"]
+
+
+@pytest.fixture
+def data() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    parties = ["PT", "PL", "PSDB"]
+    rows = []
+    for municipality in range(16):
+        for candidate in range(9):
+            # Not every candidate has votes in every municipality
+            if rng.random() < 0.2:
+                continue
+            rows.append(
+                {
+                    "aa_eleicao": 2022,
+                    "sg_ue": "SP",
+                    "cd_municipio": 100 + municipality,
+                    "nm_municipio": f"M{municipality}",
+                    "nr_candidato": 1000 + candidate,
+                    "nm_urna_candidato": f"C{candidate}",
+                    "sg_partido": parties[candidate % 3],
+                    "ds_sit_totalizacao": "Eleito" if candidate < 6 else "Não eleito",
+                    "qt_votos_nom_validos": int(rng.integers(1, 500)),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def grid_adjacency(rows: int, columns: int) -> sparse.csr_matrix:
+    """
+    Rook contiguity of a rows x columns grid of municipalities, numbered row by row.
+    """
+    index = np.arange(rows * columns).reshape(rows, columns)
+    pairs = np.vstack(
+        [
+            np.column_stack([index[:, :-1].ravel(), index[:, 1:].ravel()]),
+            np.column_stack([index[:-1, :].ravel(), index[1:, :].ravel()]),
+        ]
+    )
+    n = rows * columns
+    adjacency = sparse.csr_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    return (adjacency + adjacency.T).tocsr()
+
+
+def _compare(simulated: pd.DataFrame, expected: pd.DataFrame) -> None:
+    merged = simulated.merge(expected, on="nm_urna_candidato", suffixes=("", "_expected"))
+    assert len(merged) == len(expected) == len(simulated)
+    for name in INDICES:
+        np.testing.assert_allclose(merged[name], merged[f"{name}_expected"], rtol=1e-9, atol=1e-12)
+    assert (merged["voting_type"] == merged["voting_type_expected"]).all()
+
+
+@pytest.mark.parametrize("engine", ["fast", "reference"])
+@pytest.mark.parametrize("elected_only", [True, False])
+def test_identity_partition_reproduces_data_analysis(data, engine, elected_only):
+    expected = DataAnalysis(data, engine=engine, visualize=False).compute_indices(elected_only)
+    observed = RedistrictingSimulator(data, elected_only=elected_only).calculate_observed()
+    _compare(observed, expected[["nm_urna_candidato"] + INDICES + ["voting_type"]])
+
+
+def test_partition_matches_data_analysis_on_aggregated_districts(data):
+    simulator = RedistrictingSimulator(data)
+    labels = np.random.default_rng(3).integers(0, 5, len(simulator.municipalities))
+    simulator.simulate(assignments=labels, workers=1)
+    simulated = simulator.candidates.assign(
+        **{name: simulator.indices[name][0] for name in INDICES},
+        voting_type=np.array(VOTING_TYPES)[simulator.indices["voting_type"][0]],
+    )
+
+    # The same partition, with the votes summed per district before the analysis
+    district = dict(zip(simulator.municipalities["cd_municipio"], labels))
+    districts = data.assign(cd_municipio=data["cd_municipio"].map(district))
+    districts["nm_municipio"] = "D" + districts["cd_municipio"].astype(str)
+    keys = [column for column in data.columns if column != "qt_votos_nom_validos"]
+    districts = districts.groupby(keys, as_index=False)["qt_votos_nom_validos"].sum()
+    expected = DataAnalysis(districts, engine="fast", visualize=False).compute_indices()
+    _compare(simulated[["nm_urna_candidato"] + INDICES + ["voting_type"]], expected)
+
+
+def _assert_contiguous(adjacency: sparse.csr_matrix, labels: np.ndarray, n_districts: int) -> None:
+    for partition in labels:
+        assert set(np.unique(partition)) == set(range(n_districts))
+        for district in range(n_districts):
+            members = np.flatnonzero(partition == district)
+            n_components, _ = csgraph.connected_components(adjacency[members][:, members], directed=False)
+            assert n_components == 1
+
+
+def test_random_partitions_are_contiguous():
+    adjacency = grid_adjacency(8, 9)
+    labels = random_contiguous_partitions(adjacency, n_districts=6, n_partitions=200, seed=0)
+    assert labels.shape == (200, 72)
+    _assert_contiguous(adjacency, labels, 6)
+    # The partitions differ from each other
+    assert len({partition.tobytes() for partition in labels}) > 150
+
+
+def test_random_partitions_are_reproducible():
+    adjacency = grid_adjacency(5, 5)
+    first = random_contiguous_partitions(adjacency, 4, 20, seed=np.random.SeedSequence(9))
+    second = random_contiguous_partitions(adjacency, 4, 20, seed=np.random.SeedSequence(9))
+    np.testing.assert_array_equal(first, second)
+
+
+def test_unreachable_municipalities_join_the_smallest_district():
+    # A 6 x 6 grid plus an island that no seed can reach unless it is drawn as a seed
+    grid = grid_adjacency(6, 6)
+    adjacency = sparse.block_diag([grid, sparse.csr_matrix((1, 1))]).tocsr()
+    island = 36
+    labels = random_contiguous_partitions(adjacency, n_districts=3, n_partitions=100, seed=1)
+    for partition in labels:
+        assert set(np.unique(partition)) == {0, 1, 2}
+        sizes = np.bincount(np.delete(partition, island), minlength=3)
+        if sizes.min() == 0:
+            # The island was a seed: its district is the island alone
+            assert sizes[partition[island]] == 0
+        else:
+            assert partition[island] == np.argmin(sizes)
+        # Within the grid, every district stays contiguous
+        for district in np.unique(partition[:island]):
+            members = np.flatnonzero(partition[:island] == district)
+            assert csgraph.connected_components(grid[members][:, members], directed=False)[0] == 1
+
+
+def test_too_many_districts_are_rejected():
+    with pytest.raises(ValueError):
+        random_contiguous_partitions(grid_adjacency(2, 2), n_districts=5, n_partitions=1)
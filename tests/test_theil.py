@@ -0,0 +1,149 @@
+"""
+Tests of the Theil decomposition (IndexCalculator.calculate_theil_decomposition) and of the region hierarchy
+it is computed over (src.utils.regions.attach_regions).
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.calculator import IndexCalculator
+from src.utils.regions import REGION_LEVELS, attach_regions
+
+COMPONENTS = ["theil_between_mesorregiao", "theil_between_microrregiao", "theil_within_microrregiao"]
+
+
+@pytest.fixture
+def hierarchy() -> pd.DataFrame:
+    # 2 mesoregions, 5 microregions, 20 municipalities
+    return pd.DataFrame(
+        {
+            "cd_municipio": np.arange(100, 120),
+            "nm_municipio": [f"Município {i}" for i in range(20)],
+            "nm_microrregiao": [f"micro {i // 4}" for i in range(20)],
+            "nm_mesorregiao": [f"meso {i // 12}" for i in range(20)],
+        }
+    )
+
+
+@pytest.fixture
+def data(hierarchy) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    rows = []
+    for candidate in range(5):
+        for municipality in range(20):
+            if candidate == 4 and municipality % 3 == 0:
+                continue
+            rows.append(
+                {
+                    "id_candidato": candidate,
+                    "id_municipio": municipality,
+                    "cd_municipio": 100 + municipality,
+                    "nm_municipio": f"Município {municipality}",
+                    # Some municipalities without votes for the candidate
+                    "qt_votos_nom_validos": int(rng.integers(0, 400)) * int(rng.random() > 0.15),
+                    "qt_aptos": int(rng.integers(500, 5000)),
+                }
+            )
+    data = pd.DataFrame(rows)
+    # The electorate is a property of the municipality, whatever the candidate
+    data["qt_aptos"] = data.groupby("id_municipio")["qt_aptos"].transform("first")
+    return attach_regions(data, hierarchy)
+
+
+def direct_theil(rows: pd.DataFrame, weight_col: str) -> float:
+    """
+    T = sum(s * ln(s / p)) over the candidate's municipalities with weight, s its vote shares, p their weight shares.
+    """
+    rows = rows[rows[weight_col] > 0]
+    s = rows["qt_votos_nom_validos"].to_numpy(dtype=float)
+    p = rows[weight_col].to_numpy(dtype=float)
+    s, p = s / s.sum(), p / p.sum()
+    voted = s > 0
+    return float(np.sum(s[voted] * np.log(s[voted] / p[voted])))
+
+
+def direct_between(rows: pd.DataFrame, level: str, weight_col: str) -> float:
+    """
+    sum(S * ln(S / P)) over the regions of the outermost level.
+    """
+    regions = rows.groupby(level, observed=True)[["qt_votos_nom_validos", weight_col]].sum()
+    s = regions["qt_votos_nom_validos"] / regions["qt_votos_nom_validos"].sum()
+    p = regions[weight_col] / regions[weight_col].sum()
+    voted = s > 0
+    return float(np.sum(s[voted] * np.log(s[voted] / p[voted])))
+
+
+@pytest.mark.parametrize("weight_col", [None, "qt_aptos"])
+def test_components_add_up_to_theil(data, weight_col):
+    theil = IndexCalculator.calculate_theil_decomposition(data, REGION_LEVELS, weight_col=weight_col)
+    np.testing.assert_allclose(theil[COMPONENTS].sum(axis=1), theil["theil"], rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("weight_col", [None, "qt_aptos"])
+def test_theil_matches_direct_computation(data, weight_col):
+    if weight_col is None:
+        data = data.assign(
+            weight=data.groupby("id_municipio")["qt_votos_nom_validos"].transform("sum")
+        )
+    theil = IndexCalculator.calculate_theil_decomposition(data, REGION_LEVELS, weight_col=weight_col)
+    theil = theil.set_index("id_candidato")
+    for candidate, rows in data.groupby("id_candidato"):
+        column = weight_col or "weight"
+        assert theil.loc[candidate, "theil"] == pytest.approx(direct_theil(rows, column), abs=1e-12)
+        assert theil.loc[candidate, "theil_between_mesorregiao"] == pytest.approx(
+            direct_between(rows[rows[column] > 0], "nm_mesorregiao", column), abs=1e-12
+        )
+
+
+def test_components_are_not_negative(data):
+    theil = IndexCalculator.calculate_theil_decomposition(data, REGION_LEVELS, weight_col="qt_aptos")
+    assert (theil[COMPONENTS] >= -1e-12).all().all()
+
+
+def test_proportional_votes_have_zero_theil(data):
+    data = data.assign(qt_votos_nom_validos=data["qt_aptos"] * 3)
+    theil = IndexCalculator.calculate_theil_decomposition(data, REGION_LEVELS, weight_col="qt_aptos")
+    np.testing.assert_allclose(theil[["theil"] + COMPONENTS], 0, atol=1e-12)
+
+
+def test_zero_vote_candidate_has_no_theil(data):
+    data.loc[data["id_candidato"] == 1, "qt_votos_nom_validos"] = 0
+    theil = IndexCalculator.calculate_theil_decomposition(data, REGION_LEVELS, weight_col="qt_aptos")
+    theil = theil.set_index("id_candidato")
+    assert theil.loc[1].isna().all()
+    assert theil.drop(index=1).notna().all().all()
+
+
+def test_attach_regions_keeps_missing_municipalities_as_their_own_region(data, hierarchy, capsys):
+    data = data.drop(columns=REGION_LEVELS)
+    partial = hierarchy[~hierarchy["cd_municipio"].isin([103, 117])]
+    attached = attach_regions(data, partial)
+    assert "2 municipalities are not in the region hierarchy" in capsys.readouterr().out
+
+    missing = attached["cd_municipio"].isin([103, 117])
+    for level in REGION_LEVELS:
+        assert attached[level].notna().all()
+        assert (attached.loc[missing, level] == "municipio:" + attached.loc[missing, "nm_municipio"]).all()
+    # The other municipalities keep their regions
+    expected = hierarchy.set_index("cd_municipio")
+    kept = attached[~missing]
+    for level in REGION_LEVELS:
+        assert (kept[level].astype(str) == kept["cd_municipio"].map(expected[level])).all()
+
+    # Their votes still count, and the decomposition still adds up
+    theil = IndexCalculator.calculate_theil_decomposition(attached, REGION_LEVELS, weight_col="qt_aptos")
+    full = IndexCalculator.calculate_theil_decomposition(
+        attach_regions(data, hierarchy), REGION_LEVELS, weight_col="qt_aptos"
+    )
+    np.testing.assert_allclose(theil[COMPONENTS].sum(axis=1), theil["theil"], atol=1e-12)
+    np.testing.assert_allclose(theil["theil"], full["theil"], atol=1e-12)
+
+
+def test_attach_regions_matches_names_without_codes(data, hierarchy):
+    data = data.drop(columns=REGION_LEVELS + ["cd_municipio"])
+    data["nm_municipio"] = data["nm_municipio"].str.upper().str.replace("Í", "I")
+    attached = attach_regions(data, hierarchy.drop(columns="cd_municipio"))
+    expected = hierarchy.set_index(hierarchy["nm_municipio"].str.upper().str.replace("Í", "I"))
+    for level in REGION_LEVELS:
+        assert (attached[level].astype(str) == attached["nm_municipio"].map(expected[level])).all()